@@ -0,0 +1,94 @@
+import os
+
+import pygame
+
+
+'''CONSTANTS'''
+
+ASSET_FOLDER = os.path.dirname(os.path.abspath(__file__)) # Assets are found beside the code, wherever it is run from
+
+SOUNDS = {"death": ("Audio", "Death.wav")} # Maps a sound's name to its path inside ASSET_FOLDER, one part per folder
+
+
+'''CLASSES'''
+
+class AssetManager():
+
+    # Loads each sound and makes each filled surface once, the first time it is asked for or all at once with preload(),
+    # then hands out the same one every time, so nothing is read from disk or allocated while a match is being drawn.
+    # Without an audio device sounds are skipped rather than stopping the game
+
+    def __init__(self, audio=True):
+        self.audio = audio and initMixer()
+
+        self.sounds = {} # Maps a sound's name to its pygame.mixer.Sound, or None if it couldn't be loaded
+        self.surfaces = {} # Maps (colour, width, height) to a surface already filled in that colour
+
+    def preload(self):
+
+        # Loads every sound up front, for callers that would rather pay for the disk at startup than on first use
+
+        for name in SOUNDS:
+            self.sound(name)
+
+    def sound(self, name):
+
+        # Returns a sound, loading it the first time. None if there is no audio or the file couldn't be read
+
+        try:
+            return self.sounds[name]
+        except KeyError:
+            pass
+
+        sound = None
+        if self.audio:
+            try:
+                sound = pygame.mixer.Sound(assetPath(*SOUNDS[name]))
+            except (pygame.error, FileNotFoundError) as e:
+                print(f"Could not load sound {name}: {e}")
+
+        self.sounds[name] = sound
+        return sound
+
+    def play(self, name):
+        sound = self.sound(name)
+        if sound is not None:
+            sound.play()
+
+    def filledSurface(self, colour, width, height):
+
+        # Returns a surface of a size filled in a colour, making it the first time it is needed
+
+        key = (colour, width, height)
+
+        try:
+            return self.surfaces[key]
+        except KeyError:
+            image = pygame.Surface([width, height])
+            image.fill(colour)
+            self.surfaces[key] = image
+            return image
+
+
+'''SUBROUTINES'''
+
+def assetPath(*parts):
+
+    # Returns the full path of an asset from its folders and file name, joined the right way for the system
+
+    return os.path.join(ASSET_FOLDER, *parts)
+
+def initMixer():
+
+    # Starts pygame's audio if it isn't already, returns whether there is any
+
+    if pygame.mixer.get_init():
+        return True
+
+    try:
+        pygame.mixer.init()
+    except pygame.error as e:
+        print(f"No audio: {e}")
+        return False
+
+    return True
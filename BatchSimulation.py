@@ -0,0 +1,298 @@
+import numpy as np
+
+from GameSimulation import Arena, DIRECTIONS, VELOCITIES, FADE_TICKS, DEAD_FLAG
+
+
+'''CONSTANTS'''
+
+NO_TURN = -1 # An empty place in a turn queue, the others hold an index into DIRECTIONS
+NO_TILE = -1 # Where no trail tile was laid this tick
+
+X_VELOCITIES = np.array([velocity[0] for velocity in VELOCITIES], np.int32)
+Y_VELOCITIES = np.array([velocity[1] for velocity in VELOCITIES], np.int32)
+HORIZONTAL = np.array([velocity[1] == 0 for velocity in VELOCITIES]) # Directions a player lies lengthways along x in
+
+DIRECTION_INDICES = {direction: index for index, direction in enumerate(DIRECTIONS)}
+
+
+'''CLASSES'''
+
+class BatchSimulation():
+
+    # The rules of Simulation for many independent matches on one arena, held as NumPy arrays and advanced together by step().
+    # Player state is stored one array per field with a row per player slot and a column per match, and the boards one row per
+    # match. Players within a match still move in slot order, as a player's trail can stop the next one, but each slot moves
+    # in every match at once, so a step costs a handful of array operations per slot however many matches there are.
+    # Every match plays out exactly as a Simulation given the same inputs would
+
+    def __init__(self, matchCount, arena=None):
+        self.arena = arena if arena is not None else Arena()
+        self.matchCount = matchCount
+        self.maxPlayers = self.arena.maxPlayers
+
+        self.gridWidth = self.arena.gridWidth
+        self.gridHeight = self.arena.gridHeight
+        self.grids = np.zeros((matchCount, self.gridWidth * self.gridHeight), np.uint8) # Each match's OccupancyGrid cells, owner + 1 or 0
+        self.matchNos = np.arange(matchCount)
+
+        stats = self.arena.playerStats # Each slot's spawn point and size, the same in every match
+        self.spawnX = np.array([slot[3] for slot in stats], np.int32)
+        self.spawnY = np.array([slot[4] for slot in stats], np.int32)
+        self.spawnWidth = np.array([slot[1] for slot in stats], np.int32)
+        self.spawnHeight = np.array([slot[2] for slot in stats], np.int32)
+        self.longSide = np.maximum(self.spawnWidth, self.spawnHeight)
+        self.shortSide = np.minimum(self.spawnWidth, self.spawnHeight)
+
+        shape = (self.maxPlayers, matchCount)
+
+        self.present = np.zeros(shape, bool) # Whether the slot has a player, like Simulation.players not being None
+        self.alive = np.zeros(shape, bool)
+        self.fullyDead = np.zeros(shape, bool)
+        self.x = np.zeros(shape, np.int32)
+        self.y = np.zeros(shape, np.int32)
+        self.xVel = np.zeros(shape, np.int32)
+        self.yVel = np.zeros(shape, np.int32)
+        self.width = np.zeros(shape, np.int32) # The drawn size, which swaps round on turning, unlike the collision box which keeps the spawn size
+        self.height = np.zeros(shape, np.int32)
+        self.firstTurn = np.full(shape, NO_TURN, np.int8) # The turn queue, at most two long like SimPlayer.maxTurnRequests
+        self.secondTurn = np.full(shape, NO_TURN, np.int8)
+        self.deathCounter = np.zeros(shape, np.int32)
+        self.lastInput = np.zeros(shape, np.int32)
+
+        self.tick = 0
+
+        # What changed on the last step, in the same layout
+        self.addedTiles = np.full(shape, NO_TILE, np.int32) # Index into the match's grid of the tile each player laid
+        self.clearedPlayers = np.zeros(shape, bool)
+        self.deaths = np.zeros(shape, bool)
+
+    def step(self, inputs=None, turns=None):
+
+        # Advances every match by one tick. Inputs are a list of (playerNo, command) pairs for each match, as given to Simulation.step.
+        # Turns can be given as an array instead, holding an index into DIRECTIONS, or NO_TURN, for each player slot of each match,
+        # which is far quicker for many matches. They are requested after any inputs
+
+        self.addedTiles.fill(NO_TILE)
+        self.clearedPlayers.fill(False)
+        self.deaths.fill(False)
+
+        if inputs is not None:
+            for matchNo, matchInputs in enumerate(inputs):
+                for playerNo, command in matchInputs:
+                    self.applyCommand(matchNo, playerNo, command)
+
+        if turns is not None:
+            self.requestTurns(np.asarray(turns))
+
+        for playerNo in range(self.maxPlayers): # Remove players who have finished fading out
+            removed = np.flatnonzero(self.present[playerNo] & self.fullyDead[playerNo])
+            if removed.size:
+                self.clearTrails(removed, playerNo)
+                self.present[playerNo, removed] = False
+                self.clearedPlayers[playerNo, removed] = True
+
+        for playerNo in range(self.maxPlayers):
+            self.updateSlot(playerNo)
+
+        self.tick += 1
+
+    def updateSlot(self, playerNo):
+
+        # Moves one player slot in every match, as SimPlayer.update does for one player, a pixel at a time up to the arena's speed
+
+        present = self.present[playerNo]
+        fading = present & ~self.alive[playerNo]
+
+        self.deathCounter[playerNo] += fading
+        self.fullyDead[playerNo] |= fading & (self.deathCounter[playerNo] > FADE_TICKS)
+
+        for pixel in range(self.arena.speed):
+            self.moveSlot(playerNo)
+
+    def moveSlot(self, playerNo):
+
+        # Moves the living players of one slot a pixel along their headings in every match, as SimPlayer.move does for one player
+
+        tileSize = self.arena.tileSize
+        half = tileSize // 2
+
+        alive = self.alive[playerNo]
+        moving = self.present[playerNo] & alive
+
+        x = self.x[playerNo]
+        y = self.y[playerNo]
+        xVel = self.xVel[playerNo]
+        yVel = self.yVel[playerNo]
+
+        x += xVel * moving
+        y += yVel * moving
+
+        centerx = x + self.spawnWidth[playerNo] // 2
+        centery = y + self.spawnHeight[playerNo] // 2
+        tileX = centerx // tileSize
+        tileY = centery // tileSize
+
+        offBoard = (tileX < 0) | (tileX >= self.gridWidth) | (tileY < 0) | (tileY >= self.gridHeight)
+        cells = np.where(offBoard, 0, tileY * self.gridWidth + tileX) # Off the board counts as taken, so any cell will do for looking up
+
+        hit = (x <= 0) | (x >= self.arena.width - self.width[playerNo]) | (y <= 0) | (y >= self.arena.height - self.height[playerNo]) \
+            | offBoard | (self.grids[self.matchNos, cells] != 0)
+
+        died = moving & hit
+        alive &= ~died
+        self.deaths[playerNo] |= died
+
+        moving &= ~hit
+
+        centred = moving & (centerx % tileSize == half) & (centery % tileSize == half)
+
+        turning = np.flatnonzero(centred & (self.firstTurn[playerNo] != NO_TURN))
+        if turning.size:
+            self.turn(playerNo, turning, self.firstTurn[playerNo, turning])
+            self.firstTurn[playerNo, turning] = self.secondTurn[playerNo, turning]
+            self.secondTurn[playerNo, turning] = NO_TURN
+
+        lastTileX = (centerx - xVel) // tileSize
+        lastTileY = (centery - yVel) // tileSize
+
+        laying = np.flatnonzero(moving & ~centred & ((tileX != lastTileX) | (tileY != lastTileY)))
+        if laying.size:
+            laid = lastTileY[laying] * self.gridWidth + lastTileX[laying]
+            self.addedTiles[playerNo, laying] = laid # Reported even if someone else already had the tile, as Simulation does
+
+            empty = self.grids[laying, laid] == 0
+            self.grids[laying[empty], laid[empty]] = playerNo + 1
+
+    def turn(self, playerNo, matchNos, directions):
+
+        # Points a player slot in some matches in new directions, as SimPlayer.turn does
+
+        horizontal = HORIZONTAL[directions]
+
+        self.xVel[playerNo, matchNos] = X_VELOCITIES[directions]
+        self.yVel[playerNo, matchNos] = Y_VELOCITIES[directions]
+        self.width[playerNo, matchNos] = np.where(horizontal, self.longSide[playerNo], self.shortSide[playerNo])
+        self.height[playerNo, matchNos] = np.where(horizontal, self.shortSide[playerNo], self.longSide[playerNo])
+
+    def requestTurns(self, turns):
+
+        # Queues a turn for every player slot given one, with SimPlayer.requestTurn's rules: not along the way it is already going,
+        # and only if its queue has room. Turns is indexed [match, player slot]
+
+        turns = turns.T.astype(np.int8)
+        wanted = (turns != NO_TURN) & self.present
+
+        safeTurns = np.where(wanted, turns, 0)
+        sameAxis = np.where(HORIZONTAL[safeTurns], self.xVel != 0, self.yVel != 0)
+        wanted &= ~sameAxis
+
+        first = wanted & (self.firstTurn == NO_TURN)
+        second = wanted & ~first & (self.secondTurn == NO_TURN)
+
+        self.firstTurn[first] = turns[first]
+        self.secondTurn[second] = turns[second]
+
+    def applyCommand(self, matchNo, playerNo, command):
+
+        # Applies one command to one match, as Simulation.applyCommand does
+
+        name, _, sequence = command.rpartition(" ")
+
+        if name and sequence.isdigit():
+            command = name
+        else:
+            sequence = None
+
+        if command == "Create Player":
+            if self.present[playerNo, matchNo]: # Any old trail goes with the player being replaced
+                self.clearTrails(np.array([matchNo]), playerNo)
+                self.clearedPlayers[playerNo, matchNo] = True
+            self.spawn(matchNo, playerNo)
+
+        elif not self.present[playerNo, matchNo]: # Player died before the command arrived, just drop it
+            pass
+
+        elif command in DIRECTION_INDICES:
+            direction = DIRECTION_INDICES[command]
+            velocity = self.xVel[playerNo, matchNo] if HORIZONTAL[direction] else self.yVel[playerNo, matchNo]
+
+            if velocity == 0:
+                if self.firstTurn[playerNo, matchNo] == NO_TURN:
+                    self.firstTurn[playerNo, matchNo] = direction
+                elif self.secondTurn[playerNo, matchNo] == NO_TURN:
+                    self.secondTurn[playerNo, matchNo] = direction
+
+            if sequence is not None:
+                self.lastInput[playerNo, matchNo] = int(sequence) & 0xFFFF
+
+        elif command == "Stop":
+            if self.alive[playerNo, matchNo]:
+                self.alive[playerNo, matchNo] = False
+                self.deaths[playerNo, matchNo] = True
+
+    def spawn(self, matchNo, playerNo):
+
+        # Puts a new player in a slot of one match, standing still at its spawn point
+
+        self.present[playerNo, matchNo] = True
+        self.alive[playerNo, matchNo] = True
+        self.fullyDead[playerNo, matchNo] = False
+        self.x[playerNo, matchNo] = self.spawnX[playerNo]
+        self.y[playerNo, matchNo] = self.spawnY[playerNo]
+        self.xVel[playerNo, matchNo] = 0
+        self.yVel[playerNo, matchNo] = 0
+        self.width[playerNo, matchNo] = self.spawnWidth[playerNo]
+        self.height[playerNo, matchNo] = self.spawnHeight[playerNo]
+        self.firstTurn[playerNo, matchNo] = NO_TURN
+        self.secondTurn[playerNo, matchNo] = NO_TURN
+        self.deathCounter[playerNo, matchNo] = 0
+        self.lastInput[playerNo, matchNo] = 0
+
+    def clearTrails(self, matchNos, playerNo):
+
+        # Frees every tile a player slot owns in some matches
+
+        grids = self.grids[matchNos]
+        grids[grids == playerNo + 1] = 0
+        self.grids[matchNos] = grids
+
+    def cells(self, matchNo):
+
+        # Returns one match's grid cells, as a Simulation's grid holds them
+
+        return bytearray(self.grids[matchNo].tobytes())
+
+    def playerData(self, matchNo):
+
+        # Returns one match's player data, the same tuples as Simulation.playerData
+
+        data = []
+
+        for playerNo in np.flatnonzero(self.present[:, matchNo]):
+            xVel = int(self.xVel[playerNo, matchNo])
+            yVel = int(self.yVel[playerNo, matchNo])
+
+            heading = 0 if (xVel, yVel) == (0, 0) else VELOCITIES.index((xVel, yVel)) + 1
+            motion = heading | (0 if self.alive[playerNo, matchNo] else DEAD_FLAG)
+
+            turns = 0
+            for index, direction in enumerate((self.firstTurn[playerNo, matchNo], self.secondTurn[playerNo, matchNo])):
+                if direction != NO_TURN:
+                    turns |= (int(direction) + 1) << (4 * index)
+
+            data.append((int(playerNo), int(self.deathCounter[playerNo, matchNo]),
+                         int(self.x[playerNo, matchNo] + self.spawnWidth[playerNo] // 2), int(self.y[playerNo, matchNo] + self.spawnHeight[playerNo] // 2),
+                         int(self.width[playerNo, matchNo]), int(self.height[playerNo, matchNo]), motion, turns, int(self.lastInput[playerNo, matchNo])))
+
+        return data
+
+    def changes(self, matchNo):
+
+        # Returns one match's changes on the last step as Simulation holds them: the (playerNo, x, y) of each tile laid, the players
+        # cleared and the players who died. The players are in slot order, while Simulation lists them in the order they happened
+
+        added = [(int(playerNo), int(self.addedTiles[playerNo, matchNo]) % self.gridWidth, int(self.addedTiles[playerNo, matchNo]) // self.gridWidth)
+                 for playerNo in np.flatnonzero(self.addedTiles[:, matchNo] != NO_TILE)]
+
+        return added, [int(playerNo) for playerNo in np.flatnonzero(self.clearedPlayers[:, matchNo])], \
+            [int(playerNo) for playerNo in np.flatnonzero(self.deaths[:, matchNo])]
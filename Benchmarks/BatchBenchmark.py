@@ -0,0 +1,149 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Allows importing the game modules from the folder above
+
+from GameSimulation import Simulation, Arena, DIRECTIONS, ARENA_SIZE, TILE_SIZE, MAX_PLAYERS, SPEED, parseArenaSize
+from BatchSimulation import BatchSimulation, NO_TURN
+
+
+'''CONSTANTS'''
+
+TURN_CHANCE = 0.05 # Chance each tick of a player asking to turn
+REJOIN_CHANCE = 0.02 # Chance each tick of an empty slot being joined again, so the matches never run out of players
+
+
+'''SUBROUTINES'''
+
+def makeInputs(seed, matchCount, maxPlayers, ticks):
+
+    # Returns each tick's random turns for every match as an array indexed [tick, match, player slot], along with which
+    # slots ask to rejoin on each tick. Rejoining only takes effect on empty slots, and is given to both backends as "Create Player"
+
+    rng = np.random.default_rng(seed)
+
+    turns = np.where(rng.random((ticks, matchCount, maxPlayers)) < TURN_CHANCE,
+                     rng.integers(0, len(DIRECTIONS), (ticks, matchCount, maxPlayers)), NO_TURN).astype(np.int8)
+    rejoins = rng.random((ticks, matchCount, maxPlayers)) < REJOIN_CHANCE
+
+    return turns, rejoins
+
+def tickInputs(turns, rejoins, tick, matchNo, occupied):
+
+    # Returns one match's inputs for a tick as Simulation takes them: rejoins into empty slots first, then turns
+
+    inputs = [(int(playerNo), "Create Player") for playerNo in np.flatnonzero(rejoins[tick, matchNo]) if not occupied[playerNo]]
+    inputs += [(playerNo, DIRECTIONS[direction]) for playerNo, direction in enumerate(turns[tick, matchNo]) if direction != NO_TURN]
+
+    return inputs
+
+def runObjects(arena, matchCount, turns, rejoins, checkEvery=None, batch=None):
+
+    # Steps every match one at a time with Simulation, returns the simulations and the seconds spent stepping.
+    # With a batch, it is stepped alongside and compared every checkEvery ticks, returning the first tick they differ on
+
+    simulations = [Simulation(arena) for matchNo in range(matchCount)]
+    for simulation in simulations:
+        simulation.step([(playerNo, "Create Player") for playerNo in range(arena.maxPlayers)])
+    if batch is not None:
+        batch.step([[(playerNo, "Create Player") for playerNo in range(arena.maxPlayers)] for matchNo in range(matchCount)])
+
+    stepping = 0
+
+    for tick in range(len(turns)):
+        inputs = [tickInputs(turns, rejoins, tick, matchNo, [player is not None for player in simulation.players])
+                  for matchNo, simulation in enumerate(simulations)]
+
+        start = time.perf_counter()
+        for simulation, matchInputs in zip(simulations, inputs):
+            simulation.step(matchInputs)
+        stepping += time.perf_counter() - start
+
+        if batch is not None:
+            batch.step(inputs)
+
+            if tick % checkEvery == 0 or tick == len(turns) - 1:
+                for matchNo, simulation in enumerate(simulations):
+                    if not sameState(simulation, batch, matchNo):
+                        return simulations, stepping, tick
+
+    return simulations, stepping, None
+
+def runBatch(arena, matchCount, turns, rejoins):
+
+    # Steps every match together with BatchSimulation, turns given as arrays, returns it and the seconds spent stepping
+
+    batch = BatchSimulation(matchCount, arena)
+    batch.step([[(playerNo, "Create Player") for playerNo in range(arena.maxPlayers)] for matchNo in range(matchCount)])
+
+    stepping = 0
+
+    for tick in range(len(turns)):
+        inputLists = [[] for matchNo in range(matchCount)]
+        for matchNo, playerNo in np.argwhere(rejoins[tick] & ~batch.present.T): # Few matches have anyone rejoining on a tick
+            inputLists[matchNo].append((int(playerNo), "Create Player"))
+
+        start = time.perf_counter()
+        batch.step(inputLists, turns[tick])
+        stepping += time.perf_counter() - start
+
+    return batch, stepping
+
+def sameState(simulation, batch, matchNo):
+
+    # Returns whether a Simulation and one match of a batch hold the same players, board and last changes
+
+    added, cleared, deaths = batch.changes(matchNo)
+
+    return simulation.playerData() == batch.playerData(matchNo) and bytes(simulation.grid.cells) == bytes(batch.cells(matchNo)) \
+        and simulation.addedTiles == added and sorted(set(simulation.clearedPlayers)) == cleared and sorted(simulation.deaths) == deaths
+
+
+'''MAIN'''
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Compares stepping many matches one at a time against stepping them together with NumPy")
+    parser.add_argument("--matches", type=int, nargs="+", default=[1, 16, 64, 256], help="numbers of matches to step at once")
+    parser.add_argument("--ticks", type=int, default=600)
+    parser.add_argument("--arena", default=str(ARENA_SIZE), metavar="WIDTH[xHEIGHT]", help="size of the arena in pixels")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE)
+    parser.add_argument("--players", type=int, default=MAX_PLAYERS)
+    parser.add_argument("--speed", type=int, default=SPEED, help="pixels players move each tick")
+    parser.add_argument("--check-every", type=int, default=1, help="ticks between comparing every match of the two, in a separate run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    arena = Arena(*parseArenaSize(args.arena), args.tile_size, args.players, args.speed)
+
+    print(f"{args.ticks} ticks of {arena.maxPlayers} randomly turning players at speed {arena.speed} on {arena.gridWidth}x{arena.gridHeight} tiles")
+    print(f"{'Matches':>8} {'Objects (ticks/s)':>18} {'Batch (ticks/s)':>16} {'Speedup':>8} {'Identical':>10}")
+
+    for matchCount in args.matches:
+        turns, rejoins = makeInputs(args.seed, matchCount, arena.maxPlayers, args.ticks)
+
+        simulations, objectTime = runObjects(arena, matchCount, turns, rejoins)[:2]
+        batch, batchTime = runBatch(arena, matchCount, turns, rejoins)
+
+        # The timed runs are compared at the end, then a run stepping both together compares every match along the way
+        identical = all(sameState(simulation, batch, matchNo) for matchNo, simulation in enumerate(simulations))
+        firstDifference = runObjects(arena, matchCount, turns, rejoins, args.check_every, BatchSimulation(matchCount, arena))[2]
+
+        objectRate = matchCount * args.ticks / objectTime
+        batchRate = matchCount * args.ticks / batchTime
+
+        print(f"{matchCount:>8} {objectRate:>18.0f} {batchRate:>16.0f} {batchRate / objectRate:>7.1f}x "
+              f"{'Yes' if identical and firstDifference is None else 'No':>10}")
+
+        if not identical or firstDifference is not None:
+            print(f"Match states differ{f' from tick {firstDifference}' if firstDifference is not None else ' at the end'}")
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import argparse
+import os
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Allows importing the game modules from the folder above
+
+from GameSimulation import Simulation, Arena, VELOCITIES
+from Bots import BotController, scoreStarts, REACHABLE_WEIGHT
+
+
+'''CONSTANTS'''
+
+TICK_BUDGET = 1 / 60 # Everything a match does each tick has to fit in this
+BUDGETS = (0.0005, 0.001, 0.002, 0.004, None) # Seconds per tick the bots may search for, None being no limit
+SEARCH_RADII = (8, 16, 32)
+SEARCH_SAMPLES = 200
+
+
+'''SUBROUTINES'''
+
+def scoreStartsByTile(cells, gridWidth, window, blocked, starts, opponents):
+
+    # The same scores as scoreStarts, found by a breadth first search of one tile at a time, to compare against
+
+    x0, y0, x1, y1 = window
+    blocked = set(blocked)
+
+    def distances(sources):
+        found = {tile: 0 for tile in sources if x0 <= tile[0] < x1 and y0 <= tile[1] < y1 and tile not in blocked and not cells[tile[1] * gridWidth + tile[0]]}
+        queue = deque(found)
+
+        while queue:
+            x, y = queue.popleft()
+            for xVel, yVel in VELOCITIES:
+                tile = (x + xVel, y + yVel)
+                if tile in found or tile in blocked or not (x0 <= tile[0] < x1 and y0 <= tile[1] < y1) or cells[tile[1] * gridWidth + tile[0]]:
+                    continue
+                found[tile] = found[(x, y)] + 1
+                queue.append(tile)
+
+        return found
+
+    theirs = distances(opponents)
+    scores = []
+
+    for start in starts:
+        mine = distances([start])
+        territory = sum(1 for tile, distance in mine.items() if distance < theirs.get(tile, distance + 1))
+        scores.append(territory + REACHABLE_WEIGHT * len(mine))
+
+    return scores
+
+def playBots(arena, botCount, budget, ticks, seed=0):
+
+    # Plays a match of bots for a number of ticks, returns how long working out each tick's inputs took, how many bots died and the controller
+
+    simulation = Simulation(arena)
+    bots = BotController(simulation, botCount, budget, seed)
+
+    times = []
+    deaths = 0
+
+    for x in range(ticks):
+        start = time.perf_counter()
+        inputs = bots.inputs()
+        times.append(time.perf_counter() - start)
+
+        simulation.step(inputs)
+        deaths += len(simulation.deaths)
+
+    return times, deaths, bots
+
+def timeSearches(arena, radius, search):
+
+    # Returns the mean time one decision's search takes, on the board left by a match of bots part way through
+
+    times, deaths, bots = playBots(arena, arena.maxPlayers, None, 600)
+    simulation = bots.simulation
+    grid = simulation.grid
+
+    heads = bots.headTiles()
+    windows = []
+    for playerNo, tiles in heads.items():
+        x, y = tiles[0]
+        window = (max(2, x - radius), max(2, y - radius), min(grid.width - 2, x + radius + 1), min(grid.height - 2, y + radius + 1))
+        starts = [(x + xVel, y + yVel) for xVel, yVel in VELOCITIES]
+        opponents = [head for otherNo, otherTiles in heads.items() if otherNo != playerNo for head in otherTiles]
+        windows.append((window, [tiles[0]], starts, opponents))
+
+    start = time.perf_counter()
+    for index in range(SEARCH_SAMPLES):
+        window, blocked, starts, opponents = windows[index % len(windows)]
+        search(grid.cells, grid.width, window, blocked, starts, opponents)
+
+    return (time.perf_counter() - start) / SEARCH_SAMPLES
+
+def percentile(times, fraction):
+    return times[min(len(times) - 1, int(len(times) * fraction))]
+
+
+'''MAIN'''
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Times the bots' searches, and how long dozens of bots take each tick under different budgets")
+    parser.add_argument("--bots", type=int, default=48)
+    parser.add_argument("--arena", type=int, default=8000, help="width and height of the arena in pixels")
+    parser.add_argument("--ticks", type=int, default=1200)
+    args = parser.parse_args()
+
+    print(f"One decision's search of {SEARCH_SAMPLES} samples, 4 starts against every other player")
+    print(f"{'Radius':>7} {'Bits (ms)':>10} {'By tile (ms)':>13} {'Speedup':>8}")
+
+    searchArena = Arena(800, maxPlayers=16)
+    for radius in SEARCH_RADII:
+        bits = timeSearches(searchArena, radius, scoreStarts)
+        byTile = timeSearches(searchArena, radius, scoreStartsByTile)
+        print(f"{radius:>7} {bits * 1000:>10.3f} {byTile * 1000:>13.3f} {byTile / bits:>7.1f}x")
+
+    arena = Arena(args.arena, maxPlayers=args.bots)
+
+    print()
+    print(f"{args.bots} bots on {arena.gridWidth}x{arena.gridHeight} tiles for {args.ticks} ticks")
+    print(f"{'Budget':>7} {'p50 (ms)':>9} {'p99 (ms)':>9} {'Max (ms)':>9} {'Of tick':>8} {'Searches':>9} {'Reflexes':>9} {'Deaths':>7}")
+
+    for budget in BUDGETS:
+        times, deaths, bots = playBots(arena, args.bots, budget, args.ticks)
+        times.sort()
+
+        label = "None" if budget is None else f"{budget * 1000:g}ms"
+
+        print(f"{label:>7} {percentile(times, 0.5) * 1000:>9.2f} {percentile(times, 0.99) * 1000:>9.2f} {times[-1] * 1000:>9.2f} "
+              f"{percentile(times, 0.99) / TICK_BUDGET:>8.1%} {bots.searches:>9} {bots.reflexes:>9} {deaths:>7}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
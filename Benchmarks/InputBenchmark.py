@@ -0,0 +1,129 @@
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Allows importing the game modules from the folder above
+
+from GameSimulation import SimPlayer, MAX_PLAYERS
+from OccupancyGrid import OccupancyGrid
+
+
+'''CONSTANTS'''
+
+TICKS = 300 # Ticks each drain is timed over by default
+SETTLE_TIME = 0.002 # Time given for queued inputs to reach the other end before they are drained
+
+
+'''SUBROUTINES'''
+
+def drainQueues(playerQueues):
+
+    # The old game loop's drain, polling each player's queue one input at a time
+
+    inputs = []
+    for index, playerQueue in enumerate(playerQueues):
+        while not playerQueue.empty():
+            inputs.append((index, playerQueue.get()))
+    return inputs
+
+def drainPipe(inputReceiver):
+
+    # The game loop's drain, taking each tick's batch off the pipe
+
+    inputs = []
+    while inputReceiver.poll():
+        inputs.extend(inputReceiver.recv())
+    return inputs
+
+def timeQueues(inputsPerTick, ticks=TICKS):
+
+    # Returns the mean time to drain a tick's inputs from one queue per player
+
+    playerQueues = [mp.Queue() for x in range(MAX_PLAYERS)]
+    total = 0
+    drained = 0
+
+    for tick in range(ticks):
+        for index in range(inputsPerTick):
+            playerQueues[index % MAX_PLAYERS].put("Left")
+        time.sleep(SETTLE_TIME)
+
+        start = time.perf_counter()
+        drained += len(drainQueues(playerQueues)) # A queue's feeder thread may not have passed everything on yet, the rest is left for a later tick
+        total += time.perf_counter() - start
+
+    time.sleep(SETTLE_TIME * 10)
+    assert drained + len(drainQueues(playerQueues)) == inputsPerTick * ticks
+
+    return total / ticks
+
+def timePipe(inputsPerTick, ticks=TICKS):
+
+    # Returns the mean time to drain a tick's inputs sent as one batch down a pipe
+
+    inputReceiver, inputSender = mp.Pipe(duplex=False)
+    total = 0
+    drained = 0
+
+    for tick in range(ticks):
+        if inputsPerTick:
+            inputSender.send([(index % MAX_PLAYERS, "Left") for index in range(inputsPerTick)])
+        time.sleep(SETTLE_TIME)
+
+        start = time.perf_counter()
+        drained += len(drainPipe(inputReceiver))
+        total += time.perf_counter() - start
+
+    assert drained == inputsPerTick * ticks
+
+    return total / ticks
+
+def timeTurnBuffers(repeats=20000):
+
+    # Returns the time to queue and take one turn, with the old mp.Queue(2) and the player's deque
+
+    turnQueue = mp.Queue(2)
+
+    def queueTurn():
+        try:
+            turnQueue.put_nowait("Left")
+        except queue.Full:
+            pass
+        turnQueue.get()
+
+    player = SimPlayer(0, OccupancyGrid(101, 101))
+
+    def dequeTurn():
+        player.requestTurn("Left")
+        player.turnRequests.popleft()
+
+    return timeit.timeit(queueTurn, number=repeats) / repeats, timeit.timeit(dequeTurn, number=repeats) / repeats
+
+
+'''MAIN'''
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Times draining a tick's inputs from one queue per player against one batch down a pipe, and queueing a turn")
+    parser.add_argument("--inputs", type=int, nargs="+", default=[0, 1, 4, 16], help="inputs sent each tick for each row")
+    parser.add_argument("--ticks", type=int, default=TICKS, help="ticks each drain is timed over")
+    parser.add_argument("--repeats", type=int, default=20000, help="turns queued and taken to time the turn buffers")
+    args = parser.parse_args()
+
+    print(f"Draining a tick's inputs, mean of {args.ticks} ticks")
+    print(f"{'Inputs':>8} {'Queues (us)':>12} {'Pipe (us)':>10}")
+
+    for inputsPerTick in args.inputs:
+        print(f"{inputsPerTick:>8} {timeQueues(inputsPerTick, args.ticks) * 1e6:>12.2f} {timePipe(inputsPerTick, args.ticks) * 1e6:>10.2f}")
+
+    queueTime, dequeTime = timeTurnBuffers(args.repeats)
+    print(f"Queueing and taking one turn: mp.Queue(2) {queueTime * 1e6:.2f} us, deque {dequeTime * 1e6:.2f} us")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
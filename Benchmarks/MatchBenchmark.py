@@ -0,0 +1,129 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Allows importing the game modules from the folder above
+
+from GameSimulation import Arena, DIRECTIONS, TICK_RATE
+from MatchWorker import MatchWorker, MatchChannels, assignMatches, STATS_CAPACITY
+from MultiplayerProcessServer import WakePipe
+from SharedSnapshot import SharedSnapshot
+
+
+'''CONSTANTS'''
+
+DURATION = 6 # Seconds each match count runs for, the workers' stats windows hold the whole run
+TURN_CHANCE = 0.05 # Chance each tick of each player turning
+OVERRUN_LIMIT = 0.01 # Most ticks that may overrun for a match count to be sustainable
+
+
+'''SUBROUTINES'''
+
+def runPool(matchCount, workerCount, tickRate=TICK_RATE):
+
+    # Runs matches full of randomly turning players on a pool of workers, standing in for the server by reading every
+    # snapshot and sending inputs each tick. Returns each worker's stats at the end
+
+    rng = random.Random(matchCount)
+
+    channels = [MatchChannels(matchNo, Arena(tickRate=tickRate)) for matchNo in range(matchCount)]
+    ticked = WakePipe()
+    workerStats = [SharedSnapshot(STATS_CAPACITY) for x in range(workerCount)]
+    stopEvent = mp.Event()
+
+    workers = [MatchWorker(workerNo, [channels[matchNo] for matchNo in matches], ticked, workerStats[workerNo], stopEvent)
+               for workerNo, matches in enumerate(assignMatches(matchCount, workerCount))]
+    for worker in workers:
+        worker.start()
+
+    publishCounts = [None for x in range(matchCount)]
+    endTime = time.perf_counter() + DURATION
+
+    try:
+        while time.perf_counter() < endTime:
+            ticked.wait(0.1)
+
+            for matchNo, matchChannels in enumerate(channels):
+                publishCount = matchChannels.sharedSnapshot.publishCount()
+                if publishCount == publishCounts[matchNo]:
+                    continue
+                publishCounts[matchNo] = publishCount
+
+                matchChannels.sharedSnapshot.read()
+
+                inputs = []
+                for playerNo, inUse in enumerate(matchChannels.slotsInUse):
+                    if not inUse:
+                        inputs.append((playerNo, "Create Player")) # Keeps every match full, players rejoin as soon as they have faded out
+                    elif rng.random() < TURN_CHANCE:
+                        inputs.append((playerNo, rng.choice(DIRECTIONS)))
+
+                if inputs:
+                    matchChannels.inputSender.send(inputs)
+
+        time.sleep(1.5) # Lets every worker publish stats covering the end of the run
+
+    finally:
+        stopEvent.set()
+        for worker in workers:
+            worker.join()
+
+    stats = [json.loads(sharedStats.read()) for sharedStats in workerStats]
+
+    for matchChannels in channels:
+        matchChannels.close()
+    for sharedStats in workerStats:
+        sharedStats.close()
+
+    return stats
+
+
+'''MAIN'''
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Finds how many full matches a pool of workers can tick in time, doubling the match count until too many ticks overrun")
+    parser.add_argument("--max-matches", type=int, default=64, help="most matches to try")
+    parser.add_argument("--tick-rate", type=int, default=TICK_RATE, help="ticks a second the matches run at")
+    args = parser.parse_args()
+
+    maxMatches = args.max_matches
+    tickRate = args.tick_rate
+    cores = os.cpu_count() or 1
+
+    print(f"Full four player matches for {DURATION}s each, on up to {cores} workers at {tickRate} Hz")
+    print(f"{'Matches':>8} {'Workers':>8} {'Mean (ms)':>10} {'p99 (ms)':>9} {'Max (ms)':>9} {'Jitter (ms)':>12} {'Overruns':>9} {'Busy':>6}")
+
+    sustainable = 0
+    matchCount = 1
+
+    while matchCount <= maxMatches:
+        workerCount = min(cores, matchCount)
+        stats = runPool(matchCount, workerCount, tickRate)
+
+        ticks = sum(workerStats["interval"]["count"] for workerStats in stats)
+        overruns = sum(workerStats["overruns"] for workerStats in stats)
+
+        worst = max(stats, key=lambda workerStats: workerStats["interval"]["p99Us"]) # The slowest worker sets the jitter players see
+        interval = worst["interval"]
+        busy = max(1 - workerStats["phases"]["wait"]["meanUs"] / workerStats["interval"]["meanUs"] for workerStats in stats) # Share of a tick the busiest worker spends working
+
+        print(f"{matchCount:>8} {workerCount:>8} {interval['meanUs'] / 1000:>10.2f} {interval['p99Us'] / 1000:>9.2f} {interval['maxUs'] / 1000:>9.2f} "
+              f"{(interval['p99Us'] - interval['p50Us']) / 1000:>12.2f} {overruns / max(ticks, 1):>9.1%} {busy:>6.1%}")
+
+        if overruns / max(ticks, 1) > OVERRUN_LIMIT:
+            break
+
+        sustainable = matchCount
+        matchCount *= 2
+
+    print(f"Sustainable on this host: at least {sustainable} matches ({sustainable * 4} players) with under {OVERRUN_LIMIT:.0%} of ticks overrunning")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Allows importing the game modules from the folder above
+
+from OccupancyGrid import OccupancyGrid
+
+
+'''SUBROUTINES'''
+
+def timeListTicks(obstacleTiles, probes):
+
+    # Times the old list based collision test for four players, returning the mean seconds per tick
+
+    start = time.perf_counter()
+    for tile in probes:
+        tile in obstacleTiles
+    return (time.perf_counter() - start) / (len(probes) / 4)
+
+def timeGridTicks(grid, probes):
+
+    # Times the occupancy grid collision test for four players, returning the mean seconds per tick
+
+    start = time.perf_counter()
+    for x, y in probes:
+        grid.isOccupied(x, y)
+    return (time.perf_counter() - start) / (len(probes) / 4)
+
+def timeClears(fillLevel, boardSize):
+
+    # Times removing one player's quarter of the trail tiles from a list and from a grid
+
+    tiles = [(index % boardSize, index // boardSize) for index in range(fillLevel)]
+    obstacleTiles = list(tiles)
+    grid = OccupancyGrid(boardSize, boardSize)
+    for index, (x, y) in enumerate(tiles):
+        grid.mark(x, y, index % 4)
+
+    start = time.perf_counter()
+    for tile in tiles[::4]:
+        obstacleTiles.remove(tile)
+    listTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    grid.clearPlayer(0)
+    gridTime = time.perf_counter() - start
+
+    return listTime, gridTime
+
+
+'''MAIN'''
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Times collision tests and trail clears with the old list of obstacle tiles against the occupancy grid")
+    parser.add_argument("--board-size", type=int, default=101, help="tiles along each side of the board")
+    parser.add_argument("--fill-levels", type=int, nargs="+", default=[0, 500, 1000, 2500, 5000, 10000], help="how many tiles are filled for each row")
+    parser.add_argument("--probes", type=int, default=400, help="collision tests timed at each fill level, four a tick")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    boardSize = args.board_size
+    if max(args.fill_levels) > boardSize * boardSize:
+        parser.error(f"A {boardSize}x{boardSize} board only has {boardSize * boardSize} tiles to fill")
+
+    random.seed(args.seed)
+
+    probes = [(random.randrange(boardSize), random.randrange(boardSize)) for x in range(args.probes)]
+
+    print(f"{'Filled tiles':>12} {'List tick (us)':>15} {'Grid tick (us)':>15} {'List clear (ms)':>16} {'Grid clear (ms)':>16}")
+
+    for fillLevel in args.fill_levels:
+        tiles = random.sample([(x, y) for x in range(boardSize) for y in range(boardSize)], fillLevel)
+
+        obstacleTiles = list(tiles)
+        grid = OccupancyGrid(boardSize, boardSize)
+        for index, (x, y) in enumerate(tiles):
+            grid.mark(x, y, index % 4)
+
+        listTick = timeListTicks(obstacleTiles, probes)
+        gridTick = timeGridTicks(grid, probes)
+        listClear, gridClear = timeClears(fillLevel, boardSize)
+
+        print(f"{fillLevel:>12} {listTick*1e6:>15.2f} {gridTick*1e6:>15.2f} {listClear*1e3:>16.3f} {gridClear*1e3:>16.3f}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
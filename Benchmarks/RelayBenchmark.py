@@ -0,0 +1,137 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Allows importing the game modules from the folder above
+
+from GameSimulation import Arena
+from Protocol import encodeRequest, decodeText, readMessage
+from SpectatorRelay import RELAY_PORT
+
+
+'''CLASSES'''
+
+class Watcher():
+
+    # One spectator of the relay, as cheap as possible so the benchmark measures the relay rather than itself.
+    # It subscribes, then reads whatever arrives in bulk and only counts the bytes
+
+    def __init__(self, address, rate):
+        self.address = address
+        self.rate = rate
+        self.bytesReceived = 0
+
+    async def start(self):
+        self.reader, self.writer = await asyncio.open_connection(*self.address)
+
+        await readMessage(self.reader) # "Connected"
+        if self.rate is not None:
+            self.writer.write(encodeRequest(f"Rate {self.rate}"))
+            await readMessage(self.reader)
+        self.writer.write(encodeRequest("Subscribe"))
+        await readMessage(self.reader) # "Subscribed"
+
+        self.task = asyncio.create_task(self.read())
+
+    async def read(self):
+        while True:
+            data = await self.reader.read(262144)
+            if not data:
+                break
+            self.bytesReceived += len(data)
+
+    def close(self):
+        self.task.cancel()
+        self.writer.close()
+
+
+'''SUBROUTINES'''
+
+async def relayQuery(address, request):
+
+    # Asks the relay a query answered in JSON, such as "Stats" or "Arena", on a connection of its own
+
+    reader, writer = await asyncio.open_connection(*address)
+
+    try:
+        await readMessage(reader) # "Connected"
+        writer.write(encodeRequest(request))
+        return json.loads(decodeText(await readMessage(reader)))
+    finally:
+        writer.close()
+
+async def runBenchmark(args):
+
+    # Adds spectators in steps, measuring how much of a core the relay takes to serve each number of them
+
+    address = (args.host, args.port)
+    watchers = []
+
+    arena = Arena.fromDict(await relayQuery(address, "Arena")) # The server's, passed on by the relay
+    rate = arena.snapshotRate() if args.rate is None else args.rate
+    print(f"The server sends {arena.snapshotRate():g} snapshots a second at {arena.tickRate} Hz, each spectator asks for {rate:g} a second")
+
+    print(f"{'Spectators':>10} {'Relay CPU':>10} {'Per core':>9} {'MB/s out':>9} {'Skipped/s':>10} {'Dropped':>8} {'Fan out p99 (us)':>17}")
+
+    try:
+        for count in args.spectators:
+            while len(watchers) < count:
+                watcher = Watcher(address, args.rate)
+                await watcher.start()
+                watchers.append(watcher)
+
+            await asyncio.sleep(args.settle)
+
+            before = await relayQuery(address, "Stats")
+            bytesBefore = sum(watcher.bytesReceived for watcher in watchers)
+            start = time.perf_counter()
+
+            await asyncio.sleep(args.duration)
+
+            after = await relayQuery(address, "Stats")
+            elapsed = time.perf_counter() - start
+            received = sum(watcher.bytesReceived for watcher in watchers) - bytesBefore
+
+            load = (after["cpuSeconds"] - before["cpuSeconds"]) / elapsed # Fraction of a core the relay used
+            perCore = count / load if load > 0 else float("inf")
+
+            print(f"{count:>10} {load:>10.1%} {perCore:>9.0f} {received / elapsed / 1e6:>9.2f} {(after['skipped'] - before['skipped']) / elapsed:>10.1f} "
+                  f"{after['dropped']:>8} {after['fanOut'].get('p99Us', 0):>17.0f}")
+
+            if load > args.max_load:
+                print(f"Relay used over {args.max_load:.0%} of a core, stopping")
+                break
+
+    finally:
+        for watcher in watchers:
+            watcher.close()
+
+
+'''MAIN'''
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Measures how many spectators one relay process can serve per core. Start the server first, "
+                                                 "for example with --headless --bots 4 --relays 1, so there is a match to watch")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=RELAY_PORT, help="the relay's port")
+    parser.add_argument("--spectators", type=int, nargs="+", default=[50, 100, 200, 400, 800], help="numbers of spectators to measure, in order")
+    parser.add_argument("--rate", type=float, help="updates a second each spectator asks the relay for, rounded to a whole number of the server's snapshots. "
+                                                   "Every snapshot the server sends by default")
+    parser.add_argument("--duration", type=float, default=5, help="seconds each step is measured for")
+    parser.add_argument("--settle", type=float, default=1, help="seconds to wait after adding spectators before measuring")
+    parser.add_argument("--max-load", type=float, default=0.9, help="fraction of a core after which no more spectators are added")
+    args = parser.parse_args()
+
+    print(f"Watching through the relay at {args.host}:{args.port}. The spectators run in this process, so on a machine with few cores "
+          f"they compete with the relay and the figures are a lower bound")
+
+    asyncio.run(runBenchmark(args))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
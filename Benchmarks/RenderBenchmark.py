@@ -0,0 +1,103 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Allows importing the game modules from the folder above
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy") # No window is needed to time drawing
+
+import pygame
+
+from GameSimulation import Simulation, ARENA_SIZE, TILE_SIZE, MAX_PLAYERS, BACKGROUND_COLOUR
+from ServerRenderer import ArenaRenderer
+
+
+'''SUBROUTINES'''
+
+def drawFullFrame(screen, simulation, trails):
+
+    # The old way of drawing a frame, clearing the screen and blitting a new surface for every trail tile
+
+    screen.fill(BACKGROUND_COLOUR)
+
+    for playerNo, x, y in trails:
+        image = pygame.Surface([TILE_SIZE,TILE_SIZE])
+        image.fill(simulation.players[playerNo].colour)
+        screen.blit(image, (x * TILE_SIZE, y * TILE_SIZE))
+
+    for player in simulation.players:
+        image = pygame.Surface([player.width,player.height])
+        image.fill(player.colour)
+        screen.blit(image, (player.centerx - player.width/2, player.centery - player.height / 2))
+
+    pygame.display.update()
+
+def newTiles(frame):
+
+    # The trail tiles laid on a frame, four a frame filling the board a row at a time
+
+    width = ARENA_SIZE // TILE_SIZE
+    return [(playerNo, (frame * MAX_PLAYERS + playerNo) % width, (frame * MAX_PLAYERS + playerNo) // width) for playerNo in range(MAX_PLAYERS)]
+
+
+'''MAIN'''
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Times drawing a frame by redrawing everything against the server window's persistent trail layer, as the trails grow")
+    parser.add_argument("--checkpoints", type=int, nargs="+", default=[250, 500, 1000, 1500, 2000, 2500], help="frames played before each row is timed, four trail tiles are laid a frame")
+    parser.add_argument("--frames", type=int, default=30, help="frames timed for each row")
+    args = parser.parse_args()
+
+    checkpoints = sorted(args.checkpoints)
+    framesPerSample = args.frames
+
+    lastFrame = 0
+    for checkpoint in checkpoints:
+        lastFrame = max(lastFrame, checkpoint) + framesPerSample
+
+    boardTiles = (ARENA_SIZE // TILE_SIZE) ** 2
+    if lastFrame * MAX_PLAYERS > boardTiles:
+        parser.error(f"The board fills up after {boardTiles // MAX_PLAYERS} frames")
+
+    pygame.display.init()
+
+    simulation = Simulation()
+    simulation.step([(playerNo, "Create Player") for playerNo in range(MAX_PLAYERS)])
+
+    renderer = ArenaRenderer()
+    screen = renderer.screen
+
+    trails = []
+
+    print(f"{'Trail tiles':>11} {'Full redraw (ms)':>17} {'Dirty rects (ms)':>17}")
+
+    frame = 0
+    for checkpoint in checkpoints:
+        while frame < checkpoint:
+            simulation.addedTiles = newTiles(frame)
+            trails.extend(simulation.addedTiles)
+            renderer.draw(simulation)
+            frame += 1
+
+        start = time.perf_counter()
+        for x in range(framesPerSample):
+            drawFullFrame(screen, simulation, trails)
+        fullTime = (time.perf_counter() - start) / framesPerSample
+
+        start = time.perf_counter()
+        for x in range(framesPerSample):
+            simulation.addedTiles = newTiles(frame)
+            trails.extend(simulation.addedTiles)
+            renderer.draw(simulation)
+            frame += 1
+        dirtyTime = (time.perf_counter() - start) / framesPerSample
+
+        print(f"{len(trails):>11} {fullTime*1e3:>17.3f} {dirtyTime*1e3:>17.3f}")
+
+    pygame.quit()
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
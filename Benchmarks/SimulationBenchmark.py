@@ -0,0 +1,85 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Allows importing the game modules from the folder above
+
+from GameSimulation import Simulation, Arena, DIRECTIONS, ARENA_SIZE, TILE_SIZE, MAX_PLAYERS, parseArenaSize
+from Protocol import encodeSnapshot, encodeKeyframe
+
+
+'''CONSTANTS'''
+
+TICK_BUDGET = 1 / 60 # Everything a match does each tick has to fit in this
+
+
+'''SUBROUTINES'''
+
+def runMatch(seed, arena, maxTicks=20000):
+
+    # Plays one match of randomly turning players as fast as possible, returns how many ticks it lasted
+    # and the longest a tick took, including encoding its snapshot
+
+    rng = random.Random(seed)
+    simulation = Simulation(arena)
+    playerNos = range(arena.maxPlayers)
+
+    simulation.step([(playerNo, "Create Player") for playerNo in playerNos])
+
+    longestTick = 0
+
+    while simulation.tick < maxTicks and any(player is not None for player in simulation.players):
+        inputs = [(playerNo, rng.choice(DIRECTIONS)) for playerNo in playerNos if rng.random() < 0.05]
+
+        start = time.perf_counter()
+        simulation.step(inputs)
+        encodeSnapshot(simulation.tick, simulation.playerData(), simulation.addedTiles, simulation.clearedPlayers)
+        longestTick = max(longestTick, time.perf_counter() - start)
+
+    return simulation.tick, longestTick, simulation
+
+def timeKeyframe(simulation):
+
+    # Returns how long encoding the whole board as a keyframe takes, as it is for every client joining
+
+    start = time.perf_counter()
+    encodeKeyframe(simulation.tick, simulation.arena.gridWidth, simulation.arena.gridHeight, bytes(simulation.grid.cells))
+    return time.perf_counter() - start
+
+
+'''MAIN'''
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Plays random matches as fast as possible")
+    parser.add_argument("matches", type=int, nargs="?", default=50)
+    parser.add_argument("--arena", default=str(ARENA_SIZE), metavar="WIDTH[xHEIGHT]", help="size of the arena in pixels")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE)
+    parser.add_argument("--players", type=int, default=MAX_PLAYERS)
+    args = parser.parse_args()
+
+    arena = Arena(*parseArenaSize(args.arena), args.tile_size, args.players)
+
+    totalTicks = 0
+    longestTick = 0
+    longestKeyframe = 0
+    start = time.perf_counter()
+
+    for seed in range(args.matches):
+        ticks, matchLongest, simulation = runMatch(seed, arena)
+        totalTicks += ticks
+        longestTick = max(longestTick, matchLongest)
+        longestKeyframe = max(longestKeyframe, timeKeyframe(simulation))
+
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.matches} matches of {arena.maxPlayers} players on {arena.gridWidth}x{arena.gridHeight} tiles, {totalTicks} ticks in {elapsed:.2f}s")
+    print(f"{totalTicks / elapsed:.0f} ticks per second ({totalTicks / elapsed / 60:.0f}x real time at 60 Hz)")
+    print(f"Longest tick {longestTick * 1000:.2f}ms ({longestTick / TICK_BUDGET:.1%} of a 60 Hz tick), longest keyframe {longestKeyframe * 1000:.2f}ms")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
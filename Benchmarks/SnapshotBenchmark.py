@@ -0,0 +1,82 @@
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Allows importing the game modules from the folder above
+
+from Protocol import encodeSnapshot, decodeSnapshot
+from GameSimulation import MAX_SLOTS
+
+
+'''CONSTANTS'''
+
+SAMPLE_PLAYERS = ((0, 0, 10, 202, 12, 8, 2, 0, 17), (1, 14, 394, 202, 12, 8, 129, 0, 3), (2, 0, 202, 10, 8, 12, 3, 18, 40), (3, 61, 202, 394, 8, 12, 132, 0, 0)) # Taken in turn for each player
+
+
+'''SUBROUTINES'''
+
+def encodeCsv(playerData):
+
+    # The old format, built a character at a time like Player.getData used to, then joined with ";"
+
+    playerStrings = []
+    for dataTuple in playerData:
+        data = ""
+        for index, item in enumerate(dataTuple):
+            data += str(item)
+            if index != len(dataTuple)-1:
+                data += ","
+        playerStrings.append(data)
+    return str.encode(";".join(playerStrings))
+
+def decodeCsv(message):
+
+    # The old client side parsing of the comma separated format
+
+    players = []
+    for element in message.decode().split(";"):
+        currentObjectData = element.split(",")
+        players.append((int(currentObjectData[0]), int(currentObjectData[1]), int(currentObjectData[2]),
+                        int(currentObjectData[3]), int(currentObjectData[4]), int(currentObjectData[5])))
+    return players
+
+
+'''MAIN'''
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Times encoding and decoding the players of a snapshot in the old CSV format and the binary one")
+    parser.add_argument("--players", type=int, default=4, help=f"players in the snapshot, up to {MAX_SLOTS}")
+    parser.add_argument("--repeats", type=int, default=100000, help="times each encode and decode is run")
+    args = parser.parse_args()
+
+    if not 1 <= args.players <= MAX_SLOTS:
+        parser.error(f"Snapshots hold between 1 and {MAX_SLOTS} players")
+
+    playerData = [(playerNo, *SAMPLE_PLAYERS[playerNo % len(SAMPLE_PLAYERS)][1:]) for playerNo in range(args.players)]
+    repeats = args.repeats
+
+    drawData = [data[:6] for data in playerData] # The old format only carried what was needed for drawing
+
+    csvMessage = encodeCsv(drawData)
+    binaryMessage = encodeSnapshot(123456, playerData)
+
+    assert decodeCsv(csvMessage) == drawData
+    assert decodeSnapshot(binaryMessage) == (123456, playerData, [], [])
+
+    results = (
+        ("CSV encode", timeit.timeit(lambda: encodeCsv(drawData), number=repeats)),
+        ("Binary encode", timeit.timeit(lambda: encodeSnapshot(123456, playerData), number=repeats)),
+        ("CSV decode", timeit.timeit(lambda: decodeCsv(csvMessage), number=repeats)),
+        ("Binary decode", timeit.timeit(lambda: decodeSnapshot(binaryMessage), number=repeats)),
+    )
+
+    print(f"{args.players} players: CSV {len(csvMessage)} bytes, binary {len(binaryMessage)} bytes")
+    for name, seconds in results:
+        print(f"{name:>14}: {seconds / repeats * 1e6:.2f} us")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
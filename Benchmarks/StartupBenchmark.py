@@ -0,0 +1,91 @@
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # The game's folder, the server is run from it
+sys.path.insert(0, FOLDER) # Allows importing the game modules from the folder above
+
+from Protocol import decodeText
+from MultiplayerTestClient import MessageReader
+
+
+'''CONSTANTS'''
+
+SERVER_ADDRESS = ("127.0.0.1", 5555)
+CONNECT_TIMEOUT = 20 # Seconds a server gets to start before the run is given up on
+
+
+'''SUBROUTINES'''
+
+def timeStartup(serverArgs, environment):
+
+    # Starts the server and returns the seconds until it answers a connection, then stops it again
+
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "MultiplayerProcessServer.py", *serverArgs], cwd=FOLDER, env=environment,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        while time.perf_counter() - start < CONNECT_TIMEOUT:
+            try:
+                connection = socket.create_connection(SERVER_ADDRESS, timeout=1)
+            except OSError:
+                time.sleep(0.005)
+                continue
+
+            with connection:
+                decodeText(MessageReader(connection).receive()) # "Connected"
+            return time.perf_counter() - start
+
+        raise TimeoutError("The server didn't start")
+
+    finally:
+        server.send_signal(signal.SIGINT) # Stops the server, and the interrupt reaches its other processes through the main one
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+def timeImport(module):
+
+    # Returns the seconds a fresh interpreter takes to import a module, which shows what the server pays before main runs
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=FOLDER, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+'''MAIN'''
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Times how long the server takes to start answering connections, with and without a window")
+    parser.add_argument("--runs", type=int, default=5, help="starts of each mode, the median is reported")
+    args = parser.parse_args()
+
+    environment = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy") # Lets the windowed mode run without a display or sound card
+
+    modes = [("Headless", ["--headless"]), ("Window", [])]
+
+    print(f"Median of {args.runs} starts, from launching the process to the first reply")
+    print(f"{'Mode':>10} {'Startup (ms)':>13} {'Fastest':>8} {'Slowest':>8}")
+
+    for name, serverArgs in modes:
+        times = sorted(timeStartup(serverArgs, environment) for run in range(args.runs))
+        print(f"{name:>10} {times[len(times) // 2] * 1000:>13.0f} {times[0] * 1000:>8.0f} {times[-1] * 1000:>8.0f}")
+
+    print()
+    print(f"{'Import':>24} {'Time (ms)':>10}")
+    for module in ("sys", "MultiplayerProcessServer", "pygame"):
+        times = sorted(timeImport(module) for run in range(args.runs))
+        print(f"{module:>24} {times[len(times) // 2] * 1000:>10.0f}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Allows importing the game modules from the folder above
+
+from GameSimulation import Arena, RENDER_RATE
+from MatchWorker import MatchChannels, Match, runMatches, STATS_CAPACITY
+from MultiplayerProcessServer import WakePipe
+from SharedSnapshot import SharedSnapshot
+
+
+'''CLASSES'''
+
+class SlowRenderer():
+
+    # Stands in for the window, taking a fixed time to draw each frame, so the cost of drawing can be set without a display
+
+    def __init__(self, frameCost):
+        self.frameCost = frameCost
+        self.frames = 0
+
+    def draw(self, simulation, changes=None):
+        time.sleep(self.frameCost)
+        self.frames += 1
+
+    def handleEvents(self):
+        return True
+
+
+'''SUBROUTINES'''
+
+def runLoop(tickRate, frameCost, duration, bots):
+
+    # Runs one match of bots in the game loop for a while with frames that cost frameCost seconds to draw,
+    # returns the ticks a second it managed and the frames a second drawn
+
+    arena = Arena(tickRate=tickRate)
+    channels = MatchChannels(0, arena)
+    match = Match(channels, botCount=bots)
+
+    ticked = WakePipe()
+    sharedStats = SharedSnapshot(STATS_CAPACITY)
+    stopEvent = mp.Event()
+    renderer = SlowRenderer(frameCost)
+
+    timer = threading.Timer(duration, stopEvent.set)
+    start = time.perf_counter()
+    timer.start()
+
+    runMatches([match], ticked, sharedStats, stopEvent, renderer)
+    elapsed = time.perf_counter() - start
+
+    ticks = match.simulation.tick
+
+    match.close()
+    channels.close()
+    sharedStats.close()
+
+    return ticks / elapsed, renderer.frames / elapsed
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Checks the game keeps its tick rate while frames are slow to draw, as the loop ticks on a fixed timestep")
+    parser.add_argument("--tick-rates", type=int, nargs="+", default=[60, 120, 240])
+    parser.add_argument("--frame-costs", type=float, nargs="+", default=[0, 10, 30], help="milliseconds each frame takes to draw")
+    parser.add_argument("--duration", type=float, default=3, help="seconds each combination runs for")
+    parser.add_argument("--bots", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"One match of {args.bots} bots for {args.duration}s each, the window drawn at up to {RENDER_RATE} frames a second")
+    print(f"{'Tick rate':>10} {'Frame (ms)':>11} {'Ticks/s':>8} {'Frames/s':>9} {'Of target':>10}")
+
+    for tickRate in args.tick_rates:
+        for frameCost in args.frame_costs:
+            tickSpeed, frameSpeed = runLoop(tickRate, frameCost / 1000, args.duration, args.bots)
+            print(f"{tickRate:>10} {frameCost:>11g} {tickSpeed:>8.1f} {frameSpeed:>9.1f} {tickSpeed / tickRate:>10.1%}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
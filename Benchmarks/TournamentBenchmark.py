@@ -0,0 +1,71 @@
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Allows importing the game modules from the folder above
+
+from GameSimulation import Arena
+from Tournament import runTournament, readResults
+
+
+'''SUBROUTINES'''
+
+def workerCounts(cores):
+
+    # Returns 1, 2, 4... up to the number of cores, always ending on it
+
+    counts = []
+    workers = 1
+
+    while workers < cores:
+        counts.append(workers)
+        workers *= 2
+
+    return counts + [cores]
+
+
+'''MAIN'''
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Plays the same tournament on more and more workers, to show how throughput scales with cores")
+    parser.add_argument("matches", type=int, nargs="?", default=None, help="matches per run, 8 per core by default")
+    parser.add_argument("--radius", type=int, default=8, help="how many tiles around them bots search, smaller is quicker")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    matchCount = args.matches or 8 * cores
+    arena = Arena()
+
+    print(f"{matchCount} matches of {arena.maxPlayers} bots per run, on up to {cores} cores")
+    print(f"{'Workers':>8} {'Seconds':>8} {'Matches/s':>10} {'Speedup':>8} {'Efficiency':>11}")
+
+    baseline = None
+    firstResults = None
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "benchmark.results")
+
+        for workers in workerCounts(cores):
+            finished, elapsed = runTournament(path, arena, matchCount, radius=args.radius, workers=workers, progress=False)
+            rate = finished / elapsed
+
+            if baseline is None:
+                baseline = rate
+
+            print(f"{workers:>8} {elapsed:>8.2f} {rate:>10.2f} {rate / baseline:>7.2f}x {rate / baseline / workers:>11.0%}")
+
+            results = sorted(readResults(path)[3]) # Finishing order differs between runs, the results themselves must not
+            if firstResults is None:
+                firstResults = results
+            elif results != firstResults:
+                print(f"Results on {workers} workers differ from on 1, matches are not deterministic")
+                return 1
+
+    print("Every run gave the same results")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+import random
+import time
+
+from GameSimulation import DIRECTIONS, VELOCITIES
+
+
+'''CONSTANTS'''
+
+BOT_BUDGET = 0.002 # Seconds of searching the bots of one match may use each tick, decisions that don't fit wait for a later tick
+SEARCH_RADIUS = 16 # Tiles around a turning point that are searched, so a decision costs the same however big the board is
+
+FREE_DIGITS = bytes.maketrans(bytes(range(256)), b"1" + b"0" * 255) # Turns a row of cells into binary digits, 1 for each free tile
+
+EDGE_MARGIN = 2 # Players die once their 3 tile long body touches the edge, which happens whenever their centre is this close to it
+
+REACHABLE_WEIGHT = 0.25 # Worth of a reachable tile compared to one the bot would get to first
+
+OPPOSITES = {"Left": "Right", "Right": "Left", "Up": "Down", "Down": "Up"}
+
+
+'''CLASSES'''
+
+class Bot():
+
+    # One bot player, remembering which turning point it last decided on so each is only decided once
+
+    def __init__(self, playerNo):
+        self.playerNo = playerNo
+        self.plannedTile = None
+        self.joined = False
+
+class BotController():
+
+    # Plays the bots of one match. Each tick it returns their inputs, the same (playerNo, command) pairs clients send, so bots go
+    # through the same path as people, are recorded in replays and need nothing special from the simulation.
+    # A bot only decides at the next tile centre it will reach, which is where turns happen. Every way it could go from there
+    # is scored by searching the board around it: how many tiles it can still reach, and how many of those it would get to before
+    # any other player (its Voronoi territory). Searches work on whole rows of tiles at once as bits. Decisions are made most
+    # urgent first until the tick's budget runs out, and any that can wait no longer get a quick look at just the next tile instead
+
+    def __init__(self, simulation, botCount=0, budget=BOT_BUDGET, seed=0, radius=SEARCH_RADIUS, rejoin=True):
+        self.simulation = simulation
+        self.botCount = botCount
+        self.budget = budget # None means no limit, every decision is searched, which keeps matches repeatable
+        self.radius = radius
+        self.rejoin = rejoin # If bots play again once they have died, rather than just once
+        self.random = random.Random(seed)
+
+        self.bots = {} # Maps a player number to its Bot
+
+        self.searches = 0 # Decisions made by searching
+        self.reflexes = 0 # Decisions made by only looking at the next tile, as the budget had run out
+
+    def slots(self):
+
+        # Returns the player numbers being played by bots
+
+        return set(self.bots)
+
+    def fillSlots(self, claimedSlots=None):
+
+        # Gives up any slot a person has claimed, and takes empty unclaimed slots until there are botCount bots
+
+        simulation = self.simulation
+
+        for playerNo in list(self.bots):
+            if claimedSlots is not None and claimedSlots[playerNo]:
+                del self.bots[playerNo]
+
+        for playerNo in range(simulation.maxPlayers):
+            if len(self.bots) >= self.botCount:
+                break
+
+            if playerNo not in self.bots and simulation.players[playerNo] is None and not (claimedSlots is not None and claimedSlots[playerNo]):
+                self.bots[playerNo] = Bot(playerNo)
+
+    def inputs(self, claimedSlots=None):
+
+        # Returns this tick's inputs for every bot, call just before the simulation steps
+
+        self.fillSlots(claimedSlots)
+
+        simulation = self.simulation
+        inputs = []
+        pending = []
+
+        for playerNo, bot in self.bots.items():
+            player = simulation.players[playerNo]
+
+            if player is None: # Rejoin as soon as the last player in the slot has faded out
+                if self.rejoin or not bot.joined:
+                    inputs.append((playerNo, "Create Player"))
+                    bot.plannedTile = None
+                    bot.joined = True
+                continue
+
+            if not player.alive:
+                continue
+
+            tile, ticksLeft = nextTurningPoint(player)
+            if tile != bot.plannedTile:
+                pending.append((ticksLeft, playerNo, tile))
+
+        if not pending:
+            return inputs
+
+        pending.sort()
+        heads = self.headTiles()
+        start = time.perf_counter()
+
+        for ticksLeft, playerNo, tile in pending:
+            player = simulation.players[playerNo]
+
+            if self.budget is None or time.perf_counter() - start < self.budget:
+                direction = self.search(heads, player, tile)
+                self.searches += 1
+            elif ticksLeft <= 1:
+                direction = self.reflex(player, tile)
+                self.reflexes += 1
+            else:
+                continue # There is time to decide on a later tick
+
+            self.bots[playerNo].plannedTile = tile
+
+            if direction is not None:
+                inputs.append((playerNo, direction))
+
+        return inputs
+
+    def headTiles(self):
+
+        # Returns each living player's current tile and the tile it is heading into, by player number
+
+        tileSize = self.simulation.arena.tileSize
+        heads = {}
+
+        for playerNo, player in enumerate(self.simulation.players):
+            if player is None or not player.alive:
+                continue
+
+            tile = (player.centerx // tileSize, player.centery // tileSize)
+            heading = player.heading()
+
+            if heading is None:
+                heads[playerNo] = [tile]
+            else:
+                heads[playerNo] = [tile, (tile[0] + VELOCITIES[heading][0], tile[1] + VELOCITIES[heading][1])]
+
+        return heads
+
+    def candidates(self, player):
+
+        # Returns the directions a player could be going in after its next turning point, straight on first
+
+        heading = player.heading()
+
+        if heading is None:
+            return list(DIRECTIONS)
+
+        straight = DIRECTIONS[heading]
+        return [straight] + [direction for direction in DIRECTIONS if direction not in (straight, OPPOSITES[straight])]
+
+    def search(self, heads, player, tile):
+
+        # Returns the input that gives a player the best position after the turning point at a tile, or None to carry on as it is
+
+        grid = self.simulation.grid
+        radius = self.radius
+
+        x0 = max(EDGE_MARGIN, tile[0] - radius) # Tiles beyond the window are never reached, which covers the deadly edges too
+        y0 = max(EDGE_MARGIN, tile[1] - radius)
+        x1 = min(grid.width - EDGE_MARGIN, tile[0] + radius + 1)
+        y1 = min(grid.height - EDGE_MARGIN, tile[1] + radius + 1)
+
+        blocked = [heads[player.playerNo][0], tile] # The tiles it is on and turning at both become trail once left
+
+        starts = []
+        directions = []
+        for direction in self.candidates(player):
+            velocity = VELOCITIES[DIRECTIONS.index(direction)]
+            start = (tile[0] + velocity[0], tile[1] + velocity[1])
+
+            if start not in blocked and not self.isDeadly(*start):
+                starts.append(start)
+                directions.append(direction)
+
+        if not starts: # Trapped whichever way it goes
+            return None
+
+        opponents = [head for playerNo, tiles in heads.items() if playerNo != player.playerNo for head in tiles]
+
+        scores = scoreStarts(grid.cells, grid.width, (x0, y0, x1, y1), blocked, starts, opponents)
+
+        best = max(range(len(starts)), key=lambda index: scores[index] + self.random.random() * 0.5)
+
+        return self.turnInput(player, directions[best])
+
+    def reflex(self, player, tile):
+
+        # Returns a turn away from an occupied tile straight ahead of the turning point, for when there is no time to search
+
+        grid = self.simulation.grid
+        directions = self.candidates(player)
+
+        if player.heading() is None:
+            self.random.shuffle(directions)
+        else: # Straight on is still tried first
+            turns = directions[1:]
+            self.random.shuffle(turns)
+            directions = directions[:1] + turns
+
+        for direction in directions:
+            velocity = VELOCITIES[DIRECTIONS.index(direction)]
+            if not self.isDeadly(tile[0] + velocity[0], tile[1] + velocity[1]):
+                return self.turnInput(player, direction)
+
+        return None
+
+    def isDeadly(self, x, y):
+
+        # Returns if moving onto a tile would kill a player, as it is taken or too near the edge
+
+        grid = self.simulation.grid
+
+        if not (EDGE_MARGIN <= x < grid.width - EDGE_MARGIN and EDGE_MARGIN <= y < grid.height - EDGE_MARGIN):
+            return True
+        return grid.isOccupied(x, y)
+
+    def turnInput(self, player, direction):
+
+        # Returns the command for going in a direction, None if it means carrying straight on
+
+        heading = player.heading()
+        if heading is not None and DIRECTIONS[heading] == direction:
+            return None
+        return direction
+
+
+'''SUBROUTINES'''
+
+def nextTurningPoint(player):
+
+    # Returns the next tile whose centre a player will reach, where a turn asked for now would happen, and how many ticks away it is
+
+    tileSize = player.tileSize
+    half = tileSize // 2
+    centerx, centery = player.centerx, player.centery
+
+    heading = player.heading()
+    if heading is None: # Waiting at its spawn point, which is a tile centre, turns happen on the next tick
+        return (centerx // tileSize, centery // tileSize), 1
+
+    xVel, yVel = VELOCITIES[heading]
+    position, velocity = (centerx, xVel) if xVel else (centery, yVel)
+
+    distance = (half - position) % tileSize if velocity > 0 else (position - half) % tileSize
+    if distance == 0: # On a centre now, so any turn there has already happened
+        distance = tileSize
+
+    return ((centerx + xVel * distance) // tileSize, (centery + yVel * distance) // tileSize), -(-distance // player.speed)
+
+def scoreStarts(cells, gridWidth, window, blocked, starts, opponents):
+
+    # Scores each starting tile by searching the window of the board. The window is packed into one integer, a bit per tile,
+    # so every search grows outwards one step for the whole window in a few shifts and masks rather than tile by tile.
+    # Each row is followed by a padding bit that is never free, so nothing grows off one edge of a row onto the next.
+    # All the searches take their steps together, so a tile counts as a start's territory if it gets there before any opponent
+
+    x0, y0, x1, y1 = window
+    width = x1 - x0
+    stride = width + 1
+
+    rows = [bytes(cells[y * gridWidth + x0:y * gridWidth + x1]).translate(FREE_DIGITS) for y in range(y0, y1)]
+    free = int(b"0".join(rows)[::-1], 2) # Reversed so a tile's bit number is its position in the joined rows
+
+    def bit(x, y):
+        if x0 <= x < x1 and y0 <= y < y1:
+            return 1 << ((y - y0) * stride + x - x0)
+        return 0
+
+    for x, y in blocked:
+        free &= ~bit(x, y)
+
+    theirs = 0
+    for x, y in opponents:
+        theirs |= bit(x, y)
+    theirs &= free
+    theirsReached = theirs
+
+    frontiers = [bit(x, y) & free for x, y in starts]
+    reached = list(frontiers)
+    territory = [(frontier & ~theirsReached).bit_count() for frontier in frontiers]
+
+    while any(frontiers):
+        grown = (theirs << 1) | (theirs >> 1) | (theirs << stride) | (theirs >> stride)
+        theirs = grown & free & ~theirsReached
+        theirsReached |= theirs
+
+        for index, frontier in enumerate(frontiers):
+            if not frontier:
+                continue
+
+            grown = (frontier << 1) | (frontier >> 1) | (frontier << stride) | (frontier >> stride)
+            frontier = grown & free & ~reached[index]
+
+            frontiers[index] = frontier
+            reached[index] |= frontier
+            territory[index] += (frontier & ~theirsReached).bit_count()
+
+    return [territory[index] + REACHABLE_WEIGHT * reached[index].bit_count() for index in range(len(starts))]
@@ -0,0 +1,532 @@
+import colorsys
+import time
+from collections import deque
+
+from OccupancyGrid import OccupancyGrid
+
+
+'''CONSTANTS'''
+
+ARENA_SIZE = 404 # 404 because it makes an odd number of 4x4 "tiles" on each side, allowing for easy centering
+TILE_SIZE = 4
+MAX_PLAYERS = 4 # The defaults, any Arena can be set up differently
+TICK_RATE = 60 # Ticks a second
+SPEED = 1 # Pixels a player moves each tick
+
+MAX_SLOTS = 254 # Grid cells and snapshot records hold a player number in one byte, with 0 kept for empty cells
+MAX_ARENA_SIZE = 0xFFFF # Snapshots hold pixel positions in two bytes
+MAX_TILE_SIZE = 85 # Snapshots hold a player's size in one byte, and players are 3 tiles long
+MAX_TICK_RATE = 240
+MAX_SNAPSHOT_TILES = 0xFFFF # Snapshots count the trail tiles added since the last one in two bytes, and each player lays at most one a tick
+
+RENDER_RATE = 60 # Frames a second windows are drawn at, whatever the tick rate
+MAX_CATCH_UP = 0.25 # Seconds of ticks a loop that fell behind runs back to back, any more are dropped rather than the loop never catching up
+
+PLAYER_COLOURS = ((255,0,0), (0,0,255), (0,255,0), (255,255,0)) # The first four slots, later ones are spread round the colour wheel
+SPAWN_INSETS = (2, 3) # Tiles between a spawn point and the near (left or top) and far (right or bottom) edges
+MIN_SPAWN_SPACING = 4 # Fewest tiles between neighbouring spawn points on one side
+
+FADE_TICKS = 60 # How many ticks a dead player takes to fade out before being removed
+BACKGROUND_COLOUR = (127.5,127.5,127.5)
+
+DIRECTIONS = ("Left", "Right", "Up", "Down")
+VELOCITIES = ((-1, 0), (1, 0), (0, -1), (0, 1)) # The x and y velocity of each direction, at a speed of 1
+
+DEAD_FLAG = 0x80 # Set in a player's motion byte once it has died
+
+
+'''CLASSES'''
+
+class Arena():
+
+    # The layout of a match: its size in pixels, the size of its tiles and how many players it holds. Every player slot's
+    # colour, size and spawn point is worked out from these, spread evenly round the edges facing inwards.
+    # It also holds how fast the match runs: the players' speed, the ticks a second, and how many ticks go between snapshots
+
+    def __init__(self, width=ARENA_SIZE, height=None, tileSize=TILE_SIZE, maxPlayers=MAX_PLAYERS, speed=SPEED, tickRate=TICK_RATE, snapshotInterval=1):
+        if height is None:
+            height = width
+
+        if not 2 <= tileSize <= MAX_TILE_SIZE or width % tileSize or height % tileSize:
+            raise ValueError(f"A {width}x{height} arena can't be split into {tileSize} pixel tiles")
+        if max(width, height) > MAX_ARENA_SIZE:
+            raise ValueError(f"Arenas can be at most {MAX_ARENA_SIZE} pixels across")
+        if not 1 <= maxPlayers <= MAX_SLOTS:
+            raise ValueError(f"Arenas hold between 1 and {MAX_SLOTS} players")
+        if not 1 <= speed <= tileSize: # So a player crosses at most one tile edge, and lays at most one tile, a tick
+            raise ValueError(f"Players can move between 1 and {tileSize} pixels a tick on {tileSize} pixel tiles")
+        if not 1 <= tickRate <= MAX_TICK_RATE:
+            raise ValueError(f"Matches run at between 1 and {MAX_TICK_RATE} ticks a second")
+        if snapshotInterval < 1:
+            raise ValueError("Snapshots need at least one tick between them")
+        if maxPlayers * snapshotInterval > MAX_SNAPSHOT_TILES:
+            raise ValueError(f"{maxPlayers} players can lay more than {MAX_SNAPSHOT_TILES} tiles in the {snapshotInterval} ticks between snapshots")
+
+        self.width = width
+        self.height = height
+        self.tileSize = tileSize
+        self.maxPlayers = maxPlayers
+
+        self.speed = speed
+        self.tickRate = tickRate
+        self.snapshotInterval = snapshotInterval
+
+        self.gridWidth = width // tileSize
+        self.gridHeight = height // tileSize
+
+        self.playerStats = self.spawnSlots()
+
+    def spawnSlots(self):
+
+        # Returns the (colour, width, height, x, y) of every player slot. Slots go round the left, right, top and bottom edges in turn,
+        # each side's share spaced evenly along it, so the default four start in the middle of each side.
+        # Players are 3 tiles long and 2 wide, lying across the side they start on, with their centre on a tile's centre
+
+        tileSize = self.tileSize
+        half = tileSize // 2
+        nearInset, farInset = SPAWN_INSETS
+
+        slots = []
+
+        for playerNo in range(self.maxPlayers):
+            side = playerNo % 4
+            sideCount = (self.maxPlayers - side + 3) // 4 # Slots sharing this side
+            span = self.gridHeight if side < 2 else self.gridWidth
+
+            spacing = (span - 1) // (sideCount + 1)
+            if spacing < MIN_SPAWN_SPACING:
+                raise ValueError(f"{self.maxPlayers} players don't fit round a {self.gridWidth}x{self.gridHeight} tile arena")
+
+            along = (playerNo // 4 + 1) * (span - 1) // (sideCount + 1)
+
+            if side == 0: # Left
+                tileX, tileY = nearInset, along
+            elif side == 1: # Right
+                tileX, tileY = self.gridWidth - 1 - farInset, along
+            elif side == 2: # Top
+                tileX, tileY = along, nearInset
+            else: # Bottom
+                tileX, tileY = along, self.gridHeight - 1 - farInset
+
+            width, height = (3 * tileSize, 2 * tileSize) if side < 2 else (2 * tileSize, 3 * tileSize)
+
+            slots.append((playerColour(playerNo), width, height, tileX * tileSize + half - width // 2, tileY * tileSize + half - height // 2))
+
+        return slots
+
+    def toDict(self):
+
+        # Returns the settings needed to make the same arena, to be sent as JSON
+
+        return {"width": self.width, "height": self.height, "tileSize": self.tileSize, "maxPlayers": self.maxPlayers,
+                "speed": self.speed, "tickRate": self.tickRate, "snapshotInterval": self.snapshotInterval}
+
+    @classmethod
+    def fromDict(cls, settings):
+        return cls(settings["width"], settings["height"], settings["tileSize"], settings["maxPlayers"],
+                   settings.get("speed", SPEED), settings.get("tickRate", TICK_RATE), settings.get("snapshotInterval", 1)) # Older servers only sent the layout
+
+    def snapshotRate(self):
+
+        # Returns how many snapshots a second the match publishes
+
+        return self.tickRate / self.snapshotInterval
+
+class SimPlayer():
+
+    # Holds the state of one player and applies the movement, turning and collision rules, with no pygame involved
+
+    def __init__(self, playerNo, grid, playerStats=None, arena=None):
+
+        self.alive = True
+        self.fullyDead = False
+
+        self.playerNo = playerNo
+
+        if arena is None:
+            arena = Arena()
+        if playerStats is None:
+            playerStats = arena.playerStats
+
+        self.arenaWidth = arena.width
+        self.arenaHeight = arena.height
+        self.tileSize = arena.tileSize
+
+        self.colour,self.width,self.height,self.x,self.y = playerStats[self.playerNo]
+
+        self.originalColour = self.colour
+
+        self.upFacingHeight = max(self.width, self.height)
+        self.upFacingWidth = min(self.width, self.height)
+
+        self.rectWidth = self.width # The collision box keeps its spawn size, only the drawn size changes on turning
+        self.rectHeight = self.height
+
+        self.xVel = 0
+        self.yVel = 0
+
+        self.speed = arena.speed
+
+        self.turnRequests = deque()
+        self.maxTurnRequests = 2
+
+        self.deathCounter = 0
+
+        self.lastInput = 0 # The sequence number of the last numbered command applied, so clients know which of their inputs have been seen
+
+        self.grid = grid
+
+    @property
+    def centerx(self):
+        return self.x + self.rectWidth // 2
+
+    @property
+    def centery(self):
+        return self.y + self.rectHeight // 2
+
+    def requestTurn(self, direction):
+
+        # Queues a turn if it is not along the current axis and there is room, returns if it was queued
+
+        if direction in ("Left", "Right"):
+            if self.xVel != 0:
+                return False
+        elif direction in ("Up", "Down"):
+            if self.yVel != 0:
+                return False
+        else:
+            return False
+
+        if len(self.turnRequests) >= self.maxTurnRequests:
+            return False
+
+        self.turnRequests.append(direction)
+        return True
+
+    def update(self):
+
+        # Called every tick of the game, handles movement updates and turning. The player is swept along a pixel at a time,
+        # so at any speed it stops at every tile centre it passes to turn, and is checked against every tile it enters.
+        # Returns the tile a trail was left on, or None if no trail was placed this tick. Speeds are at most a tile, so there is at most one
+
+        if not self.alive:
+            self.deathCounter += 1
+
+            self.fade()
+            return None
+
+        laidTile = None
+
+        for pixel in range(self.speed):
+            tile = self.move()
+
+            if tile is not None:
+                laidTile = tile
+            if not self.alive:
+                break
+
+        return laidTile
+
+    def move(self):
+
+        # Moves the player one pixel along its heading and applies the rules there, returns the tile a trail was left on or None
+
+        xStep = self.xVel // self.speed
+        yStep = self.yVel // self.speed
+
+        self.x += xStep
+        self.y += yStep
+
+        centerx = self.centerx
+        centery = self.centery
+        tileSize = self.tileSize
+
+        if self.x <= 0 or self.x >= self.arenaWidth-self.width or self.y <= 0 or self.y >= self.arenaHeight-self.height \
+                or self.grid.isOccupied(centerx // tileSize, centery // tileSize):
+            self.die()
+
+        elif centerx % tileSize == tileSize // 2 and centery % tileSize == tileSize // 2: # Creates a "grid" in a way, allowing for easier collision detection and trail placement,
+                                                                                         # note the player is in the middle of the square
+            if self.turnRequests:
+                self.turn(self.turnRequests.popleft())
+
+        elif (centerx // tileSize, centery // tileSize) != ((centerx - xStep) // tileSize, (centery - yStep) // tileSize):
+            tile = ((centerx - xStep) // tileSize, (centery - yStep) // tileSize)
+            self.grid.mark(tile[0], tile[1], self.playerNo)
+            return tile
+
+        return None
+
+    def fade(self):
+
+        # Sets the player's colour for how long it has been dead
+
+        first = self.originalColour[0] + self.deathCounter * (127.5-self.originalColour[0]) / FADE_TICKS
+        second = self.originalColour[1] + self.deathCounter * (127.5-self.originalColour[1]) / FADE_TICKS
+        third = self.originalColour[2] + self.deathCounter * (127.5-self.originalColour[2]) / FADE_TICKS
+
+        self.colour = (first, second, third)
+
+        if self.deathCounter > FADE_TICKS:
+            self.fullyDead = True
+
+    def turn(self, direction):
+
+        # Points the player in a new direction
+
+        if direction == "Left":
+            self.xVel = -1 * self.speed
+            self.yVel = 0
+            self.height = self.upFacingWidth
+            self.width = self.upFacingHeight
+
+        elif direction == "Right":
+            self.xVel = self.speed
+            self.yVel = 0
+            self.height = self.upFacingWidth
+            self.width = self.upFacingHeight
+
+        elif direction == "Up":
+            self.yVel = -1 * self.speed
+            self.xVel = 0
+            self.height = self.upFacingHeight
+            self.width = self.upFacingWidth
+
+        elif direction == "Down":
+            self.yVel = self.speed
+            self.xVel = 0
+            self.height = self.upFacingHeight
+            self.width = self.upFacingWidth
+
+    def heading(self):
+
+        # Returns the index in DIRECTIONS of the way the player is moving, or None if it hasn't started moving
+
+        if (self.xVel, self.yVel) == (0, 0):
+            return None
+        return VELOCITIES.index((self.xVel // self.speed, self.yVel // self.speed))
+
+    def getData(self):
+
+        # Returns the data clients need to draw this player, followed by what the player's own client needs to predict it:
+        # its motion (heading + 1, or 0 if not moving, plus DEAD_FLAG once dead), its queued turns (each direction + 1,
+        # the first in the low 4 bits) and the last input sequence number applied
+
+        heading = self.heading()
+        motion = (0 if heading is None else heading + 1) | (0 if self.alive else DEAD_FLAG)
+
+        turns = 0
+        for index, direction in enumerate(self.turnRequests):
+            turns |= (DIRECTIONS.index(direction) + 1) << (4 * index)
+
+        return (self.playerNo, self.deathCounter, self.centerx, self.centery, self.width, self.height, motion, turns, self.lastInput)
+
+    def loadData(self, data):
+
+        # Puts the player into the state given by getData, so a client can carry on simulating it from a server's snapshot
+
+        playerNo, self.deathCounter, centerx, centery, self.width, self.height, motion, turns, self.lastInput = data
+
+        self.x = centerx - self.rectWidth // 2
+        self.y = centery - self.rectHeight // 2
+
+        heading = motion & ~DEAD_FLAG
+        if heading:
+            self.xVel = VELOCITIES[heading - 1][0] * self.speed
+            self.yVel = VELOCITIES[heading - 1][1] * self.speed
+        else:
+            self.xVel = 0
+            self.yVel = 0
+
+        self.alive = not motion & DEAD_FLAG
+        if self.deathCounter:
+            self.fade()
+
+        self.turnRequests = deque()
+        while turns:
+            self.turnRequests.append(DIRECTIONS[(turns & 0xF) - 1])
+            turns >>= 4
+
+    def die(self):
+
+        # Kills the player, used when it hits something
+
+        self.alive = False
+
+class Simulation():
+
+    # The game rules for one arena. Everything is advanced by step(), which takes the commands received since the last
+    # tick, so the game can run behind a window, headless on a server, or as fast as possible for testing
+
+    def __init__(self, arena=None, gridCells=None, playerStats=None):
+        self.arena = arena if arena is not None else Arena()
+        self.maxPlayers = self.arena.maxPlayers
+        self.playerStats = playerStats if playerStats is not None else self.arena.playerStats # Each player slot's colour, size and spawn point
+        self.grid = OccupancyGrid(self.arena.gridWidth, self.arena.gridHeight, gridCells)
+        self.players = [None for x in range(self.maxPlayers)]
+
+        self.tick = 0
+
+        # What changed on the last step, for renderers and the network side
+        self.addedTiles = [] # (playerNo, x, y) for each new trail tile
+        self.clearedPlayers = [] # Players removed from the arena, along with their trails
+        self.deaths = [] # Players who died
+
+    def step(self, inputs=()):
+
+        # Advances the game by one tick. Inputs are (playerNo, command) pairs, commands being "Create Player", "Stop" or a direction
+
+        self.addedTiles = []
+        self.clearedPlayers = []
+        self.deaths = []
+
+        for playerNo, command in inputs:
+            self.applyCommand(playerNo, command)
+
+        for index, player in enumerate(self.players): # Remove players who have finished fading out
+            if player is not None and player.fullyDead:
+                self.grid.clearPlayer(index)
+                self.players[index] = None
+                self.clearedPlayers.append(index)
+
+        for player in self.players:
+            if player is None:
+                continue
+
+            wasAlive = player.alive
+            tile = player.update()
+
+            if tile is not None:
+                self.addedTiles.append((player.playerNo, tile[0], tile[1]))
+            if wasAlive and not player.alive: # Faster players can lay a tile and then crash in the same tick
+                self.deaths.append(player.playerNo)
+
+        self.tick += 1
+
+    def applyCommand(self, playerNo, command):
+
+        # Applies one command from a player's client. Inputs can end with a sequence number, such as "Left 12",
+        # which is recorded against the player once applied
+
+        name, _, sequence = command.rpartition(" ")
+
+        if name and sequence.isdigit():
+            command = name
+        else:
+            sequence = None
+
+        if command == "Create Player":
+            if self.players[playerNo] is not None: # Any old trail goes with the player being replaced
+                self.grid.clearPlayer(playerNo)
+                self.clearedPlayers.append(playerNo)
+            self.players[playerNo] = SimPlayer(playerNo, self.grid, self.playerStats, self.arena)
+
+        elif self.players[playerNo] is None: # Player died before the command arrived, just drop it
+            pass
+
+        elif command in DIRECTIONS:
+            self.players[playerNo].requestTurn(command)
+
+            if sequence is not None:
+                self.players[playerNo].lastInput = int(sequence) & 0xFFFF
+
+        elif command == "Stop":
+            if self.players[playerNo].alive:
+                self.players[playerNo].die()
+                self.deaths.append(playerNo)
+
+    def slotInUse(self, playerNo):
+
+        # Returns if a player slot is taken
+
+        return self.players[playerNo] is not None
+
+    def playerData(self):
+
+        # Returns the drawing data of every player currently in the arena
+
+        return [player.getData() for player in self.players if player is not None]
+
+    def loadState(self, tick, playerData, cells):
+
+        # Puts the whole game into a saved state: the tick, every player's getData tuple and the grid's cells
+
+        self.grid.loadCells(cells)
+
+        self.players = [None for x in range(self.maxPlayers)]
+        for data in playerData:
+            player = SimPlayer(data[0], self.grid, self.playerStats, self.arena)
+            player.loadData(data)
+            self.players[data[0]] = player
+
+        self.tick = tick
+
+        self.addedTiles = []
+        self.clearedPlayers = []
+        self.deaths = []
+
+class FixedTimestep():
+
+    # Keeps a simulation ticking at a fixed rate however often the loop around it comes round. The time since the last call is
+    # added to an accumulator and each whole tick's worth is a step due, so a slow frame delays ticks rather than slowing the game,
+    # and the loop can draw or publish at rates of its own. A loop that falls too far behind drops the ticks it can't catch up on
+
+    def __init__(self, rate, maxCatchUp=MAX_CATCH_UP):
+        self.tickLength = 1 / rate
+        self.maxTicks = max(1, round(maxCatchUp * rate)) # Most ticks advance() hands out at once
+        self.accumulator = 0
+        self.lastTime = time.perf_counter()
+
+        self.droppedTicks = 0 # Ticks skipped over because the loop fell too far behind
+
+    def advance(self):
+
+        # Adds the time since the last call and returns how many ticks are due, taking them out of the accumulator
+
+        now = time.perf_counter()
+        self.accumulator += now - self.lastTime
+        self.lastTime = now
+
+        due = int(self.accumulator / self.tickLength)
+        self.accumulator -= due * self.tickLength
+
+        if due > self.maxTicks:
+            self.droppedTicks += due - self.maxTicks
+            due = self.maxTicks
+
+        return due
+
+    def untilNextTick(self):
+
+        # Returns the seconds until another tick is due, 0 if one already is
+
+        return max(0, self.tickLength - self.accumulator - (time.perf_counter() - self.lastTime))
+
+    def wait(self):
+
+        # Sleeps until another tick is due
+
+        remaining = self.untilNextTick()
+        if remaining > 0:
+            time.sleep(remaining)
+
+
+'''SUBROUTINES'''
+
+def playerColour(playerNo):
+
+    # Returns a player slot's colour, the first four are the original ones and the rest step round the colour wheel by the golden angle
+    # so neighbouring slots never look alike
+
+    if playerNo < len(PLAYER_COLOURS):
+        return PLAYER_COLOURS[playerNo]
+
+    red, green, blue = colorsys.hsv_to_rgb((playerNo * 0.381966) % 1, 0.85, 1)
+    return (round(red * 255), round(green * 255), round(blue * 255))
+
+def parseArenaSize(text):
+
+    # Turns "WIDTH" or "WIDTHxHEIGHT" from the command line into a (width, height) pair of pixels
+
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height or width)
@@ -0,0 +1,248 @@
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+
+from GameSimulation import Arena, DIRECTIONS
+from Protocol import decodeSnapshot, decodeText, messageKind, readMessage, encodeRequest, SNAPSHOT_VERSION
+
+
+'''CLASSES'''
+
+class LoadStats():
+
+    # Collects the measurements of every bot
+
+    def __init__(self):
+        self.requestTimes = [] # Round trip time of every request, in seconds
+        self.snapshotArrivals = [] # (receive time, tick) of every snapshot received
+        self.requests = 0
+        self.bytesReceived = 0
+        self.errors = 0
+
+    def recordSnapshot(self, snapshot, receiveTime):
+        self.snapshotArrivals.append((receiveTime, decodeSnapshot(snapshot)[0]))
+
+class Bot():
+
+    # One headless client, talking to the server like MultiplayerTestClient's Network does.
+    # It can play by sending random turns, and either polls for snapshots or subscribes to them
+
+    def __init__(self, botNo, address, stats, args):
+        self.botNo = botNo
+        self.address = address
+        self.stats = stats
+        self.args = args
+        self.random = random.Random(args.seed + botNo)
+
+    async def run(self, endTime):
+
+        # Connects and plays until endTime
+
+        reader, writer = await asyncio.open_connection(*self.address)
+
+        try:
+            await readMessage(reader) # "Connected"
+
+            if self.botNo < self.args.players:
+                await self.command(reader, writer, "Create Player")
+
+            if self.args.mode == "subscribe":
+                streamTask = asyncio.create_task(self.readSubscription(endTime))
+
+            while time.perf_counter() < endTime:
+                frameStart = time.perf_counter()
+
+                if self.args.mode == "poll":
+                    await self.poll(reader, writer)
+
+                if self.botNo < self.args.players and self.random.random() < self.args.turn_rate:
+                    if self.args.no_acks: # Fire and forget, as the real client plays
+                        writer.write(encodeRequest(self.random.choice(DIRECTIONS)))
+                        self.stats.requests += 1
+                    else:
+                        await self.command(reader, writer, self.random.choice(DIRECTIONS))
+
+                await asyncio.sleep(max(0, 1 / self.args.rate - (time.perf_counter() - frameStart)))
+
+            if self.args.mode == "subscribe":
+                await streamTask
+
+            await self.command(reader, writer, "Disconnect")
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.stats.errors += 1
+
+        finally:
+            writer.close()
+
+    async def command(self, reader, writer, request):
+
+        # Sends a command answered in text, asking for an acknowledgement if it is an input, and times the round trip
+
+        start = time.perf_counter()
+        writer.write(encodeRequest(request, ack=True))
+        reply = await readMessage(reader)
+
+        self.stats.requestTimes.append(time.perf_counter() - start)
+        self.stats.requests += 1
+        self.stats.bytesReceived += len(reply)
+
+    async def poll(self, reader, writer):
+
+        # Asks for the latest snapshot, timing the round trip
+
+        start = time.perf_counter()
+        writer.write(encodeRequest("Data"))
+        snapshot = await readMessage(reader)
+
+        now = time.perf_counter()
+        self.stats.requestTimes.append(now - start)
+        self.stats.requests += 1
+        self.stats.bytesReceived += len(snapshot)
+        self.stats.recordSnapshot(snapshot, now)
+
+    async def readSubscription(self, endTime):
+
+        # Opens a second connection and reads the snapshots pushed down it until endTime
+
+        reader, writer = await asyncio.open_connection(*self.address)
+
+        try:
+            await readMessage(reader) # "Connected"
+            writer.write(encodeRequest("Subscribe"))
+            await readMessage(reader) # "Subscribed"
+
+            while time.perf_counter() < endTime:
+                try:
+                    snapshot = await asyncio.wait_for(readMessage(reader), max(0.01, endTime - time.perf_counter()))
+                except asyncio.TimeoutError:
+                    break
+
+                if messageKind(snapshot) != SNAPSHOT_VERSION:
+                    continue
+
+                self.stats.bytesReceived += len(snapshot)
+                self.stats.recordSnapshot(snapshot, time.perf_counter())
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.stats.errors += 1
+
+        finally:
+            writer.close()
+
+
+'''SUBROUTINES'''
+
+def percentile(values, fraction):
+
+    # Returns the value below which a fraction of the sorted values fall
+
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def report(stats, duration, arena):
+
+    # Prints the results of a run, against the rates of the server's arena
+
+    requestTimes = sorted(stats.requestTimes)
+
+    print(f"Requests: {stats.requests} ({stats.requests / duration:.0f}/s), errors: {stats.errors}, "
+          f"received {stats.bytesReceived / duration / 1024:.1f} KiB/s")
+
+    if requestTimes:
+        print("RTT ms: " + ", ".join(f"p{int(fraction*100)} {percentile(requestTimes, fraction)*1e3:.2f}" for fraction in (0.5, 0.9, 0.99))
+              + f", max {requestTimes[-1]*1e3:.2f}")
+
+    if not stats.snapshotArrivals:
+        return
+
+    print(f"Snapshots: {len(stats.snapshotArrivals)} ({len(stats.snapshotArrivals) / duration:.0f}/s across the bots, "
+          f"the server publishes {arena.snapshotRate():g}/s, one every {arena.snapshotInterval} ticks at {arena.tickRate} Hz)")
+
+    # Each snapshot's arrival time minus when its tick was due gives an offset, the smallest offset seen is taken as a fresh
+    # delivery and staleness is how much later than that each snapshot arrived
+    offsets = [receiveTime - tick / arena.tickRate for receiveTime, tick in stats.snapshotArrivals]
+    freshest = min(offsets)
+    staleness = sorted(offset - freshest for offset in offsets)
+
+    print("Staleness ms: " + ", ".join(f"p{int(fraction*100)} {percentile(staleness, fraction)*1e3:.2f}" for fraction in (0.5, 0.9, 0.99))
+          + f", max {staleness[-1]*1e3:.2f}")
+
+    # The first time each tick was seen by any bot shows the server's tick timing
+    firstSeen = {}
+    for receiveTime, tick in stats.snapshotArrivals:
+        if tick not in firstSeen or receiveTime < firstSeen[tick]:
+            firstSeen[tick] = receiveTime
+
+    ticks = sorted(firstSeen)
+    intervals = [(firstSeen[later] - firstSeen[earlier]) / (later - earlier) for earlier, later in zip(ticks, ticks[1:])]
+
+    if len(intervals) > 1:
+        print(f"Tick interval ms: mean {statistics.mean(intervals)*1e3:.2f}, jitter (stdev) {statistics.stdev(intervals)*1e3:.2f}, "
+              f"max {max(intervals)*1e3:.2f}, ticks seen {len(ticks)}")
+
+async def requestArena(address):
+
+    # Asks the server for its arena, whose tick rate says when each snapshot's tick was due
+
+    reader, writer = await asyncio.open_connection(*address)
+
+    try:
+        await readMessage(reader) # "Connected"
+        writer.write(encodeRequest("Arena"))
+        return Arena.fromDict(json.loads(decodeText(await readMessage(reader))))
+
+    finally:
+        writer.close()
+
+async def runBots(args):
+
+    # Starts every bot and waits for them all to finish, returns their stats and the server's arena
+
+    stats = LoadStats()
+    address = (args.host, args.port)
+    arena = await requestArena(address)
+    endTime = time.perf_counter() + args.duration
+
+    bots = [Bot(botNo, address, stats, args) for botNo in range(args.bots)]
+    results = await asyncio.gather(*[bot.run(endTime) for bot in bots], return_exceptions=True)
+
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Bot failed: {result!r}")
+            stats.errors += 1
+
+    return stats, arena
+
+
+'''MAIN'''
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Runs many headless bot clients against a local server and reports how it copes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--bots", type=int, default=20, help="how many clients to connect")
+    parser.add_argument("--players", type=int, default=4, help="how many of the bots try to create a player")
+    parser.add_argument("--mode", choices=("poll", "subscribe"), default="poll", help="ask for every snapshot or have them pushed")
+    parser.add_argument("--rate", type=float, default=60, help="frames per second each bot runs at")
+    parser.add_argument("--no-acks", action="store_true", help="send turns without waiting for them to be acknowledged")
+    parser.add_argument("--turn-rate", type=float, default=0.02, help="chance each frame of a playing bot turning")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to run for")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"Running {args.bots} bots in {args.mode} mode for {args.duration}s against {args.host}:{args.port}")
+
+    stats, arena = asyncio.run(runBots(args))
+    report(stats, args.duration, arena)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+import json
+import multiprocessing as mp
+import os
+import time
+from multiprocessing import shared_memory
+
+from GameSimulation import Simulation, FixedTimestep, RENDER_RATE
+from Protocol import encodeSnapshot, mergeTrailDeltas, snapshotCapacity
+from SharedSnapshot import SharedSnapshot
+from TickStats import RollingHistogram, PhaseTimer
+from Replay import ReplayRecorder
+from Bots import BotController, BOT_BUDGET
+
+
+'''CONSTANTS'''
+
+STATS_CAPACITY = 65536 # Room for a worker's stats as JSON
+STATS_PUBLISH_INTERVAL = 1 # Seconds between a worker publishing its stats
+TICK_PHASES = ("wait", "inputs", "bots", "step", "record", "publish", "render", "events")
+WINDOW_PHASES = ("render", "events") # Phases only timed when there is a window
+
+EMPTY_SLOT = 0 # Values of a match's slotsInUse
+PLAYER_SLOT = 1
+BOT_SLOT = 2 # Played by a bot, which gives it up to any person who joins
+
+
+'''CUSTOM PROCESSES'''
+
+class MatchWorker(mp.Process):
+
+    # Process running the game loops of some of the matches, all ticked together. There is one per core,
+    # so a host runs as many matches as its cores can tick in time rather than one per server
+
+    def __init__(self, workerNo, channels, ticked, sharedStats, stopEvent, recordPaths=None, statsLog=None, botCount=0, botBudget=BOT_BUDGET):
+        super().__init__(name=f"Worker {workerNo}")
+
+        self.workerNo = workerNo
+        self.channels = channels
+        self.ticked = ticked
+        self.sharedStats = sharedStats
+        self.stopEvent = stopEvent
+        self.recordPaths = recordPaths
+        self.statsLog = statsLog
+        self.botCount = botCount
+        self.botBudget = botBudget
+
+    def run(self):
+
+        matches = [Match(channels, self.recordPaths[index] if self.recordPaths else None, self.botCount, self.botBudget) for index, channels in enumerate(self.channels)]
+
+        runMatches(matches, self.ticked, self.sharedStats, self.stopEvent, statsLog=self.statsLog, workerNo=self.workerNo)
+
+        for match in matches:
+            match.close()
+
+
+'''CLASSES'''
+
+class MatchChannels():
+
+    # Everything the server and the game loop of one match share: the arena, the latest snapshot, the occupancy grid, the pipe inputs
+    # arrive down, which player slots are in use and which are claimed by people. Made by the main process before anything starts so every process gets them
+
+    def __init__(self, matchNo, arena):
+        self.matchNo = matchNo
+        self.arena = arena
+        self.maxPlayers = arena.maxPlayers
+
+        self.inputReceiver, self.inputSender = mp.Pipe(duplex=False) # Carries each tick's batch of (playerNo, command) inputs from the server
+        self.slotsInUse = mp.RawArray("b", arena.maxPlayers) # Holds who is in each player slot, one byte each in a single block so they are all written at once without locks
+        self.claimedSlots = mp.RawArray("b", arena.maxPlayers) # Holds if a connection owns each slot, written by the server so bots know to leave it
+
+        self.sharedGrid = shared_memory.SharedMemory(create=True, size=arena.gridWidth * arena.gridHeight) # Holds the game's occupancy grid, for keyframes
+
+        self.sharedSnapshot = SharedSnapshot(snapshotCapacity(arena.maxPlayers, arena.maxPlayers * arena.snapshotInterval)) # Holds the current snapshot to be sent to the clients on request,
+                                                                                                                  # with room for a tile from each player every tick it covers
+        self.sharedSnapshot.publish(encodeSnapshot(0, [])) # Clients asking before the first tick get an empty game
+
+    def close(self):
+
+        # Frees the shared memory, once every process has finished with it
+
+        self.sharedSnapshot.close()
+        self.sharedGrid.close()
+        self.sharedGrid.unlink()
+
+class Match():
+
+    # The game loop's side of one match: its simulation, its bots, and getting inputs in each tick and snapshots out every snapshotInterval ticks
+
+    def __init__(self, channels, recordPath=None, botCount=0, botBudget=BOT_BUDGET):
+        self.channels = channels
+        self.simulation = Simulation(channels.arena, channels.sharedGrid.buf) # Holds the actual game state
+        self.unpublished = [] # (addedTiles, clearedPlayers) of each tick since the last snapshot, which carries them all
+
+        self.bots = BotController(self.simulation, botCount, botBudget, seed=channels.matchNo) if botCount else None # Plays the slots nobody has joined
+
+        self.recorder = ReplayRecorder(recordPath, self.simulation) if recordPath else None # Records the inputs of every tick, for playing the match back later
+
+    def tick(self, phaseTimer):
+
+        # Takes the inputs sent since the last tick and steps the game, publishing a snapshot if one is due. Returns whether it published
+
+        inputs = []
+
+        inputReceiver = self.channels.inputReceiver
+        while inputReceiver.poll(): # Gather all player requests, sent by the server as one batch per tick
+            inputs.extend(inputReceiver.recv())
+
+        phaseTimer.lap("inputs")
+
+        if self.bots is not None: # Added to the inputs, so bots are recorded just like people
+            inputs.extend(self.bots.inputs(self.channels.claimedSlots))
+
+        phaseTimer.lap("bots")
+
+        simulation = self.simulation
+        simulation.step(inputs)
+
+        phaseTimer.lap("step")
+
+        if self.recorder is not None:
+            self.recorder.record(simulation, inputs)
+
+        phaseTimer.lap("record")
+
+        self.unpublished.append((simulation.addedTiles, simulation.clearedPlayers))
+
+        if simulation.tick % simulation.arena.snapshotInterval: # Snapshots land on whole multiples of the interval, so every process agrees which ticks have them
+            return False
+
+        botSlots = self.bots.slots() if self.bots is not None else ()
+        self.channels.slotsInUse[:] = [BOT_SLOT if index in botSlots else PLAYER_SLOT if simulation.slotInUse(index) else EMPTY_SLOT
+                                       for index in range(simulation.maxPlayers)]
+
+        addedTiles, clearedPlayers = mergeTrailDeltas(self.unpublished) if len(self.unpublished) > 1 else self.unpublished[0]
+        self.unpublished = []
+
+        snapshot = encodeSnapshot(simulation.tick, simulation.playerData(), addedTiles, clearedPlayers) # Encoded once here rather than by every client
+
+        self.channels.sharedSnapshot.publish(snapshot)
+
+        phaseTimer.lap("publish")
+
+        return True
+
+    def close(self):
+
+        # Finishes any recording and lets go of the shared grid so it can be freed
+
+        if self.recorder is not None:
+            self.recorder.close(self.simulation)
+
+        self.simulation.grid.cells = None
+
+
+'''SUBROUTINES'''
+
+def runMatches(matches, ticked, sharedStats, stopEvent, renderer=None, statsLog=None, workerNo=0, renderRate=RENDER_RATE):
+
+    # Ticks every match at the arena's tick rate until stopped, waking the server after every tick so it passes on the next inputs
+    # and any new snapshots, whatever the snapshot rate. With a renderer the first match is shown in its window, drawn at its own rate
+    # with everything that changed since the last frame, so drawing never holds the ticks back and the tick rate can be raised past the frame rate. Phases inside a match are timed once per match tick,
+    # so their histograms show the cost of one match's tick
+
+    tickRate = matches[0].simulation.arena.tickRate
+    timestep = FixedTimestep(tickRate)
+
+    phaseTimer = PhaseTimer(tuple(phase for phase in TICK_PHASES if not (renderer is None and phase in WINDOW_PHASES))) # How long each part of a tick takes
+    tickIntervals = RollingHistogram() # Time from one round of ticks to the next, which should stay close to one tick
+    overruns = 0 # Ticks that came due late, as the loop was busy when they should have run
+    lastTickTime = time.perf_counter()
+
+    frameLength = 1 / renderRate
+    nextFrame = time.perf_counter()
+    unrendered = [] # (addedTiles, clearedPlayers) of each tick of the shown match since its last frame
+    unrenderedDeaths = []
+
+    nextStatsPublish = time.perf_counter() + STATS_PUBLISH_INTERVAL
+    nextStatsLog = time.perf_counter() + statsLog if statsLog else None
+
+    running = True
+
+    try:
+        while running and not stopEvent.is_set():
+
+            phaseTimer.start()
+
+            wait = timestep.untilNextTick()
+            if renderer is not None:
+                wait = min(wait, nextFrame - time.perf_counter())
+            if wait > 0:
+                time.sleep(wait)
+
+            due = timestep.advance()
+
+            phaseTimer.lap("wait")
+
+            if due:
+                now = time.perf_counter()
+                tickIntervals.add(now - lastTickTime)
+                lastTickTime = now
+                overruns += due - 1
+
+            for tick in range(due):
+                for match in matches:
+                    match.tick(phaseTimer)
+
+                if renderer is not None:
+                    simulation = matches[0].simulation
+                    unrendered.append((simulation.addedTiles, simulation.clearedPlayers))
+                    unrenderedDeaths.extend(simulation.deaths)
+
+            if due:
+                ticked.notify()
+
+            if renderer is not None and time.perf_counter() >= nextFrame:
+                phaseTimer.skip()
+
+                renderer.draw(matches[0].simulation, (*mergeTrailDeltas(unrendered), unrenderedDeaths))
+                unrendered = []
+                unrenderedDeaths = []
+                phaseTimer.lap("render")
+
+                running = renderer.handleEvents()
+                phaseTimer.lap("events")
+
+                nextFrame = max(nextFrame + frameLength, time.perf_counter()) # A late frame is drawn straight away, but isn't made up for with extra ones
+
+            now = time.perf_counter()
+
+            if now >= nextStatsPublish: # Summarising sorts every window, so it is only done once a second rather than every tick
+                sharedStats.publish(str.encode(json.dumps({"worker": workerNo, "pid": os.getpid(), "matches": [match.channels.matchNo for match in matches],
+                                                           "tick": matches[0].simulation.tick if matches else 0, "tickRate": tickRate,
+                                                           "overruns": overruns, "droppedTicks": timestep.droppedTicks,
+                                                           "botSearches": sum(match.bots.searches for match in matches if match.bots is not None),
+                                                           "botReflexes": sum(match.bots.reflexes for match in matches if match.bots is not None),
+                                                           "interval": tickIntervals.summary(), "phases": phaseTimer.summary()})))
+                nextStatsPublish = now + STATS_PUBLISH_INTERVAL
+
+            if nextStatsLog is not None and now >= nextStatsLog:
+                interval = tickIntervals.summary()
+                print(f"Worker {workerNo}, {len(matches)} matches at {tickRate} Hz: interval {interval.get('meanUs', 0) / 1000:.2f}/{interval.get('maxUs', 0) / 1000:.2f}ms, "
+                      f"{overruns} overruns, {timestep.droppedTicks} dropped ticks. {phaseTimer.logLine()}")
+                nextStatsLog = now + statsLog
+
+    except KeyboardInterrupt: # The terminal's interrupt reaches every process, each worker finishes up and the main process stops the rest
+        pass
+
+    return running
+
+def assignMatches(matchCount, workerCount):
+
+    # Returns the match numbers each worker runs, spread as evenly as possible
+
+    return [list(range(workerNo, matchCount, workerCount)) for workerNo in range(workerCount)]
+
+def recordPath(path, matchNo, matchCount):
+
+    # Returns where to record a match, numbering the files when there is more than one match
+
+    if path is None or matchCount == 1:
+        return path
+
+    root, extension = os.path.splitext(path)
+    return f"{root}-{matchNo}{extension}"
@@ -1,16 +1,40 @@
-import pygame
-import socket
+import argparse
+import asyncio
+import json
+import os
 import multiprocessing as mp # Far easier to type
+import secrets
 import sys
+import time
+
+from Protocol import decodeSnapshot, encodeText, decodeRequests, decodeHello, \
+    snapshotCapacity, MAX_DATAGRAM_SIZE
+from SharedSnapshot import SharedSnapshot
+from TrailHistory import TrailHistory
+from TickStats import RollingHistogram
+from MatchWorker import MatchWorker, MatchChannels, Match, runMatches, assignMatches, recordPath, STATS_CAPACITY, PLAYER_SLOT, BOT_SLOT
+from GameSimulation import Arena, parseArenaSize, ARENA_SIZE, TILE_SIZE, MAX_PLAYERS, SPEED, TICK_RATE, RENDER_RATE
+from SpectatorRelay import SpectatorRelay, RELAY_PORT
+from Bots import BOT_BUDGET
+
+
+'''CONSTANTS'''
+
+MAX_SKIPPED_TICKS = 120 # A subscriber that cannot take a snapshot for this many ticks is dropped
+MAX_QUEUED_INPUTS = 4 # Most inputs one player can queue for a tick, more than a player can hold as turns, the rest are dropped
+STOP_POLL_INTERVAL = 0.25 # Most seconds the server waits on the workers before checking the stop event
 
 
 '''CUSTOM PROCESSES'''
 
 class ServerProcess(mp.Process):
 
-    # Process for the server to receive connections
+    # Process for the lobby that receives connections. Every connection, whichever match it is in, is served by one asyncio
+    # event loop behind one listening socket, while the matches themselves are ticked by the worker processes.
+    # Subscribers can also have their snapshots sent as UDP datagrams from the same port number, so a lost packet only loses
+    # that tick's snapshot rather than holding up every later one behind it. Everything else stays on the TCP connection
 
-    def __init__(self, playerQueues, playerQsInUse, playerDataArray, trailDataArray, name=None):
+    def __init__(self, channels, ticked, workerStats, name=None):
         super().__init__(name=name)
         
         print("Server Process Initialising")
@@ -20,342 +44,544 @@ class ServerProcess(mp.Process):
         self.server = '127.0.0.1' #"192.168.1.254" # Fred = "192.168.1.254" # Bert = "192.168.1.7" # School = "192.168.104.48"
         self.port = 5555
         
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.setblocking(0)
-        
         self.connectedClients = [] 
-        self.clientProcesses = []
-        
-        self.running = True
+        self.datagramTokens = {} # Maps the token each UDP subscriber was given to its ConnectedClient
+        self.datagrams = None # The UDP endpoint snapshots are sent from, if it could be opened
+
+        self.stopEvent = mp.Event() # Shared with the main process and workers, so stop() works from any side
 
-        self.trailDataArray = trailDataArray
+        self.matches = [HostedMatch(matchChannels) for matchChannels in channels]
 
-        self.playerDataArray = playerDataArray
-        self.playerQueues = playerQueues
-        self.playerQsInUse = playerQsInUse
+        self.ticked = ticked
 
+        self.workerStats = workerStats # Each worker's tick phase timings, published as JSON about once a second
+        self.readWait = RollingHistogram() # Time spent copying snapshots out of shared memory
+        self.broadcastTimes = RollingHistogram() # Time spent handing each snapshot to the subscribers
+        self.startTime = time.time()
 
     def run(self):
 
         print("Running")
 
-        # Opens server to connections
-
         try:
-            self.socket.bind((self.server, self.port))
-            self.socket.settimeout(5)
-            
+            asyncio.run(self.serve())
+        except KeyboardInterrupt: # The terminal's interrupt reaches every process, the main process handles it
+            pass
 
-        except socket.error as e:
+        print("Server shutting down...")
+
+    async def serve(self):
+
+        # Opens server to connections, then runs until stopped
+
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+
+        try:
+            server = await asyncio.start_server(self.handleClient, self.server, self.port)
+        except OSError as e:
             print(str(e))
-        
-        else:
-            self.socket.listen(4)
-
-            print("Server started, awaiting connection")
-
-            while self.running:
-                try:
-                    connection, address = self.socket.accept() # Accept any incoming connections
-                except socket.timeout:
-                    pass
-                else:
-                    if not self.running:
-                        connection.close()
-                    else:
-                        print(f"Connected to {address}")
-    
-                        self.connectedClients.append(ConnectedClient(connection, address))
-    
-                        self.clientProcesses.append(ClientProcess(self.connectedClients[-1], self.playerQueues, self.playerQsInUse,
-                                                                 self.playerDataArray, self.trailDataArray, name=f"Client{len(self.connectedClients)}"))
-                        self.clientProcesses[-1].start()
-            
-                        for clientProcess in self.clientProcesses:
-                            if not clientProcess.is_alive():
-                                index = self.clientProcesses.index(clientProcess)
-                                self.connectedClients.pop(index)
-                                self.clientProcesses.pop(index)
+            return
+
+        try:
+            self.datagrams, protocol = await self.loop.create_datagram_endpoint(lambda: SnapshotDatagrams(self), local_addr=(self.server, self.port))
+        except OSError as e: # Subscribers just stay on TCP
+            print(f"UDP unavailable: {e}")
+
+        print(f"Server started with {len(self.matches)} matches, awaiting connection")
+
+        watcher = asyncio.create_task(self.watchSnapshots())
+
+        async with server:
+            await self.stopped.wait()
+
+        await watcher
+
+        if self.datagrams is not None:
+            self.datagrams.close()
+
+        for client in list(self.connectedClients): # Disconnects all clients
+            client.writer.close()
+
+    async def watchSnapshots(self):
+
+        # Waits for the workers to signal a tick, or stop() to signal shutdown. The wait runs on one of the loop's
+        # executor threads, as not every platform's event loop can watch a pipe from another process
+
+        while not self.stopEvent.is_set():
+            if await self.loop.run_in_executor(None, self.ticked.wait, STOP_POLL_INTERVAL):
+                self.workersTicked()
+
+        self.stopped.set()
+
+    def workersTicked(self):
+
+        # Called whenever a worker signals it has ticked. Each worker wakes the server once a tick for all its matches,
+        # whatever the snapshot rate, so inputs go on to every match within a tick and every match is checked for a new publish
+
+        for match in self.matches:
+            match.sendInputs()
+
+            publishCount = match.sharedSnapshot.publishCount()
+            if publishCount == match.publishCount:
+                continue
+            match.publishCount = publishCount
+
+            snapshot = self.readSnapshot(match)
+            tick, playerData, addedTiles, clearedPlayers = decodeSnapshot(snapshot)
+
+            if tick != match.trailHistory.lastTick:
+                match.trailHistory.add(tick, addedTiles, clearedPlayers)
+
+                start = time.perf_counter()
+                self.broadcast(match, snapshot)
+                self.broadcastTimes.add(time.perf_counter() - start)
+
+    def broadcast(self, match, snapshot):
+
+        # Sends a new snapshot to every subscriber of a match. The snapshot was encoded once by the worker and is shared by all of them.
+        # A subscriber that still has an earlier snapshot waiting to be sent skips this one, and is dropped if it stays that far behind.
+        # UDP subscribers are sent every snapshot as a datagram once their hello has arrived, there is nothing to wait behind
+
+        for client in list(match.subscribers):
+            if client.datagramToken is not None:
+                if client.datagramAddress is not None:
+                    self.datagrams.sendto(snapshot, client.datagramAddress)
+                    client.bytesOut += len(snapshot)
+                    client.datagramsOut += 1
+
+            elif client.writer.transport.get_write_buffer_size() > 0:
+                client.skippedTicks += match.arena.snapshotInterval
+                if client.skippedTicks > MAX_SKIPPED_TICKS:
+                    print(f"Dropping slow subscriber {client.address}")
+                    match.subscribers.remove(client)
+                    client.writer.close()
+            else:
+                client.skippedTicks = 0
+                client.send(snapshot)
+
+    def readSnapshot(self, match, client=None):
+
+        # Returns a copy of the latest snapshot published for a match, reading it never blocks the worker.
+        # The time taken is recorded, and against the client too if it was read for one
+
+        start = time.perf_counter()
+        snapshot = match.sharedSnapshot.read()
+        waited = time.perf_counter() - start
+
+        self.readWait.add(waited)
+        if client is not None:
+            client.readWait.add(waited)
+
+        return snapshot
+
+    def findMatch(self):
+
+        # Matchmaking, returns the match a new player should join. Matches already being played are filled first so players
+        # have opponents, then empty ones in order. Returns None if every match is full
+
+        openMatches = [match for match in self.matches if match.freeSlot() is not None]
+
+        if not openMatches:
+            return None
+
+        return max(openMatches, key=lambda match: match.playerCount())
+
+    def watchedMatch(self, client):
+
+        # Returns the match a connection's queries are about, the first match until it joins or watches another
+
+        return client.match if client.match is not None else self.matches[0]
+
+    def matchList(self):
+
+        # Returns every match's players and subscribers as JSON, for clients choosing one to watch
+
+        return json.dumps([{"match": match.matchNo + 1, "tick": match.trailHistory.lastTick, "players": match.playerCount(), "bots": match.botCount(),
+                            "maxPlayers": match.arena.maxPlayers,
+                            "arena": f"{match.arena.width}x{match.arena.height}", "subscribers": len(match.subscribers)} for match in self.matches])
+
+    def stats(self):
+
+        # Returns the server's stats as JSON: every worker's tick phases, the server's own timings and every connection's counters
+
+        workers = []
+        for sharedStats in self.workerStats:
+            tickStats = sharedStats.read()
+            workers.append(json.loads(tickStats) if tickStats else None)
+
+        return json.dumps({
+            "uptime": round(time.time() - self.startTime, 1),
+            "matches": json.loads(self.matchList()),
+            "workers": workers,
+            "server": {
+                "connections": len(self.connectedClients),
+                "subscribers": sum(len(match.subscribers) for match in self.matches),
+                "snapshotRead": self.readWait.summary(),
+                "broadcast": self.broadcastTimes.summary(),
+            },
+            "clients": [dict(client.stats(), subscribed=any(client in match.subscribers for match in self.matches)) for client in self.connectedClients],
+        })
+
+    async def handleClient(self, reader, writer):
+
+        # Handles a connected client until it disconnects. Requests are framed, so however they are split or
+        # batched into packets, every whole one received is answered in order before waiting for more
+
+        client = ConnectedClient(reader, writer, writer.get_extra_info("peername"))
+        self.connectedClients.append(client)
+
+        print(f"Connected to {client.address}")
+
+        client.reply("Connected") # Show the client has connected
+
+        buffer = bytearray()
+        connected = True
+
+        try:
+            while connected and not self.stopEvent.is_set():
+
+                data = await reader.read(65536) # Recieve data
+
+                if not data: # End once the client disconnects
+                    break
 
-        finally:
+                client.bytesIn += len(data)
+                buffer += data
 
-            # Ends server no matter what
+                requests, used = decodeRequests(buffer)
+                del buffer[:used]
 
-            print("Server shutting down...")
+                for request, ack in requests:
+                    client.requests += 1
+                    if not self.handleRequest(client, request, ack):
+                        connected = False
+                        break
+
+                await writer.drain()
+
+        except (ConnectionError, ValueError) as e: # ValueError covers malformed requests, including bad UTF-8
+            print("Error:", e)
+
+        print(f"Lost connection to {client.address}")
+
+        self.connectedClients.remove(client)
+        self.datagramTokens.pop(client.datagramToken, None)
+        for match in self.matches:
+            if client in match.subscribers:
+                match.subscribers.remove(client)
+
+        if client.playerNo is not None:
+            client.match.pendingInputs.append((client.playerNo, "Stop")) # Delete the relevant player
+            client.match.release(client.playerNo)
+
+        writer.close()
+
+    def handleRequest(self, client, request, ack=False):
+
+        # Answers one request from a client, returns False once the client should be disconnected.
+        # Inputs for the player are only answered if the client asked for an acknowledgement
+
+        if request == "Data": # Send the latest snapshot to the client, it is already encoded so is sent as is
+            client.send(self.readSnapshot(self.watchedMatch(client), client))
+
+        elif request == "Keyframe": # Send the whole board, for clients joining or resynchronising
+            client.send(self.watchedMatch(client).keyframe())
+
+        elif request.startswith("Trail "): # Send the trail changes after a tick, for clients that missed some
+            match = self.watchedMatch(client)
             try:
-                self.stop()
-            except Exception: # While normally this is terrible practice, this is ok in this context
-                pass
+                client.send(match.trailSince(int(request.split(" ", 1)[1])))
+            except ValueError:
+                client.send(match.keyframe())
+
+        elif request.startswith("Watch "): # Make this connection's queries and subscription about another match, numbered from 1
             try:
-                self.socket.close()
-            except Exception: # See above comment
-                pass
+                matchNo = int(request.split(" ", 1)[1]) - 1
+            except ValueError:
+                matchNo = -1
+
+            if client.playerNo is not None:
+                client.reply(f"Playing in Match {client.match.matchNo+1}")
+            elif 0 <= matchNo < len(self.matches):
+                self.moveSubscription(client, self.matches[matchNo])
+                client.match = self.matches[matchNo]
+                client.reply(f"Watching Match {matchNo+1}")
+            else:
+                client.reply(f"No Match {request.split(' ', 1)[1]}")
+
+        elif request.startswith("Rate "): # Only relays thin out updates, the server pushes every snapshot, so it answers with the rate it sends at
+            client.reply(f"Rate {self.watchedMatch(client).arena.snapshotRate():g}")
+
+        elif request == "Arena": # Send the size and player slots of the match being played or watched, as JSON
+            client.reply(json.dumps(self.watchedMatch(client).arena.toDict()))
+
+        elif request == "Matches": # Send every match's player counts, for choosing one to watch
+            client.reply(self.matchList())
+
+        elif request == "Stats": # Send the tick timings and connection counters, for watching a live server
+            client.reply(self.stats())
+
+        elif request == "Subscribe": # Turn this connection into a stream of snapshots pushed as each is published
+            client.reply("Subscribed")
+            self.datagramTokens.pop(client.datagramToken, None)
+            client.datagramToken = None
+            client.datagramAddress = None
+            match = self.watchedMatch(client)
+            if client not in match.subscribers:
+                match.subscribers.append(client)
 
-            socket.close()
+        elif request == "Subscribe UDP": # Push snapshots as datagrams, once the client sends a hello with the token it is given
+            match = self.watchedMatch(client)
+            if self.datagrams is None or snapshotCapacity(match.arena.maxPlayers, match.arena.maxPlayers * match.arena.snapshotInterval) > MAX_DATAGRAM_SIZE:
+                client.reply("Subscribed") # Over TCP instead
+            else:
+                if client.datagramToken is None:
+                    client.datagramToken = secrets.randbits(64)
+                    self.datagramTokens[client.datagramToken] = client
+                client.reply(f"Subscribed UDP {client.datagramToken}")
+            if client not in match.subscribers:
+                match.subscribers.append(client)
+
+        elif request == "Disconnect":
+            client.reply("Disconnecting...") # Disconnect client
+            print(f"Disconnecting {client.address}")
+            return False
+
+        elif request == "Create Player": # Create the client's relative player, in whichever match matchmaking picks
+            if client.playerNo is None:
+                match = self.findMatch()
+                if match is not None:
+                    client.playerNo = match.freeSlot()
+                    match.claim(client.playerNo)
+                    self.moveSubscription(client, match)
+                    client.match = match
+                    match.pendingInputs.append((client.playerNo, request)) # Only when the slot is new, asking again must not reset a player mid-round
+
+            if client.playerNo is None:
+                client.reply("Spectator")
+            else:
+                client.reply(f"Created Player {client.playerNo+1} in Match {client.match.matchNo+1}")
+
+        elif client.playerNo is None:
+            if ack:
+                client.reply(f"No player for request of {request}")
+
+        elif client.match.queueInput(client.playerNo, request): # Pass unessential requests that do not require the server to the match's worker
+            if ack:
+                client.reply(f"Executing request of {request}")
+
+        elif ack:
+            client.reply(f"Too many requests, dropped {request}")
+
+        return True
+
+    def datagramReceived(self, data, address):
+
+        # Notes where a UDP subscriber's snapshots should go. Hellos keep coming while it is subscribed, so a changed address is followed
+
+        token = decodeHello(data)
+        client = self.datagramTokens.get(token)
+
+        if client is not None:
+            client.datagramAddress = address
+            client.bytesIn += len(data)
+
+    def moveSubscription(self, client, match):
+
+        # Keeps a subscribed connection subscribed when it changes match
+
+        for otherMatch in self.matches:
+            if otherMatch is not match and client in otherMatch.subscribers:
+                otherMatch.subscribers.remove(client)
+                match.subscribers.append(client)
 
     def stop(self):
 
         # Stops the server and disconnects all clients
 
-        for process in self.clientProcesses:
-            process.stop()
+        self.stopEvent.set()
+        self.ticked.notify() # Wakes the event loop so it sees the stop straight away
 
-        self.running = False
 
-class ClientProcess(mp.Process):
+'''CLASSES'''
 
-    # Handles a connected client
+class HostedMatch():
 
-    def __init__(self, client, playerQueues, playerQsInUse, playerDataArray, trailDataArray, name=None):
-        super().__init__(name=name)
-        self.client = client
-        self.running = True
-        self.playerQueues = playerQueues
-        self.playerQsInUse = playerQsInUse
-        self.playerDataArray = playerDataArray
+    # The server's side of one match: who is playing and watching it, the inputs waiting to go to its worker
+    # and its recent trail changes for clients catching up
 
-        self.isSpectator = True
-        self.playerNo = None
+    def __init__(self, channels):
+        self.matchNo = channels.matchNo
+        self.arena = channels.arena
 
-    def run(self):
-        
-        self.client.connection.sendall(str.encode("Connected")) # Show the client has connected
+        self.sharedSnapshot = channels.sharedSnapshot
+        self.sharedGrid = channels.sharedGrid # The match's occupancy grid, read directly when a client needs a keyframe
+        self.inputSender = channels.inputSender # One end of a pipe to the worker, each tick's inputs are sent down it together
+        self.slotsInUse = channels.slotsInUse
+        self.claimedSlots = channels.claimedSlots # Player numbers owned by a connection, so two clients can't claim one player before the worker notices
 
-        request = ""
-        while self.running:
-            try:
+        self.subscribers = []
+        self.pendingInputs = [] # (playerNo, command) for every input received since the last tick
+        self.queuedCounts = {} # How many inputs each player has in pendingInputs, so one client can't flood the tick
 
-                data = self.client.connection.recv(2048) # Recieve data
+        self.trailHistory = TrailHistory(self.arena.snapshotInterval)
+        self.publishCount = None
 
-                if not data: # End while loop once the client disconnects
-                    break
+    def freeSlot(self):
 
-                request = data.decode("utf-8")
+        # Returns the first player number nobody is using, or failing that the first one a bot is playing, which it hands over.
+        # None if the match is full of people
 
-                if request == "Data": # Send sprite data to client
-                    self.playerDataArray._lock.acquire()
-                    if self.playerDataArray[:].split('\x00')[0] == "":
-                        self.client.connection.sendall(str.encode("N/A"))
-                    else:
-                        self.client.connection.sendall(str.encode(self.playerDataArray[:].split('\x00')[0]))
-                    self.playerDataArray._lock.release()
+        slots = [index for index, inUse in enumerate(self.slotsInUse) if inUse != PLAYER_SLOT and not self.claimedSlots[index]]
+        empty = [index for index in slots if self.slotsInUse[index] != BOT_SLOT]
 
-                elif request == "Disconnect":
-                    self.client.connection.sendall(str.encode("Disconnecting...")) # Disconnect client
-                    self.client.playerQueue.put("Stop")
-                    print(f"Disconnecting {self.client.address}")
-                    break
-                elif request == "Create Player": # Create the client's relative player
-                    for index, inUse in enumerate(self.playerQsInUse):
-                        if not inUse.value:
-                            self.playerNo = index
-                            break
-
-                    if self.playerNo is None:
-                        self.isSpectator = True
-                        self.client.connection.send(str.encode("Spectator"))
-                    else:
-                        self.client.connection.send(str.encode(f"Created Player {self.playerNo+1}"))
-                        self.client.playerQueue = self.playerQueues[self.playerNo]
-                        self.client.playerQueue.put(request)
-                else:
-                    self.client.connection.sendall(str.encode(f"Executing request of {request}"))
-                    self.client.playerQueue.put(request) # Pass unessential requests that do not require the client process to the main process
-               
-            except socket.timeout:
-                pass
-
-            except Exception as e:
-                print("Error:", e)
-                break
-    
-        print(f"Lost connection to {self.client.address}")
+        return (empty or slots or [None])[0]
 
-        try:
-            self.client.playerQueue.put("Stop") # Delete the relevant player
-        except Exception:
-            pass
+    def claim(self, playerNo):
+        self.claimedSlots[playerNo] = 1
 
-        self.client.connection.close()
+    def release(self, playerNo):
+        self.claimedSlots[playerNo] = 0
 
-    def stop(self):
+    def playerCount(self):
+        return sum(self.claimedSlots)
 
-        # Simply stops the running loop
+    def botCount(self):
+        return sum(inUse == BOT_SLOT and not claimed for inUse, claimed in zip(self.slotsInUse, self.claimedSlots))
 
-        self.running = False
+    def queueInput(self, playerNo, command):
 
+        # Queues one of a player's inputs for the next tick, returns False if it was dropped as the player already has enough queued
 
-'''CLASSES'''
+        if self.queuedCounts.get(playerNo, 0) >= MAX_QUEUED_INPUTS:
+            return False
 
-class ConnectedClient():
+        self.queuedCounts[playerNo] = self.queuedCounts.get(playerNo, 0) + 1
+        self.pendingInputs.append((playerNo, command))
 
-    # This Class holds one connected client's connection, address, and (if applicable) linked player's queue
+        return True
 
-    def __init__(self, connection, address):
-        self.connection = connection
-        self.address = address
-        self.playerQueue = None
+    def sendInputs(self):
 
-class TrailObject(pygame.sprite.Sprite):
+        # Passes every input received since the last tick to the worker in one go, it picks them up just before its next step
 
-    # Handles one individual part of a trail, just a sprite
+        if self.pendingInputs:
+            self.inputSender.send(self.pendingInputs)
+            self.pendingInputs = []
+            self.queuedCounts = {}
 
-    def __init__(self, playerNo, colour, x, y):
-        super().__init__()
-        self.playerNo = playerNo
-        self.colour = colour
-        self.image = pygame.Surface([4,4])
-        self.image.fill(self.colour)
-        self.rect = self.image.get_rect()
-        self.rect.x = x
-        self.rect.y = y
+    def trailSince(self, tick):
 
-    def draw(self, surface):
+        # Returns the trail changes after a tick as one delta, or a keyframe if the history doesn't go back that far
 
-        # Draws the sprite to a surface
+        delta = self.trailHistory.since(tick)
 
-        image = pygame.Surface([4,4])
-        image.fill(self.colour)
+        return delta if delta is not None else self.keyframe()
 
-        surface.blit(image, (self.rect.x, self.rect.y))
+    def keyframe(self):
 
-class Player(pygame.sprite.Sprite):
+        # Returns the whole board as a keyframe. The worker may have moved on while the grid is copied, which still leaves a correct keyframe
 
-    obstacleTiles = []
-    playerStats = (((255,0,0),12,8,4,198), ((0,0,255),12,8,384,198), ((0,255,0),8,12,198,4), ((255,255,0),8,12,198,384))
+        width, height = self.arena.gridWidth, self.arena.gridHeight
 
-    # Main Player class for the game
+        return self.trailHistory.keyframe(width, height, lambda: bytes(self.sharedGrid.buf[:width * height]))
 
-    def __init__(self, playerNo, trailSpriteGroup):
-        super().__init__()
+class SnapshotDatagrams(asyncio.DatagramProtocol):
 
-        self.alive = True
-        self.fullyDead = False
-        
-        self.playerNo = playerNo
+    # The server's UDP endpoint. Snapshots go out of it, and the only datagrams that come in are subscribers' hellos
 
-        self.colour,self.width,self.height,x,y = Player.playerStats[self.playerNo]
+    def __init__(self, server):
+        self.server = server
 
-        self.originalColour = self.colour
+    def datagram_received(self, data, address):
+        self.server.datagramReceived(data, address)
 
-        self.upFacingHeight = 12
-        self.upFacingWidth = 8
+    def error_received(self, e): # Such as a subscriber's port having closed, which the TCP connection will show soon enough
+        pass
 
-        self.rect = pygame.Rect(x,y,self.width,self.height)
-        
+class WakePipe():
 
-        self.xVel = 0
-        self.yVel = 0
+    # A pipe used to wake the server from the game loops. It is made of multiprocessing's own pipe and a shared flag, so it
+    # reaches processes that are spawned rather than forked. Notifying never fills the pipe: the flag is set while a
+    # wake up is waiting, and the server has not caught up with it yet so another is not needed
 
-        self.speed = 1
-        
-        self.turnRequests = mp.Queue(2)
+    def __init__(self):
+        self.readEnd, self.writeEnd = mp.Pipe(duplex=False)
+        self.waiting = mp.RawValue("b", 0)
 
-        self.data = ""
+    def notify(self):
 
-        self.deathCounter = 0
+        # Signals the reading side
 
-        self.trailSpriteGroup = trailSpriteGroup
-    
-    def update(self):
+        if not self.waiting.value:
+            self.waiting.value = 1
+            self.writeEnd.send_bytes(b"\x00")
 
-        # Called every frame of the game, handles movement updates and turning
-        
-        if self.alive:
-
-            self.rect.x += self.xVel
-            self.rect.y += self.yVel
-
-            if self.rect.x <= 0 or self.rect.x >= 404-self.width or self.rect.y <= 0 or self.rect.y >= 404-self.height \
-                    or (self.rect.centerx // 4, self.rect.centery // 4) in Player.obstacleTiles:
-                self.die()
-
-            elif self.rect.centerx % 4 == 2 and self.rect.centery % 4 == 2: # Creates a "grid" in a way, allowing for easier collision detection and trail placement, 
-                                                                            # note the player is in the middle of the square
-            
-                invalidTurn = True
-            
-                while invalidTurn and not self.turnRequests.empty():
-
-                    currentTurn = self.turnRequests.get()
-
-                    if currentTurn == "Left":
-                        self.xVel = -1 * self.speed
-                        self.yVel = 0
-                        invalidTurn = False
-                        self.height = self.upFacingWidth
-                        self.width = self.upFacingHeight
-
-                    elif currentTurn == "Right":
-                        self.xVel = self.speed
-                        self.yVel = 0
-                        invalidTurn = False
-                        self.height = self.upFacingWidth
-                        self.width = self.upFacingHeight
-
-                    elif currentTurn == "Up":
-                        self.yVel = -1 * self.speed
-                        self.xVel = 0
-                        invalidTurn = False
-                        self.height = self.upFacingHeight
-                        self.width = self.upFacingWidth
-
-                    elif currentTurn == "Down":
-                        self.yVel = self.speed
-                        self.xVel = 0
-                        invalidTurn = False
-                        self.height = self.upFacingHeight
-                        self.width = self.upFacingWidth
-
-            elif (self.rect.centerx // 4, self.rect.centery // 4) != ((self.rect.centerx - self.xVel) // 4, (self.rect.centery - self.yVel) // 4):
-                Player.obstacleTiles.append(((self.rect.centerx - self.xVel) // 4, (self.rect.centery - self.yVel) // 4))
-                self.trailSpriteGroup.add(TrailObject(self.playerNo, self.colour, (self.rect.centerx - self.xVel) // 4 * 4, (self.rect.centery - self.yVel) // 4 * 4))
-
-
-        else:
-            self.deathCounter += 1
-            
-            first = self.originalColour[0] + self.deathCounter * (127.5-self.originalColour[0]) / 60
-            second = self.originalColour[1] + self.deathCounter * (127.5-self.originalColour[1]) / 60
-            third = self.originalColour[2] + self.deathCounter * (127.5-self.originalColour[2]) / 60
-
-            self.colour = (first, second, third)
-
-            if self.deathCounter > 60:
-                self.fullyDead = True
+    def wait(self, timeout=None):
 
-        
-    def getData(self):
+        # Blocks until signalled or the timeout runs out, then clears all waiting signals. Returns whether it was signalled
+
+        if not self.readEnd.poll(timeout):
+            return False
+
+        while self.readEnd.poll():
+            self.readEnd.recv_bytes()
+        self.waiting.value = 0 # Only once the pipe is empty, so a wake up is never left unsent while the flag says one is waiting
 
-        # Returns and sets an attribute to a string of relevant data to send to clients
+        return True
 
-        self.data = ""
+class ConnectedClient():
 
-        dataTuple = (self.playerNo, self.deathCounter, self.rect.centerx, self.rect.centery, self.width, self.height)
+    # This Class holds one connected client's stream, address, and (if applicable) linked player number
 
-        for index, item in enumerate(dataTuple):
-            self.data += str(item)
-            if index != len(dataTuple)-1:
-                self.data += ","
+    def __init__(self, reader, writer, address):
+        self.reader = reader
+        self.writer = writer
+        self.address = address
+        self.playerNo = None
+        self.match = None # The HostedMatch this client plays in or watches
+        self.skippedTicks = 0 # How many ticks of snapshots in a row this client has been too slow to take, when subscribed
+        self.datagramToken = None # Given when subscribing over UDP, the client's hellos carry it
+        self.datagramAddress = None # Where UDP snapshots are sent, once a hello has arrived
 
-        return self.data
+        self.connectTime = time.time()
+        self.bytesIn = 0
+        self.bytesOut = 0
+        self.requests = 0
+        self.datagramsOut = 0
+        self.readWait = RollingHistogram() # Time spent reading snapshots from shared memory for this client
 
+    def send(self, data):
 
-    def draw(self, surface):
+        # Queues data to be sent to the client, counting it
 
-        # Draws the sprite to a surface
+        self.writer.write(data)
+        self.bytesOut += len(data)
 
-        image = pygame.Surface([self.width,self.height])
-        image.fill(self.colour)
+    def reply(self, text):
 
-        surface.blit(image, (self.rect.centerx - self.width/2, self.rect.centery - self.height / 2))
+        # Sends the client a text reply
 
-    def die(self):
-        
-        # Kills the sprite, used when it hits something
+        self.send(encodeText(text))
+
+    def stats(self):
 
-        self.alive = False
-        pygame.mixer.Sound.play(pygame.mixer.Sound(__file__.rsplit("\\",1)[0]+"\Audio\Death.wav"))
+        # Returns this connection's counters
+
+        return {
+            "address": f"{self.address[0]}:{self.address[1]}" if self.address else None,
+            "match": self.match.matchNo if self.match is not None else None,
+            "playerNo": self.playerNo,
+            "connected": round(time.time() - self.connectTime, 1),
+            "requests": self.requests,
+            "bytesIn": self.bytesIn,
+            "bytesOut": self.bytesOut,
+            "skippedTicks": self.skippedTicks,
+            "udp": self.datagramToken is not None,
+            "datagramsOut": self.datagramsOut,
+            "snapshotRead": self.readWait.summary(),
+        }
 
 '''SUBROUTINES'''
 
@@ -364,129 +590,99 @@ class Player(pygame.sprite.Sprite):
 
 def main():
 
-    pygame.mixer.init()
-
-    playerQueues = [mp.Queue() for x in range(4)] # Holds intruction queues for each of the 4 players
-    playerQsInUse = [mp.Value("i", False) for x in range(4)] # Holds if the above queues are in use, note that conversion between c_int and boolean is done automatically
-
-    players = [None for x in range(4)] # Holds the actual player objects
-    
-    currentPlayerDataArray = mp.Array("u", 59) # Holds the current player data to be sent to the clients on request
+    parser = argparse.ArgumentParser(description="Runs the matches and the lobby server clients connect to")
+    parser.add_argument("--headless", action="store_true", help="run with no window or sound, without even importing pygame, for servers without a display")
+    parser.add_argument("--matches", type=int, default=1, help="how many matches to host at once")
+    parser.add_argument("--arena", default=str(ARENA_SIZE), metavar="WIDTH[xHEIGHT]", help="size of each arena in pixels")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE, help="size of a trail tile in pixels, the arena must be a whole number of them")
+    parser.add_argument("--max-players", type=int, default=MAX_PLAYERS, help="how many players each match holds, spawn points are spread round the edges")
+    parser.add_argument("--speed", type=int, default=SPEED, help="pixels players move each tick, up to the tile size")
+    parser.add_argument("--tick-rate", type=int, default=TICK_RATE, help="ticks a second the matches are simulated at")
+    parser.add_argument("--snapshot-rate", type=float, help="snapshots a second sent to clients, rounded to a whole number of ticks apart. Every tick by default")
+    parser.add_argument("--render-rate", type=float, default=RENDER_RATE, help="frames a second the window is drawn at, independent of the tick rate")
+    parser.add_argument("--workers", type=int, help="how many processes tick the matches, one per core up to the number of matches by default")
+    parser.add_argument("--record", metavar="PATH", help="record the matches to replay files, numbered if there is more than one")
+    parser.add_argument("--bots", type=int, default=0, metavar="COUNT", help="how many slots of each match bots play until people join, for soak tests")
+    parser.add_argument("--bot-budget", type=float, default=BOT_BUDGET * 1000, metavar="MS", help="milliseconds of searching each match's bots may use a tick, decisions that don't fit wait for a later one")
+    parser.add_argument("--relays", type=int, default=0, help=f"how many spectator relay processes to run, sharing port {RELAY_PORT}, for large audiences")
+    parser.add_argument("--stats-log", type=float, metavar="SECONDS", help="print a line of tick phase timings from each worker this often")
+    args = parser.parse_args()
+
+    startTime = time.perf_counter()
+    headless = args.headless
+
+    try:
+        snapshotInterval = max(1, round(args.tick_rate / args.snapshot_rate)) if args.snapshot_rate else 1
+        arena = Arena(*parseArenaSize(args.arena), args.tile_size, args.max_players, args.speed, args.tick_rate, snapshotInterval)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.bot_budget < 0:
+        parser.error("The bots' budget can't be negative")
+    botBudget = args.bot_budget / 1000
+    matchCount = max(1, args.matches)
+    workerCount = max(1, min(args.workers or os.cpu_count() or 1, matchCount))
+
+    if not headless: # pygame is only imported for the window, so a headless server starts sooner and runs where it isn't installed
+        import pygame
+        from Assets import AssetManager
+        from ServerRenderer import ArenaRenderer
+
+        assets = AssetManager()
+        assets.preload() # Read from disk now rather than on the first death
+
+    soundTime = time.perf_counter()
+
+    channels = [MatchChannels(matchNo, arena) for matchNo in range(matchCount)] # Made before any process starts, so every process shares them
+    ticked = WakePipe() # Wakes the server whenever a worker has ticked, to pass on inputs and any new snapshots
+
+    workerStats = [SharedSnapshot(STATS_CAPACITY) for x in range(workerCount)] # Holds each worker's timings, for the server's "Stats" command
     
-    serverProcess = ServerProcess(playerQueues, playerQsInUse, currentPlayerDataArray, None, name = "Server") # Start the server process
+    serverProcess = ServerProcess(channels, ticked, workerStats, name = "Server") # Start the server process
     serverProcess.start()
-    
-    running = True
-    
-    clock = pygame.time.Clock()
 
-    playerSpriteGroup = pygame.sprite.Group()
-    trailSpriteGroup = pygame.sprite.Group()
-    
-    screen = pygame.display.set_mode((404,404)) # 404 because it makes an odd number of 4x4 "tiles" on each side, allowing for easy centering
-    
-    pygame.display.set_caption("Multiplayer Test")
-    screen.fill((127.5,127.5,127.5))
+    relays = [SpectatorRelay(relayNo, sharePort=args.relays > 1, stopEvent=serverProcess.stopEvent) for relayNo in range(max(0, args.relays))]
+    for relay in relays:
+        relay.start()
 
-    pygame.display.flip()
+    groups = assignMatches(matchCount, workerCount)
 
-    while running:
-        
-        for index, queue in enumerate(playerQueues): # Parse all player requests
-            while not queue.empty():
-
-                currentRequest = queue.get()
-
-                if currentRequest == "Create Player":
-                    try:
-                        players[index] = Player(index, trailSpriteGroup)
-                        playerSpriteGroup.add(players[index])
-                    except Exception as e:
-                        print(f"Error when creating player {index+1}: {e}")
-                        players[index] = None
-
-                elif currentRequest == "Left":
-                    if players[index].xVel == 0:
-                        try:
-                            players[index].turnRequests.put_nowait("Left")
-                        except mp.queues.Full:
-                            pass
-                
-                elif currentRequest == "Right":
-                    if players[index].xVel == 0:
-                        try:
-                            players[index].turnRequests.put_nowait("Right")
-                        except mp.queues.Full:
-                            pass
-
-                elif currentRequest == "Up":
-                    if players[index].yVel == 0:
-                        try:
-                            players[index].turnRequests.put_nowait("Up")
-                        except mp.queues.Full:
-                            pass
-
-                elif currentRequest == "Down":
-                    if players[index].yVel == 0:
-                        try:
-                            players[index].turnRequests.put_nowait("Down")
-                        except mp.queues.Full:
-                            pass
-
-                elif currentRequest == "Stop":
-                    try:
-                        players[index].die()
-
-                    except AttributeError: # Player died before leaving, just drop exception
-                        pass
-
-            if players[index] is None:
-                playerQsInUse[index].value = False
-            elif players[index].fullyDead:
-                playerQsInUse[index].value = False
-                players[index].kill()
-                players[index] = None
-            else:
-                playerQsInUse[index].value = True
+    workers = []
+    for workerNo in range(1, workerCount): # This process is worker 0, so it can show its first match in the window
+        worker = MatchWorker(workerNo, [channels[matchNo] for matchNo in groups[workerNo]], ticked, workerStats[workerNo],
+                             serverProcess.stopEvent, [recordPath(args.record, matchNo, matchCount) for matchNo in groups[workerNo]], args.stats_log, args.bots, botBudget)
+        worker.start()
+        workers.append(worker)
 
-        clock.tick(60)
+    matches = [Match(channels[matchNo], recordPath(args.record, matchNo, matchCount), args.bots, botBudget) for matchNo in groups[0]]
 
-        playerDataStr = ""
+    processTime = time.perf_counter()
 
-        screen.fill((127.5,127.5,127.5))
+    renderer = None if headless else ArenaRenderer(arena=arena, assets=assets)
 
-        for sprite in trailSpriteGroup:
-            if players[sprite.playerNo] is None:
-                try:
-                    Player.obstacleTiles.remove((sprite.rect.x//4, sprite.rect.y//4))
-                except ValueError:
-                    pass
-                sprite.kill()
-            else:
-                sprite.colour = players[sprite.playerNo].colour
-                sprite.draw(screen)
+    readyTime = time.perf_counter()
+    print(f"Started in {(readyTime - startTime) * 1000:.0f}ms: pygame and sounds {(soundTime - startTime) * 1000:.0f}ms, "
+          f"processes {(processTime - soundTime) * 1000:.0f}ms, window {(readyTime - processTime) * 1000:.0f}ms")
 
+    runMatches(matches, ticked, workerStats[0], serverProcess.stopEvent, renderer, args.stats_log, renderRate=args.render_rate) # Headless servers are stopped from the terminal
 
-        for index, sprite in enumerate(playerSpriteGroup):
-            sprite.update()
-            sprite.draw(screen)
-            playerDataStr += sprite.getData()
-            if index != len(playerSpriteGroup)-1:
-                playerDataStr += ";"
-        
-        currentPlayerDataArray._lock.acquire()
-        currentPlayerDataArray.__setslice__(0, len(playerDataStr), playerDataStr) # Set array to the data string
-        currentPlayerDataArray.__setslice__(len(playerDataStr), 59, ['\x00' for x in range(59-len(playerDataStr))])
-        currentPlayerDataArray._lock.release()
+    serverProcess.stop()
+    serverProcess.join()
+
+    for worker in workers:
+        worker.join()
+    for relay in relays:
+        relay.join()
 
-        pygame.display.update()
+    for match in matches:
+        match.close()
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                serverProcess.stop()
-                running = False
+    for matchChannels in channels: # Only once the server and workers have finished with them
+        matchChannels.close()
+    for sharedStats in workerStats:
+        sharedStats.close()
 
-    pygame.quit()
+    if not headless:
+        pygame.quit()
     
     return 0
 
@@ -1,195 +1,846 @@
 import pygame
+import argparse
+import json
+import select
 import socket
 import sys
+import threading
+import time
+from collections import deque
+
+from OccupancyGrid import OccupancyGrid
+from GameSimulation import SimPlayer, Arena, FADE_TICKS, RENDER_RATE
+from ServerRenderer import windowCellSize
+from Assets import AssetManager
+from SpectatorRelay import parseAddress, RELAY_PORT
+from Protocol import decodeSnapshot, decodeTrailDelta, decodeKeyframe, messageKind, messageLength, headerSize, \
+    encodeRequest, decodeText, encodeHello, newerSnapshots, snapshotTick, trailTick, SNAPSHOT_VERSION, TRAIL_DELTA, KEYFRAME, \
+    MAX_DATAGRAM_SIZE
+
+'''CONSTANTS'''
+
+MAX_EXTRAPOLATION = 1 / 6 # Seconds prediction carries on past the last snapshot received, so a stalled connection doesn't run the player away
+LEAD_SAMPLES = 8 # How many recent inputs the prediction lead is judged from
+
+INTERPOLATION_SNAPSHOTS = 3 # How far behind the freshest snapshot other players are drawn, so there is usually a later snapshot to move them towards
+SNAPSHOT_BUFFER_SIZE = 32
+OFFSET_SAMPLES = 120 # How many recent snapshot arrivals the server's clock is judged from
+
+HELLO_INTERVAL = 0.5 # Seconds between hellos on a UDP subscription, repeated in case one is lost and to keep any NAT mapping open
+
+
+'''CLASSES'''
+
+class MessageReader():
+
+    # Splits what arrives on a connection into whole messages. Every message says how long it is, so any number
+    # can arrive in one packet, or one can be split over several
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.buffer = bytearray()
+
+    def nextMessage(self):
+
+        # Takes the first whole message out of what has been received, or returns None if it hasn't all arrived
+
+        if not self.buffer or len(self.buffer) < headerSize(messageKind(self.buffer)):
+            return None
+
+        length = messageLength(self.buffer)
+        if len(self.buffer) < length:
+            return None
+
+        message = bytes(self.buffer[:length])
+        del self.buffer[:length]
+        return message
+
+    def receive(self):
+
+        # Waits for the next whole message
+
+        message = self.nextMessage()
+
+        while message is None:
+            chunk = self.connection.recv(65536)
+            if not chunk:
+                raise ConnectionError("Server closed the connection")
+            self.buffer += chunk
+            message = self.nextMessage()
+
+        return message
+
+    def receiveWaiting(self):
+
+        # Returns every whole message that has already arrived, without waiting for any more
+
+        timeout = self.connection.gettimeout()
+        self.connection.setblocking(False)
+
+        try:
+            while True:
+                chunk = self.connection.recv(65536)
+                if not chunk:
+                    raise ConnectionError("Server closed the connection")
+                self.buffer += chunk
+        except BlockingIOError:
+            pass
+        finally:
+            self.connection.settimeout(timeout)
+
+        messages = []
+        message = self.nextMessage()
+        while message is not None:
+            messages.append(message)
+            message = self.nextMessage()
+
+        return messages
 
 class Network(object):
+
+    # Talks to the server. Commands are framed, so inputs can be queued up and sent together without waiting for
+    # any reply. Only queries are answered, and the answers arrive in the order they were asked
     
-    def __init__(self):
+    def __init__(self, address=None):
         self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server = '127.0.0.1' #"192.168.1.254" # Fred = "192.168.1.254" # Bert = "192.168.1.7" # School = "192.168.104.48"
         self.port = 5555
-        self.address = (self.server, self.port)
+        self.address = address or (self.server, self.port) # A spectator relay answers the same way, so it can be given instead
+        self.messages = MessageReader(self.client)
+        self.outgoing = bytearray() # Commands waiting to be sent in the next packet
+        self.subscription = None # A second connection the server pushes snapshots down, once subscribed
+        self.datagrams = None # A UDP socket the snapshots arrive on instead, if subscribed over UDP
+        self.datagramToken = None
+        self.nextHello = 0
+        self.newestTick = None # Tick of the newest snapshot received, older ones arriving late are dropped
+        self.staleSnapshots = 0 # Snapshots dropped for arriving after a newer one
+        self.pushedTrails = {} # Trail catch-ups a relay pushed ahead of a snapshot, by the tick they bring the board up to
         self.id = self.connect()
         print(self.id)
         
     def connect(self):
         try:
             self.client.connect(self.address)
-            return self.client.recv(2048).decode()
+            return decodeText(self.messages.receive())
             
-        except (socket.error, socket.timeout) as e:
+        except (socket.error, socket.timeout, ConnectionError) as e:
             print(f"Error in connecting: {e}")
-        
-    def send(self, data):
+
+    def queue(self, command):
+
+        # Adds a command to the next packet sent, without sending anything yet
+
+        self.outgoing += encodeRequest(command)
+
+    def flush(self):
+
+        # Sends every queued command in one packet, returns if it worked
+
+        if not self.outgoing:
+            return True
+
         try:
-            self.client.send(str.encode(data))
-            return self.client.recv(80000).decode()
+            self.client.sendall(self.outgoing)
         except (socket.error, socket.timeout) as e:
             print("Error:", e)
+            return False
+        finally:
+            self.outgoing = bytearray()
+
+        return True
+        
+    def getSnapshot(self):
+
+        # Requests the latest game snapshot, returning its tick, player data and trail changes, or None if it could not be received
+
+        snapshot = self.request("Data")
+
+        if snapshot is None:
+            return None
+        return decodeSnapshot(snapshot)
+
+    def request(self, command):
+
+        # Sends a query, such as "Data", "Keyframe" or "Trail <tick>", along with anything queued, and waits for its answer.
+        # Returns the answer or None if it could not be received
+
+        self.queue(command)
+        if not self.flush():
+            return None
+
+        try:
+            return self.messages.receive()
+        except (socket.error, socket.timeout, ConnectionError) as e:
+            print("Error:", e)
+            return None
+
+    def requestText(self, command):
+
+        # Sends a query answered in text, such as "Create Player", returning the text or None
+
+        message = self.request(command)
+
+        if message is None:
+            return None
+        return decodeText(message)
+
+    def subscribe(self, matchNo=None, udp=False, rate=None):
+
+        # Opens a second connection that the server pushes every new snapshot of a match down, returns if it worked.
+        # Match numbers start at 1, the server's first match is watched if none is given. With udp the snapshots come
+        # as datagrams instead, if the server can send them that way, and the connection only stays open to mark the subscription.
+        # A rate asks a spectator relay for fewer snapshots a second, each following a catch-up on the trails it skipped. The server always sends every snapshot
+
+        try:
+            self.subscription = MessageReader(socket.create_connection(self.address, timeout=5))
+            self.subscription.receive() # "Connected"
+            if matchNo is not None:
+                self.subscription.connection.sendall(encodeRequest(f"Watch {matchNo}"))
+                self.subscription.receive() # "Watching Match <matchNo>"
+            if rate is not None:
+                self.subscription.connection.sendall(encodeRequest(f"Rate {rate}"))
+                self.subscription.receive() # "Rate <rate>", the rate the snapshots will come at
+            self.subscription.connection.sendall(encodeRequest("Subscribe UDP" if udp else "Subscribe"))
+            reply = decodeText(self.subscription.receive()) # "Subscribed", or "Subscribed UDP <token>"
+
+            if reply.startswith("Subscribed UDP "):
+                self.datagramToken = int(reply.split(" ")[2])
+                self.datagrams = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.datagrams.connect(self.address)
+                self.datagrams.setblocking(False)
+                self.sendHello()
+        except (socket.error, socket.timeout, ConnectionError) as e:
+            print(f"Error in subscribing: {e}")
+            self.subscription = None
+            return False
+
+        return True
+
+    def sendHello(self):
+
+        # Tells the server where to send this client's datagrams
+
+        try:
+            self.datagrams.send(encodeHello(self.datagramToken))
+        except socket.error as e:
+            print("Error:", e)
+
+        self.nextHello = time.perf_counter() + HELLO_INTERVAL
+
+    def receiveDatagrams(self):
+
+        # Returns every snapshot datagram waiting, keeping the subscription alive with hellos
 
-class mainSprite(pygame.sprite.Sprite):
+        if time.perf_counter() >= self.nextHello:
+            self.sendHello()
 
-    playerColours = ((255,0,0), (0,0,255), (0,255,0), (255,255,0))
+        messages = []
 
-    def __init__(self, playerNo, fadeAmount, x, y, width, height):
-        super().__init__()
+        try:
+            while True:
+                messages.append(self.datagrams.recv(MAX_DATAGRAM_SIZE))
+        except (BlockingIOError, ConnectionRefusedError): # A refusal means a hello reached a closed port, the TCP side shows if the server has gone
+            pass
+
+        self.subscription.receiveWaiting() # Nothing is expected, but raises ConnectionError if the server has gone
+
+        return [message for message in messages if message and messageKind(message) == SNAPSHOT_VERSION]
+
+    def receiveSnapshots(self):
+
+        # Reads whatever the server has pushed without waiting and returns every complete snapshot, oldest first,
+        # as each carries that tick's trail changes. Each comes with the catch-up pushed ahead of it, when a relay
+        # skipped some ticks, or None. Snapshots older than one already received are dropped, which only happens
+        # to datagrams. Raises ConnectionError if the server has gone
+
+        if self.subscription is None: # Fall back to asking, if subscribing failed
+            snapshot = self.getSnapshot()
+            return [] if snapshot is None else [(snapshot, None)]
+
+        if self.datagrams is not None:
+            messages = self.receiveDatagrams()
+        else:
+            messages = []
+            for message in self.subscription.receiveWaiting():
+                if messageKind(message) == SNAPSHOT_VERSION:
+                    messages.append(message)
+                elif messageKind(message) in (TRAIL_DELTA, KEYFRAME):
+                    self.pushedTrails[trailTick(message)] = message
+
+        fresh = newerSnapshots(messages, self.newestTick)
+        self.staleSnapshots += len(messages) - len(fresh)
+
+        if fresh:
+            self.newestTick = snapshotTick(fresh[-1])
+
+        snapshots = [(decodeSnapshot(message), self.pushedTrails.pop(snapshotTick(message), None)) for message in fresh]
+        self.pushedTrails = {tick: message for tick, message in self.pushedTrails.items() # Older ones were for snapshots that never came,
+                             if self.newestTick is None or tick > self.newestTick}          # later ones wait for a snapshot still arriving
+
+        return snapshots
+
+class TrailStore():
+
+    # Keeps the client's copy of every trail, built from the changes carried by each snapshot.
+    # Starts from a keyframe of the whole board and asks for the changes it missed whenever snapshots are skipped
+
+    def __init__(self, width, height, snapshotInterval=1):
+        self.grid = OccupancyGrid(width, height)
+        self.tick = None # The tick the trails are up to date with
+        self.snapshotInterval = snapshotInterval # Ticks from one of the server's snapshots to the next
+
+        self.changedTiles = [] # Tiles changed since the renderer last looked
+        self.reloaded = False # Whether the whole board has been replaced since the renderer last looked
+
+    def applyMessage(self, message):
+
+        # Applies a keyframe or trail delta received from the server
+
+        if messageKind(message) == KEYFRAME:
+            tick, width, height, cells = decodeKeyframe(message)
+
+            self.grid.loadCells(cells)
+            self.changedTiles = []
+            self.reloaded = True
+        else:
+            fromTick, tick, addedTiles, clearedPlayers = decodeTrailDelta(message)
+            self.applyChanges(addedTiles, clearedPlayers)
+
+        self.tick = tick
+
+    def applyChanges(self, addedTiles, clearedPlayers):
+
+        # Removes cleared players' trails, then adds the new tiles
+
+        for playerNo in clearedPlayers:
+            self.changedTiles.extend(self.grid.clearPlayer(playerNo))
+
+        for playerNo, x, y in addedTiles:
+            if self.grid.mark(x, y, playerNo):
+                self.changedTiles.append((x, y))
+
+    def follows(self, message):
+
+        # Returns whether a keyframe or trail delta can be applied to the trails as they are, to catch up without asking
+
+        if messageKind(message) == KEYFRAME:
+            return True
+
+        fromTick, toTick, addedTiles, clearedPlayers = decodeTrailDelta(message)
+        return self.tick is not None and fromTick <= self.tick < toTick
+
+    def resyncRequest(self, tick):
+
+        # Returns what to ask the server for before a snapshot of this tick can be applied, or None if nothing was missed
+
+        if self.tick is None: # Never synchronised
+            return "Keyframe"
+        if tick > self.tick + self.snapshotInterval: # Snapshots were skipped
+            return f"Trail {self.tick}"
+        return None
+
+    def update(self, snapshot, resync=None):
+
+        # Brings the trails up to the tick of a new snapshot, given the server's answer to resyncRequest if one was needed
+
+        tick, playerData, addedTiles, clearedPlayers = snapshot
+
+        if resync is not None:
+            self.applyMessage(resync)
+
+        elif self.tick is not None and tick == self.tick + self.snapshotInterval:
+            self.applyChanges(addedTiles, clearedPlayers)
+            self.tick = tick
+
+class PredictionGrid():
+
+    # The board as the client's prediction sees it: the server's trails plus the tiles the prediction has laid itself,
+    # kept apart so a prediction being corrected never leaves anything behind in the trail store
+
+    def __init__(self, trails):
+        self.trails = trails
+        self.predictedTiles = []
+
+    def isOccupied(self, x, y):
+        return (x, y) in self.predictedTiles or self.trails.grid.isOccupied(x, y)
+
+    def mark(self, x, y, playerNo):
+        if self.isOccupied(x, y):
+            return False
+        self.predictedTiles.append((x, y))
+        return True
+
+class Predictor():
+
+    # Predicts where the client's own player is now, so its turns show straight away rather than a round trip later.
+    # The server's last word on the player is taken from each snapshot, and the inputs the server hasn't applied yet are
+    # replayed on top of it with the same SimPlayer rules the server uses. Inputs are numbered, and each snapshot
+    # says the last number applied, so the prediction is corrected whenever the server saw things differently
+
+    def __init__(self, playerNo, trails, arena):
         self.playerNo = playerNo
-        self.fadeAmount = fadeAmount
-        self.image = pygame.Surface([width,height])
-        self.calcColour()
-        self.image.fill(self.colour)
-        self.rect = self.image.get_rect()
-        self.rect.centerx = x
-        self.rect.centery = y
+        self.trails = trails
+        self.arena = arena
+
+        self.nextSequence = 1
+        self.pendingInputs = [] # (sequence, tick predicted to apply it, server tick when sent, command) for inputs not yet applied
+        self.leadSamples = deque([2], maxlen=LEAD_SAMPLES) # Ticks between the server tick an input was sent at and when it was applied
+
+        self.serverTick = None
+        self.serverData = None # The player's getData tuple from the latest snapshot
+        self.receivedAt = None
+
+        self.player = None
+        self.grid = None
+        self.predictedTick = None # The tick the current prediction is for
+        self.outdated = True # Whether something has changed since the prediction was made
+
+    def lead(self):
+
+        # Returns how many ticks ahead of the latest snapshot the player is predicted, enough for an input sent now to reach the server in time
+
+        return max(self.leadSamples)
+
+    def input(self, command):
+
+        # Records an input to be predicted and returns the numbered command to send to the server
+
+        sequence = self.nextSequence
+        self.nextSequence = self.nextSequence % 0xFFFF + 1
+
+        if self.serverTick is not None:
+            tick = self.predictedTick if self.predictedTick is not None else self.serverTick + self.lead() # The lead is how long inputs take to be applied, so this is the tick being shown
+            self.pendingInputs.append((sequence, tick, self.serverTick, command))
+            self.outdated = True
+
+        return f"{command} {sequence}"
+
+    def reconcile(self, snapshot):
+
+        # Takes the server's view of the player from a snapshot, dropping any inputs it has now applied
+
+        tick, playerData = snapshot[0], snapshot[1]
 
-    def draw(self, surface):
-        self.calcColour()
-        self.image.fill(self.colour)
-        surface.blit(self.image, (self.rect.x, self.rect.y))
+        for data in playerData:
+            if data[0] == self.playerNo:
+                break
+        else: # The player is gone, so there is nothing to predict
+            self.serverData = None
+            self.pendingInputs = []
+            self.predictedTick = None
+            self.outdated = True
+            return
 
-    def calcColour(self):
-        first = mainSprite.playerColours[self.playerNo][0] + self.fadeAmount * (127.5-mainSprite.playerColours[self.playerNo][0]) / 60
-        second = mainSprite.playerColours[self.playerNo][1] + self.fadeAmount * (127.5-mainSprite.playerColours[self.playerNo][1]) / 60
-        third = mainSprite.playerColours[self.playerNo][2] + self.fadeAmount * (127.5-mainSprite.playerColours[self.playerNo][2]) / 60
+        lastInput = data[8]
 
-        self.colour = (first, second, third)
+        remaining = []
+        for sequence, inputTick, sentTick, command in self.pendingInputs:
+            if (lastInput - sequence) % 0x10000 < 0x8000: # Applied, allowing for the numbers wrapping around
+                self.leadSamples.append(max(1, tick - sentTick))
+            else:
+                remaining.append((sequence, inputTick, sentTick, command))
+        self.pendingInputs = remaining
+
+        self.serverTick = tick
+        self.serverData = data
+        self.receivedAt = time.perf_counter()
+        self.outdated = True
+
+    def predict(self):
+
+        # Returns the player's predicted getData tuple for the current moment, or None if it isn't in the game
+
+        if self.serverData is None:
+            return None
+
+        elapsed = int(min(time.perf_counter() - self.receivedAt, MAX_EXTRAPOLATION) * self.arena.tickRate)
+        target = self.serverTick + self.lead() + elapsed
+
+        if self.outdated or target != self.predictedTick:
+            self.grid = PredictionGrid(self.trails)
+            self.player = SimPlayer(self.playerNo, self.grid, arena=self.arena)
+            self.player.loadData(self.serverData)
+
+            inputs = sorted(self.pendingInputs, key=lambda pendingInput: pendingInput[1])
+            nextInput = 0
+
+            for tick in range(self.serverTick + 1, target + 1):
+                while nextInput < len(inputs) and inputs[nextInput][1] <= tick: # Inputs predicted for ticks already gone are applied as soon as possible
+                    self.player.requestTurn(inputs[nextInput][3])
+                    nextInput += 1
+                self.player.update()
+
+            self.predictedTick = target
+            self.outdated = False
+
+        return self.player.getData()
+
+    def predictedTiles(self):
+
+        # Returns the trail tiles the prediction has laid that the server hasn't confirmed yet
+
+        if self.serverData is None or self.grid is None:
+            return []
+        return self.grid.predictedTiles
+
+class SnapshotBuffer():
+
+    # Holds the last few snapshots along with when they arrived, and works out where the other players were a moment ago,
+    # moving them smoothly between snapshots however unevenly those turned up
+
+    def __init__(self, tickRate, delayTicks):
+        self.tickRate = tickRate
+        self.delayTicks = delayTicks
+        self.snapshots = deque(maxlen=SNAPSHOT_BUFFER_SIZE) # (tick, playerData), oldest first
+        self.offsets = deque(maxlen=OFFSET_SAMPLES) # Arrival time minus the tick's time, the smallest being the quickest delivery
+
+    def add(self, snapshot, arrivalTime):
+
+        # Adds a newly received snapshot, ignoring any older than one already held
+
+        tick, playerData = snapshot[0], snapshot[1]
+
+        if self.snapshots and tick <= self.snapshots[-1][0]:
+            return
+
+        self.snapshots.append((tick, playerData))
+        self.offsets.append(arrivalTime - tick / self.tickRate)
+
+    def latest(self):
+
+        # Returns the newest snapshot's player data
+
+        return self.snapshots[-1][1] if self.snapshots else []
+
+    def renderTick(self, now):
+
+        # Returns the (fractional) tick to draw at a moment, a little behind the freshest the server could have sent
+
+        return (now - min(self.offsets)) * self.tickRate - self.delayTicks
+
+    def interpolate(self, now):
+
+        # Returns the players' data as of renderTick, with positions blended between the snapshots either side of it
+
+        if not self.snapshots:
+            return []
+
+        tick = self.renderTick(now)
+
+        if tick <= self.snapshots[0][0]:
+            return self.snapshots[0][1]
+        if tick >= self.snapshots[-1][0]: # Nothing newer has arrived, so hold the newest rather than guess
+            return self.snapshots[-1][1]
+
+        for (earlierTick, earlier), (laterTick, later) in zip(self.snapshots, list(self.snapshots)[1:]):
+            if earlierTick <= tick < laterTick:
+                break
+
+        fraction = (tick - earlierTick) / (laterTick - earlierTick)
+        earlierPlayers = {data[0]: data for data in earlier}
+
+        playerData = []
+        for data in later:
+            previous = earlierPlayers.get(data[0])
+
+            if previous is None: # Only just joined
+                playerData.append(data)
+                continue
+
+            nearest = previous if fraction < 0.5 else data
+            x = round(previous[2] + (data[2] - previous[2]) * fraction)
+            y = round(previous[3] + (data[3] - previous[3]) * fraction)
+            playerData.append((nearest[0], nearest[1], x, y) + tuple(nearest[4:]))
+
+        return playerData
+
+class NetworkThread(threading.Thread):
+
+    # Does all of the client's talking to the server in the background, so a slow or missing reply never holds up a frame.
+    # Snapshots are applied to the trails and prediction, and buffered for interpolation, under the lock the renderer also takes
+
+    def __init__(self, network, trails, predictor=None, arena=None):
+        super().__init__(name="Network", daemon=True)
+
+        if arena is None:
+            arena = Arena()
+
+        self.network = network
+        self.trails = trails
+        self.predictor = predictor
+        self.pollInterval = 1 / arena.snapshotRate() # How often to ask for a snapshot when not subscribed
+
+        self.lock = threading.Lock()
+        self.buffer = SnapshotBuffer(arena.tickRate, INTERPOLATION_SNAPSHOTS * arena.snapshotInterval)
+
+        self.outbox = deque() # Commands from the render loop waiting to be sent
+        self.wakeReader, self.wakeWriter = socket.socketpair() # Wakes the thread when there is something to send
+        self.wakeReader.setblocking(False)
+        self.wakeWriter.setblocking(False)
+
+        self.running = True
+        self.connected = True # False while the server can't be reached
+
+    def send(self, command):
+
+        # Queues a command to go out straight away, without waiting for the network
+
+        self.outbox.append(command)
+        self.wake()
+
+    def wake(self):
+        try:
+            self.wakeWriter.send(b"\x00")
+        except BlockingIOError: # Already awake
+            pass
+
+    def stop(self):
+
+        # Stops the thread and waits for it to finish
+
+        self.running = False
+        self.wake()
+        self.join()
+
+    def run(self):
+
+        while self.running:
+            waitFor = [self.wakeReader]
+            if self.network.subscription is not None:
+                waitFor.append(self.network.subscription.connection)
+            if self.network.datagrams is not None:
+                waitFor.append(self.network.datagrams)
+
+            select.select(waitFor, [], [], self.pollInterval if self.network.subscription is None else 0.5)
+
+            try:
+                while self.wakeReader.recv(4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+            while self.outbox:
+                self.network.queue(self.outbox.popleft())
+            self.network.flush() # Everything sent since the last wake up goes in one packet
+
+            try:
+                snapshots = self.network.receiveSnapshots()
+            except (socket.error, ConnectionError):
+                self.connected = False
+                time.sleep(0.5)
+                continue
+
+            self.connected = True
+
+            for snapshot, pushed in snapshots:
+                if pushed is not None and self.trails.follows(pushed): # A relay sent the ticks it skipped along with the snapshot
+                    resync = pushed
+                else:
+                    request = self.trails.resyncRequest(snapshot[0])
+                    resync = self.network.request(request) if request is not None else None # Only this thread changes the trails, so this can wait outside the lock
+
+                with self.lock:
+                    self.trails.update(snapshot, resync)
+                    if self.predictor is not None:
+                        self.predictor.reconcile(snapshot)
+                    self.buffer.add(snapshot, time.perf_counter())
+
+class ClientRenderer():
+
+    backgroundColour = (127.5,127.5,127.5)
+
+    # Draws the game for the client. Trails live on a persistent layer that is only painted where they change,
+    # and every colour and size of surface is made once and reused, so memory is bounded by the board size
+    # and a frame costs the same however long the session has run
+
+    def __init__(self, screen, arena, assets=None):
+        self.screen = screen
+        self.assets = assets if assets is not None else AssetManager(audio=False)
+        self.arenaTileSize = arena.tileSize
+        self.tileSize = windowCellSize(arena) # Pixels each tile takes on screen, smaller than in the arena if it is too big for the window
+
+        self.playerColours = [stats[0] for stats in arena.playerStats]
+
+        self.trailLayer = pygame.Surface(screen.get_size())
+        self.trailLayer.fill(ClientRenderer.backgroundColour)
+
+        self.paintedFades = {} # The fade each player's trail was last painted with
+
+        for playerNo in range(len(self.playerColours)): # Every trail tile colour is made before the first frame, heads are made as they appear
+            for fadeAmount in range(FADE_TICKS + 1):
+                self.surface(playerNo, fadeAmount, self.tileSize, self.tileSize)
+
+    def surface(self, playerNo, fadeAmount, width, height):
+
+        # Returns a filled surface for a player at a fade level
+
+        return self.assets.filledSurface(self.calcColour(playerNo, fadeAmount), width, height)
+
+    def calcColour(self, playerNo, fadeAmount):
+        first = self.playerColours[playerNo][0] + fadeAmount * (127.5-self.playerColours[playerNo][0]) / 60
+        second = self.playerColours[playerNo][1] + fadeAmount * (127.5-self.playerColours[playerNo][1]) / 60
+        third = self.playerColours[playerNo][2] + fadeAmount * (127.5-self.playerColours[playerNo][2]) / 60
+
+        return (first, second, third)
+
+    def paintTile(self, trails, x, y, fades):
+
+        # Paints one tile of the trail layer in its owner's current colour, or the background if it has none
+
+        owner = trails.grid.owner(x, y)
+
+        if owner is None:
+            self.trailLayer.fill(ClientRenderer.backgroundColour, (x * self.tileSize, y * self.tileSize, self.tileSize, self.tileSize))
+        else:
+            self.trailLayer.blit(self.surface(owner, fades.get(owner, 0), self.tileSize, self.tileSize), (x * self.tileSize, y * self.tileSize))
+
+    def updateTrails(self, trails, fades):
+
+        # Brings the trail layer up to date with the trail store and the players' current fades
+
+        if trails.reloaded:
+            self.trailLayer.fill(ClientRenderer.backgroundColour)
+            for playerNo in trails.grid.ownedTiles:
+                for x, y in trails.grid.tilesOf(playerNo):
+                    self.paintTile(trails, x, y, fades)
+            self.paintedFades = {playerNo: fades.get(playerNo, 0) for playerNo in trails.grid.ownedTiles}
+            trails.reloaded = False
+
+        for x, y in trails.changedTiles:
+            self.paintTile(trails, x, y, fades)
+        trails.changedTiles = []
+
+        for playerNo in trails.grid.ownedTiles: # Repaint trails whose colour is fading
+            if self.paintedFades.get(playerNo, 0) != fades.get(playerNo, 0):
+                for x, y in trails.grid.tilesOf(playerNo):
+                    self.paintTile(trails, x, y, fades)
+                self.paintedFades[playerNo] = fades.get(playerNo, 0)
+
+    def draw(self, trails, playerData, fades, predictedTiles=(), predictedPlayerNo=None):
+
+        # Draws the trails, any tiles the client's own player is predicted to have laid, and then each player's head on top
+
+        self.updateTrails(trails, fades)
+
+        self.screen.blit(self.trailLayer, (0, 0))
+
+        for x, y in predictedTiles:
+            self.screen.blit(self.surface(predictedPlayerNo, 0, self.tileSize, self.tileSize), (x * self.tileSize, y * self.tileSize))
+
+        scale = self.tileSize / self.arenaTileSize
+
+        for playerNo, fadeAmount, x, y, width, height, *prediction in playerData:
+            self.screen.blit(self.surface(playerNo, fadeAmount, max(1, int(width * scale)), max(1, int(height * scale))),
+                             (int((x - width // 2) * scale), int((y - height // 2) * scale)))
+
+        pygame.display.update()
 
 
 def main():
-    screen = pygame.display.set_mode((404,404))
+
+    parser = argparse.ArgumentParser(description="Connects to the server and plays with the arrow keys")
+    parser.add_argument("--udp", action="store_true", help="have snapshots sent over UDP, so a lost packet never holds up later ones")
+    parser.add_argument("--relay", metavar="HOST[:PORT]", help="watch through a spectator relay rather than connecting to the server")
+    parser.add_argument("--rate", type=float, help="snapshots a second to ask a relay for, fewer than the tick rate saves bandwidth")
+    args = parser.parse_args()
+
+    n = Network(parseAddress(args.relay, RELAY_PORT) if args.relay else None)
+    n.client.settimeout(5)
+
+    arenaReply = n.requestText("Arena") # The window and the prediction both depend on the arena the server is running
+    arena = Arena.fromDict(json.loads(arenaReply)) if arenaReply is not None else Arena()
+
+    cellSize = windowCellSize(arena)
+
+    screen = pygame.display.set_mode((arena.gridWidth * cellSize, arena.gridHeight * cellSize))
     pygame.display.set_caption("Client Window")
     screen.fill((127.5,127.5,127.5))
 
+    renderer = ClientRenderer(screen, arena)
+
     clock = pygame.time.Clock()
     pygame.display.flip()
     
-    n = Network()
-    n.client.settimeout(5)
-    print(n.send("Create Player"))
+    reply = n.requestText("Create Player")
+    print(reply)
+
+    playerNo = None # Only players have anything to predict, spectators just watch
+    matchNo = None
+    if reply is not None and reply.startswith("Created Player "): # "Created Player <player> in Match <match>"
+        words = reply.split(" ")
+        playerNo = int(words[2]) - 1
+        matchNo = int(words[5])
+
+    n.subscribe(matchNo, args.udp, args.rate)
 
     running = True
 
-    left = True
-    right = True
-    up = True
-    down = True
+    released = {direction: True for direction in ("Left", "Right", "Up", "Down")} # Each turn is sent once per press
 
     missingDataMessagePrinted = False
     noDataMessagePrinted = False
 
-    oldSpriteGroup = pygame.sprite.Group()
-    previousKnownLocations = {}
+    trails = TrailStore(arena.gridWidth, arena.gridHeight, arena.snapshotInterval)
 
-    currentFades = {}
+    predictor = Predictor(playerNo, trails, arena) if playerNo is not None else None
+
+    networkThread = NetworkThread(n, trails, predictor, arena) # Receives in the background, the loop below only draws and reads keys
+    networkThread.start()
 
     while running:
-        clock.tick(60)
+        clock.tick(RENDER_RATE)
 
-        try:
-            drawData = n.send("Data")
-        except socket.timeout:
-            drawData = None
-        
-        if drawData is None:
+        if not networkThread.connected:
             if not missingDataMessagePrinted:
                 print("Data not recieved, waiting for reconnection...")
                 missingDataMessagePrinted = True
-        elif drawData == "N/A":
-            if not noDataMessagePrinted:
-                print("No available data")
-                noDataMessagePrinted = True
         else:
             missingDataMessagePrinted = False
-            noDataMessagePrinted = False
 
-            newSpriteGroup = pygame.sprite.Group()
+        with networkThread.lock:
+            latest = networkThread.buffer.latest()
 
-            for element in drawData.split(";"):
-                currentObjectData = element.split(",")
-                playerNo, fadeAmount, x, y, width, height = int(currentObjectData[0]), int(currentObjectData[1]), \
-                    int(currentObjectData[2]), int(currentObjectData[3]), int(currentObjectData[4]), int(currentObjectData[5])
+            if not latest:
+                if networkThread.buffer.snapshots and not noDataMessagePrinted:
+                    print("No available data")
+                    noDataMessagePrinted = True
+            else:
+                noDataMessagePrinted = False
 
-                print(currentFades)
-                currentFades[playerNo] = fadeAmount
-                print(currentFades)
+                currentFades = {data[0]: data[1] for data in latest} # Fades match the trails, which are up to date with the latest snapshot
+                playerData = networkThread.buffer.interpolate(time.perf_counter())
+                predictedTiles = []
 
-                newSpriteGroup.add(mainSprite(playerNo, fadeAmount, x, y, width, height))
-                if previousKnownLocations.get(playerNo) is not None:
-                    currentY = (y//4)*4 + 2
-                    currentX = (x//4)*4 + 2
-                    tempX = currentX
-                    tempY = currentY
-                    prevX, prevY = previousKnownLocations[playerNo]
+                predicted = predictor.predict() if predictor is not None else None
+                if predicted is not None:
+                    playerData = [data for data in playerData if data[0] != predictor.playerNo] + [predicted]
+                    predictedTiles = predictor.predictedTiles()
 
-                    sign = lambda a: 1 if a>0 else -1 if a<0 else 0 # Not mine, thanks to https://www.quora.com/How-do-I-get-sign-of-integer-in-Python, specifically Guarav Jain's answer
-                    
-                    directionSign = sign(currentY-prevY)
+                renderer.draw(trails, playerData, currentFades, predictedTiles, predictor.playerNo if predictor is not None else None)
 
-                    while directionSign*tempY > directionSign*prevY:
-                        oldSpriteGroup.add(mainSprite(playerNo, fadeAmount, tempX, tempY, 4, 4))
-                        tempY -= 4*directionSign
+        keys = pygame.key.get_pressed()
 
-                    directionSign = sign(currentX-prevX)
+        for key, direction in ((pygame.K_LEFT, "Left"), (pygame.K_RIGHT, "Right"), (pygame.K_UP, "Up"), (pygame.K_DOWN, "Down")):
+            if keys[key] and released[direction]:
+                released[direction] = False
 
-                    while directionSign*tempX > directionSign*prevX:
-                        oldSpriteGroup.add(mainSprite(playerNo, fadeAmount, tempX, tempY, 4, 4))
-                        tempX -= 4*directionSign
+                if predictor is not None:
+                    with networkThread.lock:
+                        command = predictor.input(direction)
                 else:
-                    oldSpriteGroup.add(mainSprite(playerNo, fadeAmount, x, y, 4, 4))
-                previousKnownLocations[playerNo] = (x, y)
-                
-
-            screen.fill((127.5,127.5,127.5))
-
-            for sprite in newSpriteGroup:
-                sprite.draw(screen)
-
-            spriteCounter = 0
-            for sprite in oldSpriteGroup:
-                spriteCounter += 1
-                print(sprite.fadeAmount)
-                sprite.fadeAmount = currentFades[sprite.playerNo]
-                print(currentFades[sprite.playerNo], sprite.fadeAmount)
-                sprite.draw(screen)
+                    command = direction
+                networkThread.send(command) # Nothing waits for the server to answer
 
-            pygame.display.update()
-
-
-            for sprite in newSpriteGroup:
-                sprite.kill()
-
-
-        keys = pygame.key.get_pressed()
-
-        if keys[pygame.K_LEFT] and left:
-            left = False
-            print(n.send("Left"))
-        elif not keys[pygame.K_LEFT]:
-            left = True
-
-        if keys[pygame.K_RIGHT] and right:
-            right = False
-            print(n.send("Right"))
-        elif not keys[pygame.K_RIGHT]:
-            right = True
-
-        if keys[pygame.K_UP] and up:
-            up = False
-            print(n.send("Up"))
-        elif not keys[pygame.K_UP]:
-            up = True
-
-        if keys[pygame.K_DOWN] and down:
-            down = False
-            print(n.send("Down"))
-        elif not keys[pygame.K_DOWN]:
-            down = True
+            elif not keys[key]:
+                released[direction] = True
         
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
+
+    networkThread.stop()
     
-    print(n.send("Disconnect"))
+    print(n.requestText("Disconnect"))
     pygame.quit()
     
     return 0
@@ -0,0 +1,121 @@
+import re
+
+
+'''CONSTANTS'''
+
+TAKEN_PATTERN = re.compile(rb"[^\x00]") # Finds every taken cell without looping over the empty ones in Python
+
+
+'''CLASSES'''
+
+class OccupancyGrid():
+
+    # Holds which player (if any) owns each tile of the arena. Tiles are stored one byte each in a flat bytearray,
+    # so collision tests and marking are a single index instead of a search through every trail tile
+
+    EMPTY = 0 # Cells hold the owner's player number + 1, so 0 can mean an empty tile
+
+    def __init__(self, width, height, cells=None):
+        self.width = width
+        self.height = height
+
+        if cells is None:
+            cells = bytearray(width * height)
+        self.cells = cells # Any writable buffer works, such as shared memory other processes can read the board from
+
+        self.ownedTiles = {} # Maps a player number to the indices of the tiles it owns, allowing bulk clearing
+
+    def inBounds(self, x, y):
+
+        # Returns if a tile coordinate lies on the board
+
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def isOccupied(self, x, y):
+
+        # Returns if a tile is taken, tiles off the board count as taken
+
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return True
+
+        return self.cells[y * self.width + x] != OccupancyGrid.EMPTY
+
+    def owner(self, x, y):
+
+        # Returns the player number owning a tile, or None if it is empty or off the board
+
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+
+        cell = self.cells[y * self.width + x]
+
+        if cell == OccupancyGrid.EMPTY:
+            return None
+        return cell - 1
+
+    def mark(self, x, y, playerNo):
+
+        # Gives a tile to a player, returns False if the tile was already taken or is off the board
+
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return False
+
+        index = y * self.width + x
+
+        if self.cells[index] != OccupancyGrid.EMPTY:
+            return False
+
+        self.cells[index] = playerNo + 1
+
+        try:
+            self.ownedTiles[playerNo].append(index)
+        except KeyError:
+            self.ownedTiles[playerNo] = [index]
+
+        return True
+
+    def clearPlayer(self, playerNo):
+
+        # Frees every tile owned by a player, returns the freed tiles as (x, y) pairs
+
+        indices = self.ownedTiles.pop(playerNo, [])
+
+        cells = self.cells
+        for index in indices:
+            cells[index] = OccupancyGrid.EMPTY
+
+        return [(index % self.width, index // self.width) for index in indices]
+
+    def tilesOf(self, playerNo):
+
+        # Returns the tiles owned by a player as (x, y) pairs
+
+        return [(index % self.width, index // self.width) for index in self.ownedTiles.get(playerNo, [])]
+
+    def tileCount(self):
+
+        # Returns how many tiles are currently taken
+
+        return sum(len(indices) for indices in self.ownedTiles.values())
+
+    def loadCells(self, cells):
+
+        # Replaces the whole board with a copy of some cells, such as from a keyframe
+
+        self.cells[:] = cells
+
+        self.ownedTiles = {}
+        for match in TAKEN_PATTERN.finditer(self.cells): # Only the taken cells are visited, so large mostly empty boards load quickly
+            index = match.start()
+            cell = self.cells[index]
+            try:
+                self.ownedTiles[cell - 1].append(index)
+            except KeyError:
+                self.ownedTiles[cell - 1] = [index]
+
+    def clear(self):
+
+        # Empties the whole board
+
+        self.cells[:] = bytes(len(self.cells))
+        self.ownedTiles = {}
@@ -0,0 +1,347 @@
+import re
+import struct
+
+
+'''CONSTANTS'''
+
+# The first byte of every message says what it is. Snapshots start with their version number,
+# the other messages with a letter that no snapshot version will reach
+
+SNAPSHOT_VERSION = 3
+TRAIL_DELTA = ord("T")
+KEYFRAME = ord("K")
+TEXT = ord("M") # A text reply, such as "Connected" or "Created Player 1"
+REQUEST = ord("C") # A command from a client, the only kind of message sent to the server
+INPUTS = ord("I") # The commands applied on one tick, as recorded in replays
+HELLO = ord("H") # A datagram from a client telling the server where to send its snapshots, the only kind of datagram sent to the server
+
+SNAPSHOT_HEADER = struct.Struct("!BBIHB") # Version, player count, tick, trail tiles added this tick, players cleared this tick
+PLAYER_RECORD = struct.Struct("!BBHHBBBBH") # Player number, death counter, centre x, centre y, width, height, motion, queued turns, last input applied
+TILE_RECORD = struct.Struct("!BHH") # Owner's player number, tile x, tile y
+CLEARED_RECORD = struct.Struct("!B") # Player number whose whole trail was removed
+
+TRAIL_HEADER = struct.Struct("!BIIIB") # Kind, from tick, to tick, trail tiles added, players cleared
+
+KEYFRAME_HEADER = struct.Struct("!BIHHI") # Kind, tick, width in tiles, height in tiles, number of runs
+RUN_RECORD = struct.Struct("!HB") # Run length, cell value (owner + 1, or 0 for empty)
+
+TEXT_HEADER = struct.Struct("!BI") # Kind, length of the UTF-8 text that follows
+REQUEST_HEADER = struct.Struct("!BBH") # Kind, flags, length of the UTF-8 command that follows
+
+INPUTS_HEADER = struct.Struct("!BIH") # Kind, tick the commands were applied on, number of commands
+INPUT_RECORD = struct.Struct("!BB") # Player number, index of the command in COMMANDS
+MAX_INPUT_RECORDS = 0xFFFF # Most commands one INPUTS message holds, a tick with more is split across several
+
+HELLO_MESSAGE = struct.Struct("!BQ") # Kind, the token the server gave the client's connection when it subscribed over UDP
+
+COMMANDS = ("Left", "Right", "Up", "Down", "Create Player", "Stop") # Every command that changes the game
+
+ACK_REQUESTED = 1 # Request flag asking for an input to be acknowledged, inputs are otherwise not answered at all
+
+QUERIES = ("Data", "Keyframe", "Arena", "Stats", "Matches", "Subscribe", "Subscribe UDP", "Disconnect", "Create Player") # Commands that are always answered, along with those starting with QUERY_PREFIXES
+QUERY_PREFIXES = ("Trail ", "Watch ", "Rate ") # "Trail <tick>", "Watch <match>" and "Rate <updates per second>", which only relays act on
+
+MAX_RUN = 0xFFFF
+
+MAX_DATAGRAM_SIZE = 65507 # Largest UDP payload, matches whose snapshots could be bigger are streamed over TCP instead
+
+RUN_PATTERN = re.compile(rb"\x00+|(.)\1*", re.S) # Finds runs of identical cells without looping over every cell in Python.
+                                                # Empty runs are matched first on their own, as a plain repeat is far quicker than a backreference on large boards
+
+
+'''SUBROUTINES'''
+
+def messageKind(message):
+
+    # Returns what kind of message this is, SNAPSHOT_VERSION, TRAIL_DELTA, KEYFRAME, TEXT, REQUEST or INPUTS
+
+    return message[0]
+
+def headerSize(kind):
+
+    # Returns how long the header of a kind of message is
+
+    if kind == SNAPSHOT_VERSION:
+        return SNAPSHOT_HEADER.size
+    elif kind == TRAIL_DELTA:
+        return TRAIL_HEADER.size
+    elif kind == KEYFRAME:
+        return KEYFRAME_HEADER.size
+    elif kind == TEXT:
+        return TEXT_HEADER.size
+    elif kind == REQUEST:
+        return REQUEST_HEADER.size
+    elif kind == INPUTS:
+        return INPUTS_HEADER.size
+
+    raise ValueError(f"Unknown message kind {kind}")
+
+def messageLength(header):
+
+    # Returns the full length of any message from its header, so readers know how much more to receive
+
+    kind = header[0]
+
+    if kind == SNAPSHOT_VERSION:
+        return snapshotLength(header)
+
+    elif kind == TRAIL_DELTA:
+        kind, fromTick, toTick, addedCount, clearedCount = TRAIL_HEADER.unpack_from(header)
+        return TRAIL_HEADER.size + addedCount * TILE_RECORD.size + clearedCount * CLEARED_RECORD.size
+
+    elif kind == KEYFRAME:
+        kind, tick, width, height, runCount = KEYFRAME_HEADER.unpack_from(header)
+        return KEYFRAME_HEADER.size + runCount * RUN_RECORD.size
+
+    elif kind == TEXT:
+        return TEXT_HEADER.size + TEXT_HEADER.unpack_from(header)[1]
+
+    elif kind == REQUEST:
+        return REQUEST_HEADER.size + REQUEST_HEADER.unpack_from(header)[2]
+
+    elif kind == INPUTS:
+        return INPUTS_HEADER.size + INPUTS_HEADER.unpack_from(header)[2] * INPUT_RECORD.size
+
+    raise ValueError(f"Unknown message kind {kind}")
+
+async def readMessage(reader):
+
+    # Reads one whole message from an asyncio stream, using its header to find out how long it is
+
+    header = await reader.readexactly(1)
+    header += await reader.readexactly(headerSize(messageKind(header)) - 1)
+
+    return header + await reader.readexactly(messageLength(header) - len(header))
+
+def snapshotCapacity(maxPlayers, maxAddedTiles=None):
+
+    # Returns the most bytes a snapshot of a game with this many players can take
+
+    if maxAddedTiles is None:
+        maxAddedTiles = maxPlayers # Each player leaves at most one tile a tick
+
+    return SNAPSHOT_HEADER.size + maxPlayers * (PLAYER_RECORD.size + CLEARED_RECORD.size) + maxAddedTiles * TILE_RECORD.size
+
+def encodeSnapshot(tick, playerData, addedTiles=(), clearedPlayers=()):
+
+    # Packs a tick number, the players' SimPlayer.getData tuples and the
+    # changes to the trails on this tick ((playerNo, x, y) tiles added and player numbers cleared) into a snapshot
+
+    return SNAPSHOT_HEADER.pack(SNAPSHOT_VERSION, len(playerData), tick & 0xFFFFFFFF, len(addedTiles), len(clearedPlayers)) + \
+        b"".join([PLAYER_RECORD.pack(*data) for data in playerData]) + \
+        b"".join([TILE_RECORD.pack(*tile) for tile in addedTiles]) + \
+        bytes(clearedPlayers)
+
+def snapshotLength(header):
+
+    # Returns the full length of a snapshot from its header
+
+    version, playerCount, tick, addedCount, clearedCount = SNAPSHOT_HEADER.unpack_from(header)
+
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {version}")
+
+    return SNAPSHOT_HEADER.size + playerCount * PLAYER_RECORD.size + addedCount * TILE_RECORD.size + clearedCount * CLEARED_RECORD.size
+
+def snapshotTick(snapshot):
+
+    # Returns just the tick number of a snapshot
+
+    return SNAPSHOT_HEADER.unpack_from(snapshot)[2]
+
+def newerSnapshots(snapshots, newestTick=None):
+
+    # Returns the snapshots that are newer than a tick, oldest first, dropping any repeated or older ones.
+    # Snapshots sent as datagrams can arrive late, twice or in the wrong order, and only the newest one matters
+
+    fresh = []
+
+    for snapshot in sorted(snapshots, key=snapshotTick):
+        tick = snapshotTick(snapshot)
+        if newestTick is None or tick > newestTick:
+            fresh.append(snapshot)
+            newestTick = tick
+
+    return fresh
+
+def decodeSnapshot(snapshot):
+
+    # Unpacks a snapshot into its tick number, a list of player data tuples, the trail tiles added and the players cleared
+
+    version, playerCount, tick, addedCount, clearedCount = SNAPSHOT_HEADER.unpack_from(snapshot)
+
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {version}")
+
+    start = SNAPSHOT_HEADER.size
+    tilesStart = start + playerCount * PLAYER_RECORD.size
+    clearedStart = tilesStart + addedCount * TILE_RECORD.size
+
+    return tick, list(PLAYER_RECORD.iter_unpack(snapshot[start:tilesStart])), \
+        list(TILE_RECORD.iter_unpack(snapshot[tilesStart:clearedStart])), \
+        list(snapshot[clearedStart:clearedStart + clearedCount])
+
+def mergeTrailDeltas(deltas):
+
+    # Combines the (addedTiles, clearedPlayers) changes of several ticks, oldest first, into one change with the same effect.
+    # Applying the result means clearing the players first and then adding the tiles
+
+    cleared = []
+    added = []
+
+    for addedTiles, clearedPlayers in deltas:
+        if clearedPlayers:
+            added = [tile for tile in added if tile[0] not in clearedPlayers] # Those tiles were removed again
+            cleared.extend(playerNo for playerNo in clearedPlayers if playerNo not in cleared)
+        added.extend(addedTiles)
+
+    return added, cleared
+
+def encodeTrailDelta(fromTick, toTick, addedTiles, clearedPlayers):
+
+    # Packs the trail changes after fromTick up to and including toTick
+
+    return TRAIL_HEADER.pack(TRAIL_DELTA, fromTick & 0xFFFFFFFF, toTick & 0xFFFFFFFF, len(addedTiles), len(clearedPlayers)) + \
+        b"".join([TILE_RECORD.pack(*tile) for tile in addedTiles]) + \
+        bytes(clearedPlayers)
+
+def decodeTrailDelta(message):
+
+    # Unpacks a trail delta into its from tick, to tick, added tiles and cleared players
+
+    kind, fromTick, toTick, addedCount, clearedCount = TRAIL_HEADER.unpack_from(message)
+
+    tilesEnd = TRAIL_HEADER.size + addedCount * TILE_RECORD.size
+
+    return fromTick, toTick, list(TILE_RECORD.iter_unpack(message[TRAIL_HEADER.size:tilesEnd])), \
+        list(message[tilesEnd:tilesEnd + clearedCount])
+
+def trailTick(message):
+
+    # Returns the tick a trail delta or keyframe brings the board up to
+
+    if messageKind(message) == KEYFRAME:
+        return KEYFRAME_HEADER.unpack_from(message)[1]
+    return TRAIL_HEADER.unpack_from(message)[2]
+
+def encodeKeyframe(tick, width, height, cells):
+
+    # Packs a whole occupancy grid, run length encoded as most of a board is long stretches of the same owner
+
+    runs = []
+
+    for match in RUN_PATTERN.finditer(cells):
+        value = cells[match.start()]
+        length = match.end() - match.start()
+
+        while length > MAX_RUN:
+            runs.append(RUN_RECORD.pack(MAX_RUN, value))
+            length -= MAX_RUN
+        runs.append(RUN_RECORD.pack(length, value))
+
+    return KEYFRAME_HEADER.pack(KEYFRAME, tick & 0xFFFFFFFF, width, height, len(runs)) + b"".join(runs)
+
+def decodeKeyframe(message):
+
+    # Unpacks a keyframe into its tick, width, height and the grid's cells
+
+    kind, tick, width, height, runCount = KEYFRAME_HEADER.unpack_from(message)
+
+    end = KEYFRAME_HEADER.size + runCount * RUN_RECORD.size
+    cells = b"".join([bytes((value,)) * length for length, value in RUN_RECORD.iter_unpack(message[KEYFRAME_HEADER.size:end])])
+
+    return tick, width, height, bytearray(cells)
+
+
+def encodeText(text):
+
+    # Packs a text reply
+
+    data = str.encode(text)
+    return TEXT_HEADER.pack(TEXT, len(data)) + data
+
+def decodeText(message):
+
+    # Unpacks a text reply
+
+    kind, length = TEXT_HEADER.unpack_from(message)
+    return bytes(message[TEXT_HEADER.size:TEXT_HEADER.size + length]).decode("utf-8")
+
+def encodeRequest(command, ack=False):
+
+    # Packs one command for the server. Any number of them can be sent together in one packet
+
+    data = str.encode(command)
+    return REQUEST_HEADER.pack(REQUEST, ACK_REQUESTED if ack else 0, len(data)) + data
+
+def decodeRequests(buffer):
+
+    # Unpacks every whole request at the start of a buffer, returning a list of (command, ack) pairs and how many bytes
+    # they took up. A request only partly received is left for the next call, once the rest of it has arrived
+
+    requests = []
+    used = 0
+
+    while len(buffer) - used >= REQUEST_HEADER.size:
+        kind, flags, length = REQUEST_HEADER.unpack_from(buffer, used)
+
+        if kind != REQUEST:
+            raise ValueError(f"Expected a request, got message kind {kind}")
+
+        end = used + REQUEST_HEADER.size + length
+        if end > len(buffer):
+            break
+
+        requests.append((bytes(buffer[used + REQUEST_HEADER.size:end]).decode("utf-8"), bool(flags & ACK_REQUESTED)))
+        used = end
+
+    return requests, used
+
+def isInput(command):
+
+    # Returns if a command is an input for the player, which is only answered when an acknowledgement is asked for
+
+    return command not in QUERIES and not command.startswith(QUERY_PREFIXES)
+
+def encodeHello(token):
+
+    # Packs the datagram a client sends so the server learns which address its UDP snapshots go to
+
+    return HELLO_MESSAGE.pack(HELLO, token)
+
+def decodeHello(datagram):
+
+    # Unpacks a client's hello datagram into its token, or returns None if it isn't one
+
+    if len(datagram) != HELLO_MESSAGE.size or datagram[0] != HELLO:
+        return None
+    return HELLO_MESSAGE.unpack(datagram)[1]
+
+def encodeInputs(tick, inputs):
+
+    # Packs the (playerNo, command) inputs applied on a tick. Any sequence number on a command is dropped, as it doesn't change the game,
+    # and anything that isn't one of COMMANDS is left out. More than MAX_INPUT_RECORDS are packed as several messages for the same tick
+
+    records = []
+
+    for playerNo, command in inputs:
+        name = command.rsplit(" ", 1)[0] if command.rsplit(" ", 1)[-1].isdigit() else command
+        if name in COMMANDS:
+            records.append(INPUT_RECORD.pack(playerNo, COMMANDS.index(name)))
+
+    messages = []
+
+    for start in range(0, max(len(records), 1), MAX_INPUT_RECORDS):
+        chunk = records[start:start + MAX_INPUT_RECORDS]
+        messages.append(INPUTS_HEADER.pack(INPUTS, tick & 0xFFFFFFFF, len(chunk)) + b"".join(chunk))
+
+    return b"".join(messages)
+
+def decodeInputs(message):
+
+    # Unpacks recorded inputs into their tick and (playerNo, command) pairs
+
+    kind, tick, count = INPUTS_HEADER.unpack_from(message)
+
+    return tick, [(playerNo, COMMANDS[command]) for playerNo, command in
+                  INPUT_RECORD.iter_unpack(message[INPUTS_HEADER.size:INPUTS_HEADER.size + count * INPUT_RECORD.size])]
@@ -0,0 +1,295 @@
+import argparse
+import bisect
+import struct
+import sys
+import time
+import zlib
+
+from GameSimulation import Simulation, Arena, FixedTimestep, DEAD_FLAG, RENDER_RATE
+from Protocol import encodeInputs, decodeInputs, encodeSnapshot, decodeSnapshot, mergeTrailDeltas, messageLength, INPUTS
+
+
+'''CONSTANTS'''
+
+# A replay is a header followed by records. Only the inputs each tick are needed to play a match back, as the game is
+# deterministic, the whole state is saved every so often as well so playback can start anywhere without simulating from the start
+
+MAGIC = b"TRRP"
+REPLAY_VERSION = 3
+KEYFRAME_INTERVAL = 600 # Ticks between saved states, 10 seconds at 60 Hz
+
+REPLAY_HEADER = struct.Struct("!4sBHHBBHBH") # Magic, version, arena width, arena height, tile size, number of player slots, keyframe interval, player speed, tick rate
+UNTIMED_REPLAY_HEADER = struct.Struct("!4sBHHBBH") # Version 2, from when matches always ran at speed 1 and 60 Hz: the same without the last two
+SQUARE_REPLAY_HEADER = struct.Struct("!4sBHBBH") # Version 1, from when arenas were always square: magic, version, arena size, tile size, player slots, keyframe interval
+PLAYER_STATS_RECORD = struct.Struct("!BBBBBHH") # Colour red, green, blue, width, height, spawn x, spawn y of one slot
+
+STATE = ord("S") # A saved state, the INPUTS records come from the network protocol
+STATE_HEADER = struct.Struct("!BII") # Kind, length of the snapshot holding the players, length of the compressed grid cells
+
+
+'''CLASSES'''
+
+class ReplayRecorder():
+
+    # Records a match as it is played. Each tick only costs packing that tick's inputs, if there were any, into the file's buffer
+
+    def __init__(self, path, simulation, keyframeInterval=KEYFRAME_INTERVAL):
+        self.file = open(path, "wb")
+        self.keyframeInterval = keyframeInterval
+
+        arena = simulation.arena
+        self.file.write(REPLAY_HEADER.pack(MAGIC, REPLAY_VERSION, arena.width, arena.height, arena.tileSize, arena.maxPlayers, keyframeInterval,
+                                           arena.speed, arena.tickRate))
+        for colour, width, height, x, y in simulation.playerStats[:simulation.maxPlayers]:
+            self.file.write(PLAYER_STATS_RECORD.pack(*colour, width, height, x, y))
+
+        self.writeState(simulation) # So recording can start part way through a game
+
+    def record(self, simulation, inputs):
+
+        # Records the inputs of the step that was just taken, call after every step
+
+        if inputs:
+            self.file.write(encodeInputs(simulation.tick, inputs)) # Labelled with the tick they led to
+
+        if simulation.tick % self.keyframeInterval == 0:
+            self.writeState(simulation)
+
+    def writeState(self, simulation):
+
+        # Saves the whole game, the grid compressed as it is mostly long runs of the same value
+
+        snapshot = encodeSnapshot(simulation.tick, simulation.playerData())
+        cells = zlib.compress(bytes(simulation.grid.cells), 1)
+
+        self.file.write(STATE_HEADER.pack(STATE, len(snapshot), len(cells)) + snapshot + cells)
+
+    def close(self, simulation):
+
+        # Saves the final state, which also marks where the match ended, and closes the file
+
+        self.writeState(simulation)
+        self.file.close()
+
+class Replay():
+
+    # A recorded match, read into memory, that can be played back from any tick
+
+    def __init__(self, data):
+        magic, version = data[:4], data[4]
+
+        if magic != MAGIC:
+            raise ValueError("Not a replay file")
+
+        speed, tickRate = 1, 60 # Older versions don't say, as every match ran at speed 1 and 60 Hz then
+
+        if version == REPLAY_VERSION:
+            magic, version, width, height, tileSize, maxPlayers, self.keyframeInterval, speed, tickRate = REPLAY_HEADER.unpack_from(data)
+            position = REPLAY_HEADER.size
+        elif version == 2:
+            magic, version, width, height, tileSize, maxPlayers, self.keyframeInterval = UNTIMED_REPLAY_HEADER.unpack_from(data)
+            position = UNTIMED_REPLAY_HEADER.size
+        elif version == 1:
+            magic, version, width, tileSize, maxPlayers, self.keyframeInterval = SQUARE_REPLAY_HEADER.unpack_from(data)
+            height = width
+            position = SQUARE_REPLAY_HEADER.size
+        else:
+            raise ValueError(f"Unsupported replay version {version}")
+
+        self.arena = Arena(width, height, tileSize, maxPlayers, speed, tickRate)
+        self.maxPlayers = maxPlayers
+
+        self.playerStats = []
+        for index in range(maxPlayers):
+            red, green, blue, width, height, x, y = PLAYER_STATS_RECORD.unpack_from(data, position)
+            self.playerStats.append(((red, green, blue), width, height, x, y))
+            position += PLAYER_STATS_RECORD.size
+
+        self.inputs = {} # Maps a tick to the inputs of the step that led to it
+        self.states = [] # (tick, playerData, cells) of each saved state, in order
+        self.stateTicks = [] # Just the ticks of the saved states, for searching
+
+        while position < len(data):
+            kind = data[position]
+
+            if kind == INPUTS:
+                end = position + messageLength(data[position:position + 16])
+                tick, inputs = decodeInputs(data[position:end])
+                self.inputs.setdefault(tick, []).extend(inputs) # Ticks with a great many inputs are split across several records
+                position = end
+
+            elif kind == STATE:
+                kind, snapshotLength, cellsLength = STATE_HEADER.unpack_from(data, position)
+                position += STATE_HEADER.size
+
+                tick, playerData, addedTiles, clearedPlayers = decodeSnapshot(data[position:position + snapshotLength])
+                position += snapshotLength
+
+                cells = zlib.decompress(data[position:position + cellsLength])
+                position += cellsLength
+
+                if self.stateTicks and self.stateTicks[-1] == tick: # The final state can repeat the last periodic one
+                    continue
+
+                self.states.append((tick, playerData, cells))
+                self.stateTicks.append(tick)
+
+            else:
+                raise ValueError(f"Unknown replay record {kind} at byte {position}")
+
+        if not self.states:
+            raise ValueError("Replay has no saved states")
+
+        self.firstTick = self.stateTicks[0]
+        self.lastTick = max(self.stateTicks[-1], max(self.inputs, default=0))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            return cls(file.read())
+
+    def newSimulation(self):
+
+        # Returns a simulation set up like the recorded one, at the first tick of the recording
+
+        simulation = Simulation(self.arena, playerStats=self.playerStats)
+        self.loadState(simulation, 0)
+        return simulation
+
+    def loadState(self, simulation, index):
+
+        # Puts a simulation into one of the saved states
+
+        tick, playerData, cells = self.states[index]
+        simulation.loadState(tick, playerData, cells)
+
+    def seek(self, simulation, tick):
+
+        # Moves a simulation to any tick, starting from the last saved state at or before it
+
+        tick = max(self.firstTick, min(tick, self.lastTick))
+
+        index = bisect.bisect_right(self.stateTicks, tick) - 1
+        if not (self.stateTicks[index] <= simulation.tick <= tick): # Carrying on is quicker if the simulation is already between the state and the tick
+            self.loadState(simulation, index)
+
+        self.advance(simulation, tick)
+
+    def advance(self, simulation, tick):
+
+        # Steps a simulation forward to a tick, applying the recorded inputs
+
+        inputs = self.inputs
+
+        while simulation.tick < tick:
+            simulation.step(inputs.get(simulation.tick + 1, ()))
+
+    def verify(self):
+
+        # Plays the whole recording from its first state and returns the ticks of any saved states the result doesn't match.
+        # Players' last input numbers aren't recorded, as they don't change the game, so they aren't compared
+
+        simulation = self.newSimulation()
+        mismatches = []
+
+        for tick, playerData, cells in self.states[1:]:
+            self.advance(simulation, tick)
+            if [data[:8] for data in simulation.playerData()] != [data[:8] for data in playerData] or bytes(simulation.grid.cells) != cells:
+                mismatches.append(tick)
+
+        return mismatches
+
+
+'''SUBROUTINES'''
+
+def render(replay, simulation, endTick, speed):
+
+    # Plays the replay in a window from the simulation's tick, pygame is only needed for this. Ticks run at the recorded tick rate times
+    # the speed, and the window is drawn at its own rate with whatever ticks were due, so fast playback skips frames rather than slowing down
+
+    import pygame
+    from Assets import AssetManager
+    from ServerRenderer import ArenaRenderer
+
+    assets = AssetManager()
+    assets.preload()
+    renderer = ArenaRenderer("Replay", replay.arena, assets)
+    renderer.load(simulation)
+
+    timestep = FixedTimestep(replay.arena.tickRate * speed)
+    frameLength = 1 / RENDER_RATE
+    running = True
+
+    while running and simulation.tick < endTick:
+        frameStart = time.perf_counter()
+
+        changes = [] # (addedTiles, clearedPlayers) of each tick this frame, drawn together
+        deaths = []
+
+        for tick in range(min(timestep.advance(), endTick - simulation.tick)):
+            replay.advance(simulation, simulation.tick + 1)
+            changes.append((simulation.addedTiles, simulation.clearedPlayers))
+            deaths.extend(simulation.deaths)
+
+        renderer.draw(simulation, (*mergeTrailDeltas(changes), deaths))
+
+        running = renderer.handleEvents()
+
+        remaining = frameStart + frameLength - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    pygame.quit()
+
+
+'''MAIN'''
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Plays back a recorded match")
+    parser.add_argument("path")
+    parser.add_argument("--seek", type=int, help="tick to start from, the start of the recording by default")
+    parser.add_argument("--to", type=int, help="tick to stop at, the end of the recording by default")
+    parser.add_argument("--render", action="store_true", help="show the match in a window rather than just simulating it")
+    parser.add_argument("--speed", type=float, default=1, help="playback speed when rendering, 1 being the tick rate the match was recorded at")
+    parser.add_argument("--verify", action="store_true", help="check playing the recording back reproduces every saved state")
+    args = parser.parse_args()
+
+    replay = Replay.load(args.path)
+
+    print(f"{replay.arena.width}x{replay.arena.height} arena with {replay.arena.maxPlayers} players at speed {replay.arena.speed} and {replay.arena.tickRate} Hz. Ticks {replay.firstTick} to {replay.lastTick}, {len(replay.inputs)} ticks with inputs, {len(replay.states)} saved states")
+
+    if args.verify:
+        start = time.perf_counter()
+        mismatches = replay.verify()
+        elapsed = time.perf_counter() - start
+
+        print(f"Verified in {elapsed:.2f}s: " + ("every saved state matched" if not mismatches else f"mismatches at ticks {mismatches}"))
+        if mismatches:
+            return 1
+
+    endTick = replay.lastTick if args.to is None else args.to
+
+    simulation = replay.newSimulation()
+
+    start = time.perf_counter()
+    replay.seek(simulation, replay.firstTick if args.seek is None else args.seek)
+    print(f"Seeked to tick {simulation.tick} in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    if args.render:
+        render(replay, simulation, endTick, args.speed)
+    else:
+        fromTick = simulation.tick
+        start = time.perf_counter()
+        replay.advance(simulation, endTick)
+        elapsed = time.perf_counter() - start
+
+        print(f"Simulated to tick {simulation.tick} in {elapsed:.2f}s ({(simulation.tick - fromTick) / max(elapsed, 1e-9):.0f} ticks per second)")
+
+    for data in simulation.playerData():
+        print(f"Player {data[0] + 1}: centre ({data[2]}, {data[3]}), " + ("alive" if not data[6] & DEAD_FLAG else f"dead for {data[1]} ticks"))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import pygame
+
+from GameSimulation import Arena, BACKGROUND_COLOUR
+from Assets import AssetManager
+
+
+'''CONSTANTS'''
+
+MAX_WINDOW_SIZE = 1000 # Larger arenas are drawn shrunk, down to one pixel per tile
+
+
+'''CLASSES'''
+
+class ArenaRenderer():
+
+    # Draws a simulation to the server's window. Trails are painted once onto a persistent layer as they are laid,
+    # and only the parts of the screen that changed are redrawn and passed to pygame.display.update, so a frame
+    # costs the same however long the trails have grown. A player's trail is only repainted while its colour fades
+
+    def __init__(self, caption="Multiplayer Test", arena=None, assets=None):
+        if arena is None:
+            arena = Arena()
+
+        self.arena = arena
+        self.assets = assets if assets is not None else AssetManager()
+        self.cellSize = windowCellSize(arena) # Pixels each tile takes on screen
+
+        size = (arena.gridWidth * self.cellSize, arena.gridHeight * self.cellSize)
+
+        self.screen = pygame.display.set_mode(size)
+        pygame.display.set_caption(caption)
+
+        self.trailLayer = pygame.Surface(size)
+        self.trailLayer.fill(BACKGROUND_COLOUR)
+
+        self.screen.blit(self.trailLayer, (0, 0))
+        pygame.display.flip()
+
+        self.playerTiles = {} # Maps a player number to the rects of its trail tiles on the layer
+        self.trailColours = {} # The colour each player's trail was last painted in
+        self.headRects = {} # Where each player's head was drawn last frame, to be painted over next frame
+
+    def load(self, simulation):
+
+        # Repaints everything from a simulation's current state, for when it has jumped rather than stepped, such as a replay seeking
+
+        self.trailLayer.fill(BACKGROUND_COLOUR)
+        self.playerTiles = {}
+        self.trailColours = {}
+
+        for playerNo, player in enumerate(simulation.players):
+            if player is None:
+                continue
+
+            rects = [self.tileRect(x, y) for x, y in simulation.grid.tilesOf(playerNo)]
+            for rect in rects:
+                self.trailLayer.fill(player.colour, rect)
+
+            if rects:
+                self.playerTiles[playerNo] = rects
+                self.trailColours[playerNo] = player.colour
+
+        self.screen.blit(self.trailLayer, (0, 0))
+        self.headRects = {}
+        pygame.display.flip()
+
+    def draw(self, simulation, changes=None):
+
+        # Draws the changes made by the simulation's last step, or the (addedTiles, clearedPlayers, deaths) of all the steps since
+        # the last frame when it is stepped more often than drawn, the tiles and cleared players merged as mergeTrailDeltas does
+
+        addedTiles, clearedPlayers, deaths = changes if changes is not None else (simulation.addedTiles, simulation.clearedPlayers, simulation.deaths)
+
+        dirtyRects = []
+
+        for playerNo in clearedPlayers: # Paint removed trails over with the background
+            for rect in self.playerTiles.pop(playerNo, []):
+                self.trailLayer.fill(BACKGROUND_COLOUR, rect)
+                dirtyRects.append(rect)
+            self.trailColours.pop(playerNo, None)
+
+        for playerNo, player in enumerate(simulation.players): # Repaint trails whose colour is fading
+            if player is None or playerNo not in self.playerTiles or self.trailColours.get(playerNo) == player.colour:
+                continue
+
+            for rect in self.playerTiles[playerNo]:
+                self.trailLayer.fill(player.colour, rect)
+            dirtyRects.append(self.playerTiles[playerNo][0].unionall(self.playerTiles[playerNo]))
+            self.trailColours[playerNo] = player.colour
+
+        for playerNo, x, y in addedTiles: # Paint the new tiles
+            rect = self.tileRect(x, y)
+            colour = simulation.players[playerNo].colour
+
+            self.trailLayer.fill(colour, rect)
+            dirtyRects.append(rect)
+
+            try:
+                self.playerTiles[playerNo].append(rect)
+            except KeyError:
+                self.playerTiles[playerNo] = [rect]
+            self.trailColours[playerNo] = colour
+
+        newHeadRects = {}
+        for playerNo, player in enumerate(simulation.players):
+            if player is not None:
+                newHeadRects[playerNo] = self.headRect(player.centerx, player.centery, player.width, player.height)
+
+        dirtyRects.extend(self.headRects.values()) # Last frame's heads are covered back up by the layer
+        dirtyRects.extend(newHeadRects.values())
+
+        for rect in dirtyRects:
+            self.screen.blit(self.trailLayer, rect, rect)
+
+        for playerNo, rect in newHeadRects.items(): # Heads always go on top
+            self.screen.fill(simulation.players[playerNo].colour, rect)
+
+        self.headRects = newHeadRects
+
+        for playerNo in deaths:
+            self.playDeathSound()
+
+        pygame.display.update(dirtyRects)
+
+    def tileRect(self, x, y):
+
+        # Returns where a tile is on screen
+
+        return pygame.Rect(x * self.cellSize, y * self.cellSize, self.cellSize, self.cellSize)
+
+    def headRect(self, centerx, centery, width, height):
+
+        # Returns where a player of some size centred on an arena position is on screen, never smaller than a pixel
+
+        cellSize = self.cellSize
+        tileSize = self.arena.tileSize
+
+        return pygame.Rect((centerx - width // 2) * cellSize // tileSize, (centery - height // 2) * cellSize // tileSize,
+                           max(1, width * cellSize // tileSize), max(1, height * cellSize // tileSize))
+
+    def playDeathSound(self):
+
+        # Plays the death sound, used when a simulated player hits something
+
+        self.assets.play("death")
+
+    def handleEvents(self):
+
+        # Processes window events, returns False once the window has been closed
+
+        running = True
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+        return running
+
+
+'''SUBROUTINES'''
+
+def windowCellSize(arena):
+
+    # Returns how many pixels across each tile is drawn, full size unless the arena wouldn't fit in MAX_WINDOW_SIZE
+
+    return max(1, min(arena.tileSize, MAX_WINDOW_SIZE // max(arena.gridWidth, arena.gridHeight)))
@@ -0,0 +1,109 @@
+import struct
+from multiprocessing import shared_memory
+
+
+'''CONSTANTS'''
+
+CONTROL = struct.Struct("=Q") # How many payloads have been published, the newest is in slot count % buffers
+SLOT_HEADER = struct.Struct("=QI") # Slot sequence number (odd while being written), payload length
+
+
+'''CLASSES'''
+
+class SharedSnapshot():
+
+    # A shared memory region holding the newest payload published by one writer, readable by any number of processes without a lock.
+    # Payloads rotate through several buffers, each guarded by a sequence number in the style of a seqlock:
+    # the writer makes the sequence odd while it writes and even again once done, and a reader retries if the sequence
+    # was odd or changed while it copied. With three buffers a reader only retries if it falls two whole publishes behind
+
+    def __init__(self, capacity, buffers=3, name=None):
+        self.capacity = capacity
+        self.buffers = buffers
+        self.slotSize = SLOT_HEADER.size + capacity
+
+        size = CONTROL.size + buffers * self.slotSize
+
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+            self.memory.buf[:size] = bytes(size)
+            self.owner = True
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+            self.owner = False
+
+        self.buffer = self.memory.buf
+
+    def __getstate__(self):
+
+        # Processes that are spawned rather than forked attach to the same region by name
+
+        return (self.capacity, self.buffers, self.memory.name)
+
+    def __setstate__(self, state):
+        capacity, buffers, name = state
+        self.__init__(capacity, buffers, name)
+
+    def slotOffset(self, count):
+        return CONTROL.size + (count % self.buffers) * self.slotSize
+
+    def publishCount(self):
+
+        # Returns how many payloads have been published, a cheap way to check for a new one
+
+        return CONTROL.unpack_from(self.buffer, 0)[0]
+
+    def publish(self, payload):
+
+        # Makes a payload the newest one, never waiting on readers
+
+        length = len(payload)
+
+        if length > self.capacity:
+            raise ValueError(f"Payload of {length} bytes is larger than the {self.capacity} byte capacity")
+
+        count = CONTROL.unpack_from(self.buffer, 0)[0] + 1
+        offset = self.slotOffset(count)
+
+        sequence = SLOT_HEADER.unpack_from(self.buffer, offset)[0]
+
+        SLOT_HEADER.pack_into(self.buffer, offset, sequence + 1, length) # Odd, readers of this slot will retry
+        start = offset + SLOT_HEADER.size
+        self.buffer[start:start + length] = payload
+        SLOT_HEADER.pack_into(self.buffer, offset, sequence + 2, length)
+
+        CONTROL.pack_into(self.buffer, 0, count)
+
+    def read(self):
+
+        # Returns a consistent copy of the newest payload, or None if nothing has been published yet
+
+        buffer = self.buffer
+
+        while True:
+            count = CONTROL.unpack_from(buffer, 0)[0]
+
+            if count == 0:
+                return None
+
+            offset = self.slotOffset(count)
+            sequence, length = SLOT_HEADER.unpack_from(buffer, offset)
+
+            if sequence % 2: # The writer has lapped round to this slot already, look again
+                continue
+
+            start = offset + SLOT_HEADER.size
+            payload = bytes(buffer[start:start + length])
+
+            if SLOT_HEADER.unpack_from(buffer, offset)[0] == sequence:
+                return payload
+
+    def close(self):
+
+        # Detaches this process from the region, the process that created it also frees it
+
+        self.buffer.release()
+        self.memory.close()
+
+        if self.owner:
+            self.memory.unlink()
@@ -0,0 +1,535 @@
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+
+from OccupancyGrid import OccupancyGrid
+from GameSimulation import Arena, TICK_RATE
+from Protocol import decodeSnapshot, snapshotTick, encodeSnapshot, decodeTrailDelta, decodeKeyframe, encodeText, decodeText, encodeRequest, \
+    decodeRequests, messageKind, readMessage, SNAPSHOT_VERSION, TRAIL_DELTA, KEYFRAME
+from TickStats import RollingHistogram
+from TrailHistory import TrailHistory
+
+
+'''CONSTANTS'''
+
+SERVER_ADDRESS = ("127.0.0.1", 5555) # The lobby server the matches are relayed from
+RELAY_PORT = 5557
+
+MAX_STALLED_TICKS = 300 # A spectator that has taken nothing for this many ticks is dropped
+STOP_POLL_INTERVAL = 0.25 # Seconds between checks of the stop event
+
+
+'''CUSTOM PROCESSES'''
+
+class SpectatorRelay(mp.Process):
+
+    # Process fanning matches out to spectators, so a large audience costs the server one connection per match rather than one
+    # per spectator. Each match is subscribed to once, the first time a spectator watches it, and every snapshot that arrives
+    # is passed on to its spectators as the same bytes. The relay keeps its own copy of each board, so keyframes and trail
+    # catch-ups are answered here too. Spectators can ask for fewer updates, and any that can't keep up skip updates rather
+    # than hold anything up, catching up with one trail delta. Several relays can share a port, the system spreading
+    # spectators across them, so a relay per core scales with the audience
+
+    def __init__(self, relayNo=0, serverAddress=SERVER_ADDRESS, host="127.0.0.1", port=RELAY_PORT, sharePort=False, stopEvent=None):
+        super().__init__(name=f"Relay {relayNo}")
+
+        self.relayNo = relayNo
+        self.serverAddress = serverAddress
+        self.host = host
+        self.port = port
+        self.sharePort = sharePort
+        self.stopEvent = stopEvent if stopEvent is not None else mp.Event()
+
+    def run(self):
+
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt: # The terminal's interrupt reaches every process, the main process handles it
+            pass
+
+    async def serve(self):
+
+        # Opens the relay to spectators, then runs until stopped
+
+        self.matches = {} # Maps a match number to its RelayedMatch
+        self.spectators = []
+
+        self.fanOutTimes = RollingHistogram() # Time spent passing each snapshot to a match's spectators
+        self.rateRequests = 0 # Spreads spectators at the same rate over different ticks, so they aren't all sent to at once
+        self.skipped = 0 # Updates not sent because the spectator was still taking an earlier one
+        self.dropped = 0 # Spectators dropped for falling too far behind
+        self.startTime = time.time()
+
+        try:
+            server = await asyncio.start_server(self.handleSpectator, self.host, self.port, reuse_port=self.sharePort or None)
+        except OSError as e:
+            print(str(e))
+            return
+
+        print(f"Relay {self.relayNo} started on port {self.port}, relaying {self.serverAddress[0]}:{self.serverAddress[1]}")
+
+        async with server:
+            while not self.stopEvent.is_set(): # An mp.Event can't be awaited
+                await asyncio.sleep(STOP_POLL_INTERVAL)
+
+        for spectator in list(self.spectators):
+            spectator.writer.close()
+        for match in self.matches.values():
+            if match.writer is not None:
+                match.writer.close()
+
+    async def relayMatch(self, matchNo):
+
+        # Returns the RelayedMatch for a match, subscribing to it on the server the first time it is asked for.
+        # Its error is set if the server has no such match or can't be reached
+
+        match = self.matches.get(matchNo)
+
+        if match is None:
+            match = RelayedMatch(matchNo)
+            self.matches[matchNo] = match
+            asyncio.create_task(self.followMatch(match))
+
+        await match.ready.wait() # A match that failed has already been forgotten by followMatch, so the next spectator to ask tries again
+        return match
+
+    async def followMatch(self, match):
+
+        # Subscribes to a match on the server and keeps its board up to date from everything the server sends, for as long as the relay runs
+
+        try:
+            reader, writer = await asyncio.open_connection(*self.serverAddress)
+            match.writer = writer
+
+            await readMessage(reader) # "Connected"
+
+            writer.write(encodeRequest(f"Watch {match.matchNo + 1}"))
+            reply = decodeText(await readMessage(reader))
+            if not reply.startswith("Watching "):
+                raise ConnectionError(reply)
+
+            writer.write(encodeRequest("Arena"))
+            match.loadArena(decodeText(await readMessage(reader)))
+
+            writer.write(encodeRequest("Keyframe") + encodeRequest("Subscribe")) # The keyframe comes first, so every snapshot after it can be applied
+            match.applyKeyframe(await readMessage(reader))
+            match.ready.set()
+
+            while not self.stopEvent.is_set():
+                message = await readMessage(reader)
+                kind = messageKind(message)
+
+                if kind == SNAPSHOT_VERSION:
+                    resync = match.applySnapshot(message)
+
+                    if resync is not None:
+                        writer.write(encodeRequest(resync))
+                    elif match.latestSnapshot is message:
+                        start = time.perf_counter()
+                        self.fanOut(match)
+                        self.fanOutTimes.add(time.perf_counter() - start)
+
+                elif kind == TRAIL_DELTA:
+                    match.applyTrail(message)
+
+                elif kind == KEYFRAME:
+                    match.applyKeyframe(message)
+
+        except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+            print(f"Relay {self.relayNo} lost Match {match.matchNo + 1}: {e!r}")
+            match.error = e
+
+            if match.writer is not None:
+                match.writer.close()
+
+            for spectator in list(match.spectators): # They reconnect to watch again, by which time the server may be back
+                spectator.writer.close()
+            if self.matches.get(match.matchNo) is match:
+                del self.matches[match.matchNo]
+
+            match.ready.set()
+
+    def fanOut(self, match):
+
+        # Passes a match's newest snapshot to its spectators. Only those whose rate falls on this tick get it. One that is still
+        # sending an earlier update skips this one, and one that skipped any gets the trail changes it missed in one delta first.
+        # Spectators that catch up from the same tick share one encoded delta
+
+        tick = match.tick
+        snapshot = match.latestSnapshot
+        catchUps = {} # Maps a tick to the encoded trail changes since it
+
+        for spectator in list(match.spectators):
+            if (tick + spectator.phase) % spectator.interval:
+                continue
+
+            if spectator.writer.transport.get_write_buffer_size() > 0:
+                spectator.skippedTicks += spectator.interval
+                self.skipped += 1
+                if spectator.skippedTicks > MAX_STALLED_TICKS:
+                    print(f"Dropping slow spectator {spectator.address}")
+                    self.dropped += 1
+                    match.spectators.remove(spectator)
+                    spectator.writer.close()
+                continue
+
+            spectator.skippedTicks = 0
+            lastSentTick = spectator.lastSentTick
+
+            if lastSentTick is not None and lastSentTick < tick - match.snapshotInterval:
+                if lastSentTick not in catchUps:
+                    catchUps[lastSentTick] = match.trailSince(lastSentTick)
+                spectator.send(catchUps[lastSentTick])
+
+            spectator.send(snapshot)
+            spectator.lastSentTick = tick
+
+    async def handleSpectator(self, reader, writer):
+
+        # Handles a connected spectator until it disconnects, in the same framing as the server
+
+        spectator = Spectator(reader, writer, writer.get_extra_info("peername"))
+        self.spectators.append(spectator)
+
+        spectator.reply("Connected")
+
+        buffer = bytearray()
+        connected = True
+
+        try:
+            while connected and not self.stopEvent.is_set():
+                data = await reader.read(65536)
+                if not data:
+                    break
+
+                spectator.bytesIn += len(data)
+                buffer += data
+
+                requests, used = decodeRequests(buffer)
+                del buffer[:used]
+
+                for request, ack in requests:
+                    spectator.requests += 1
+                    if not await self.handleRequest(spectator, request, ack):
+                        connected = False
+                        break
+
+                await writer.drain()
+
+        except (ConnectionError, ValueError) as e:
+            print("Error:", e)
+
+        self.spectators.remove(spectator)
+        if spectator.match is not None and spectator in spectator.match.spectators:
+            spectator.match.spectators.remove(spectator)
+
+        writer.close()
+
+    async def handleRequest(self, spectator, request, ack=False):
+
+        # Answers one request from a spectator, returns False once it should be disconnected. The relay answers the same
+        # queries as the server about the match being watched, but has no players, so inputs go nowhere
+
+        if request.startswith("Watch "): # Watch another match, numbered from 1
+            try:
+                matchNo = int(request.split(" ", 1)[1]) - 1
+            except ValueError:
+                matchNo = -1
+
+            match = await self.relayMatch(matchNo) if matchNo >= 0 else None
+
+            if match is None or match.error is not None:
+                spectator.reply(f"No Match {request.split(' ', 1)[1]}")
+            else:
+                if spectator.match is not None and spectator in spectator.match.spectators: # Keeps a subscribed spectator subscribed
+                    spectator.match.spectators.remove(spectator)
+                    match.spectators.append(spectator)
+                    spectator.lastSentTick = None
+                spectator.match = match
+                spectator.reply(f"Watching Match {matchNo + 1}")
+
+        elif request.startswith("Rate "): # Ask for fewer updates a second, rounded so every update lands on a tick the server sent a snapshot for
+            match = await self.watchedMatch(spectator)
+            snapshotRate = match.tickRate / match.snapshotInterval
+
+            try:
+                rate = float(request.split(" ", 1)[1])
+            except ValueError:
+                rate = snapshotRate
+            snapshots = max(1, round(snapshotRate / rate)) if rate > 0 else 1 # Snapshots from one update to the next
+
+            spectator.interval = snapshots * match.snapshotInterval
+            spectator.phase = self.rateRequests % snapshots * match.snapshotInterval
+            self.rateRequests += 1
+            spectator.reply(f"Rate {match.tickRate / spectator.interval:g}")
+
+        elif request == "Stats":
+            spectator.reply(self.stats())
+
+        elif request == "Disconnect":
+            spectator.reply("Disconnecting...")
+            return False
+
+        elif request == "Create Player":
+            spectator.reply("Spectator")
+
+        elif request in ("Data", "Keyframe", "Arena", "Subscribe", "Subscribe UDP") or request.startswith("Trail "):
+            match = await self.watchedMatch(spectator)
+
+            if match.error is not None:
+                spectator.reply(f"Match {match.matchNo + 1} unavailable")
+
+            elif request == "Data":
+                spectator.send(match.latestSnapshot if match.latestSnapshot is not None else encodeSnapshot(match.tick, []))
+
+            elif request == "Keyframe":
+                spectator.send(match.keyframe())
+
+            elif request == "Arena":
+                spectator.reply(match.arena)
+
+            elif request.startswith("Trail "):
+                try:
+                    spectator.send(match.trailSince(int(request.split(" ", 1)[1])))
+                except ValueError:
+                    spectator.send(match.keyframe())
+
+            else: # Subscriptions are always over TCP from a relay
+                spectator.reply("Subscribed")
+                if spectator not in match.spectators:
+                    match.spectators.append(spectator)
+
+        elif request == "Matches": # Passed on to the server, as the relay only knows the matches being watched through it
+            spectator.reply(await self.serverQuery(request))
+
+        elif ack:
+            spectator.reply(f"No player for request of {request}")
+
+        return True
+
+    async def serverQuery(self, request):
+
+        # Asks the server a text query on a connection of its own and returns the answer. For rare queries only
+
+        try:
+            reader, writer = await asyncio.open_connection(*self.serverAddress)
+        except OSError as e:
+            return f"Server unavailable: {e}"
+
+        try:
+            await readMessage(reader) # "Connected"
+            writer.write(encodeRequest(request))
+            return decodeText(await readMessage(reader))
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            return f"Server unavailable: {e!r}"
+        finally:
+            writer.close()
+
+    async def watchedMatch(self, spectator):
+
+        # Returns the match a spectator's queries are about, the first match until it watches another
+
+        if spectator.match is None or spectator.match.error is not None:
+            spectator.match = await self.relayMatch(0)
+
+        return spectator.match
+
+    def stats(self):
+
+        # Returns the relay's stats as JSON. Its processor time shows how much of a core its spectators take
+
+        return json.dumps({
+            "relay": self.relayNo,
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.startTime, 1),
+            "cpuSeconds": round(time.process_time(), 3),
+            "spectators": len(self.spectators),
+            "subscribed": sum(len(match.spectators) for match in self.matches.values()),
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+            "fanOut": self.fanOutTimes.summary(),
+            "matches": [{"match": match.matchNo + 1, "tick": match.tick, "spectators": len(match.spectators)} for match in self.matches.values()],
+        })
+
+
+'''CLASSES'''
+
+class RelayedMatch():
+
+    # One match as the relay sees it: a copy of its board and recent trail changes, kept up to date from the server's snapshots,
+    # and the spectators subscribed to it
+
+    def __init__(self, matchNo):
+        self.matchNo = matchNo
+        self.arena = None # The server's answer to "Arena", passed on as it is
+        self.tickRate = TICK_RATE
+        self.snapshotInterval = 1 # Ticks from one of the server's snapshots to the next
+        self.writer = None # The connection to the server
+
+        self.ready = asyncio.Event() # Set once the board has been loaded, or following the match has failed
+        self.error = None
+
+        self.grid = None
+        self.resyncing = False # Whether the relay has asked the server for changes it missed
+        self.latestSnapshot = None
+        self.trailHistory = TrailHistory()
+
+        self.spectators = []
+
+    @property
+    def tick(self):
+
+        # The tick the board is up to date with
+
+        return self.trailHistory.lastTick
+
+    def loadArena(self, text):
+
+        # Keeps the server's answer to "Arena", and the rates in it that say which ticks have snapshots
+
+        arena = Arena.fromDict(json.loads(text))
+
+        self.arena = text
+        self.tickRate = arena.tickRate
+        self.snapshotInterval = arena.snapshotInterval
+        self.trailHistory = TrailHistory(arena.snapshotInterval)
+
+    def applySnapshot(self, snapshot):
+
+        # Brings the board up to a new snapshot. Returns what to ask the server for if ticks were missed, otherwise None
+
+        tick = snapshotTick(snapshot)
+
+        if self.resyncing or tick <= self.tick: # The answer to the resync covers this one
+            return None
+
+        if tick != self.tick + self.snapshotInterval:
+            self.resyncing = True
+            return f"Trail {self.tick}"
+
+        tick, playerData, addedTiles, clearedPlayers = decodeSnapshot(snapshot)
+        self.applyChanges(addedTiles, clearedPlayers)
+
+        self.trailHistory.add(tick, addedTiles, clearedPlayers)
+        self.latestSnapshot = snapshot
+
+        return None
+
+    def applyTrail(self, message):
+
+        # Applies the server's answer to a resync. The history can't bridge the gap, so spectators behind it are sent a keyframe
+
+        fromTick, toTick, addedTiles, clearedPlayers = decodeTrailDelta(message)
+
+        if fromTick != self.tick:
+            return
+
+        self.applyChanges(addedTiles, clearedPlayers)
+        self.trailHistory.reset(toTick)
+        self.resyncing = False
+
+    def applyKeyframe(self, message):
+
+        # Replaces the whole board
+
+        tick, width, height, cells = decodeKeyframe(message)
+
+        if self.grid is None:
+            self.grid = OccupancyGrid(width, height)
+        self.grid.loadCells(cells)
+
+        self.trailHistory.reset(tick)
+        self.resyncing = False
+
+    def applyChanges(self, addedTiles, clearedPlayers):
+        for playerNo in clearedPlayers:
+            self.grid.clearPlayer(playerNo)
+        for playerNo, x, y in addedTiles:
+            self.grid.mark(x, y, playerNo)
+
+    def trailSince(self, tick):
+
+        # Returns the trail changes after a tick as one delta, or a keyframe if the history doesn't go back that far
+
+        delta = self.trailHistory.since(tick)
+
+        return delta if delta is not None else self.keyframe()
+
+    def keyframe(self):
+
+        # Returns the whole board as a keyframe, encoded at most once a tick
+
+        return self.trailHistory.keyframe(self.grid.width, self.grid.height, lambda: bytes(self.grid.cells))
+
+class Spectator():
+
+    # One connection to the relay, along with the rate it wants updates at and how far it has got
+
+    def __init__(self, reader, writer, address):
+        self.reader = reader
+        self.writer = writer
+        self.address = address
+        self.match = None # The RelayedMatch this spectator watches
+
+        self.interval = 1 # Ticks between updates
+        self.phase = 0 # Updates go out on ticks where tick + phase is a multiple of the interval
+        self.lastSentTick = None # Tick of the last snapshot sent, when subscribed
+        self.skippedTicks = 0 # Ticks in a row this spectator has been too slow to take an update
+
+        self.bytesIn = 0
+        self.bytesOut = 0
+        self.requests = 0
+
+    def send(self, data):
+        self.writer.write(data)
+        self.bytesOut += len(data)
+
+    def reply(self, text):
+        self.send(encodeText(text))
+
+
+'''SUBROUTINES'''
+
+def parseAddress(text, defaultPort):
+
+    # Returns a (host, port) pair from "host", "host:port" or ":port"
+
+    host, _, port = text.rpartition(":") if ":" in text else (text, "", "")
+    return (host or "127.0.0.1", int(port) if port else defaultPort)
+
+
+'''MAIN'''
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Relays a server's matches to spectators, so audiences can grow without loading the server")
+    parser.add_argument("--server", default=f"{SERVER_ADDRESS[0]}:{SERVER_ADDRESS[1]}", metavar="HOST[:PORT]", help="the server to relay")
+    parser.add_argument("--host", default="127.0.0.1", help="address spectators connect to")
+    parser.add_argument("--port", type=int, default=RELAY_PORT)
+    parser.add_argument("--relays", type=int, default=1, help="how many relay processes share the port, one per core suits large audiences")
+    args = parser.parse_args()
+
+    serverAddress = parseAddress(args.server, SERVER_ADDRESS[1])
+    relayCount = max(1, args.relays)
+    stopEvent = mp.Event()
+
+    relays = [SpectatorRelay(relayNo, serverAddress, args.host, args.port, relayCount > 1, stopEvent) for relayNo in range(relayCount)]
+    for relay in relays:
+        relay.start()
+
+    try:
+        for relay in relays:
+            relay.join()
+    except KeyboardInterrupt:
+        stopEvent.set()
+        for relay in relays:
+            relay.join()
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
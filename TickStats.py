@@ -0,0 +1,96 @@
+import time
+from collections import deque
+
+
+'''CONSTANTS'''
+
+BUCKET_EDGES = tuple(2 ** power for power in range(24)) # Histogram bucket upper edges in microseconds, 1us up to about 8s
+
+
+'''CLASSES'''
+
+class RollingHistogram():
+
+    # Holds the most recent timings of something, in seconds. Adding is one append, all the sorting and
+    # bucketing is left until a summary is asked for, so it is cheap enough to use on every tick
+
+    def __init__(self, window=600):
+        self.samples = deque(maxlen=window)
+        self.total = 0 # Every sample ever added, not just the ones in the window
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.total += 1
+
+    def summary(self):
+
+        # Returns the count, mean and percentiles of the window in microseconds, plus a log2 bucketed histogram
+
+        if not self.samples:
+            return {"count": 0, "total": self.total}
+
+        ordered = sorted(self.samples)
+        count = len(ordered)
+
+        buckets = {}
+        edgeIndex = 0
+        for sample in ordered:
+            micros = sample * 1e6
+            while edgeIndex < len(BUCKET_EDGES) - 1 and micros > BUCKET_EDGES[edgeIndex]:
+                edgeIndex += 1
+            buckets[BUCKET_EDGES[edgeIndex]] = buckets.get(BUCKET_EDGES[edgeIndex], 0) + 1
+
+        return {
+            "count": count,
+            "total": self.total,
+            "meanUs": round(sum(ordered) / count * 1e6, 1),
+            "p50Us": round(ordered[count // 2] * 1e6, 1),
+            "p99Us": round(ordered[min(count - 1, int(count * 0.99))] * 1e6, 1),
+            "maxUs": round(ordered[-1] * 1e6, 1),
+            "histogramUs": {f"<={edge}": amount for edge, amount in buckets.items()},
+        }
+
+class PhaseTimer():
+
+    # Times the phases of each tick of a loop. Call start() at the top of the loop and lap() at the end of each phase
+
+    def __init__(self, phases, window=600):
+        self.phases = phases
+        self.histograms = {phase: RollingHistogram(window) for phase in phases}
+        self.tickStart = None
+        self.lastLap = None
+
+    def start(self):
+        self.lastLap = time.perf_counter()
+        self.tickStart = self.lastLap
+
+    def lap(self, phase):
+
+        # Records the time since the last lap against a phase
+
+        now = time.perf_counter()
+        self.histograms[phase].add(now - self.lastLap)
+        self.lastLap = now
+
+    def skip(self):
+
+        # Moves the lap point on without recording anything, for time that belongs to no phase
+
+        self.lastLap = time.perf_counter()
+
+    def summary(self):
+
+        # Returns each phase's summary
+
+        return {phase: self.histograms[phase].summary() for phase in self.phases}
+
+    def logLine(self):
+
+        # Returns a one line overview of the phases' mean and worst times
+
+        parts = []
+        for phase in self.phases:
+            summary = self.histograms[phase].summary()
+            if summary["count"]:
+                parts.append(f"{phase} {summary['meanUs']:.0f}/{summary['maxUs']:.0f}us")
+        return "Tick phases (mean/max): " + ", ".join(parts)
@@ -0,0 +1,186 @@
+import argparse
+import multiprocessing as mp
+import os
+import signal
+import struct
+import sys
+import time
+
+from GameSimulation import Simulation, Arena, ARENA_SIZE, TILE_SIZE, MAX_PLAYERS, parseArenaSize
+from Bots import BotController, SEARCH_RADIUS
+
+
+'''CONSTANTS'''
+
+# A results file is a header followed by one record per match, in the order they finished. Each match's bots are seeded from
+# its seed and search without a time budget, so the same seed always plays out the same match whichever worker it ran on
+
+MAGIC = b"TRNR"
+RESULTS_VERSION = 1
+
+RESULTS_HEADER = struct.Struct("!4sBHHBBII") # Magic, version, arena width, arena height, tile size, number of players, first seed, tick limit
+MATCH_RECORD = struct.Struct("!IIB") # Seed, length in ticks, winner's player number. Followed by the tick each player died on, as "!I" each
+
+NO_WINNER = 0xFF # Winner of a match where the last players died together, or more than one was still alive at the tick limit
+
+MAX_TICKS = 36000 # 10 minutes at 60 Hz
+PROGRESS_INTERVAL = 1 # Seconds between progress reports
+
+
+'''SUBROUTINES'''
+
+def playMatch(job):
+
+    # Plays one match of bots to the end, as fast as possible. Returns its seed, length, winner and how long each player survived
+
+    arena, seed, maxTicks, radius = job
+
+    simulation = Simulation(arena)
+    bots = BotController(simulation, arena.maxPlayers, None, seed, radius, rejoin=False) # Each bot plays once, the match is over when one is left
+
+    survival = [None for x in range(arena.maxPlayers)] # Tick each player died on, None while alive
+
+    simulation.step(bots.inputs()) # Everyone joins on the first tick
+
+    while simulation.tick < maxTicks:
+        simulation.step(bots.inputs())
+
+        for playerNo in simulation.deaths:
+            survival[playerNo] = simulation.tick
+
+        if sum(1 for tick in survival if tick is None) <= 1:
+            break
+
+    alive = [playerNo for playerNo, tick in enumerate(survival) if tick is None]
+    winner = alive[0] if len(alive) == 1 else NO_WINNER
+
+    return seed, simulation.tick, winner, [simulation.tick if tick is None else tick for tick in survival]
+
+def ignoreInterrupts():
+
+    # Runs in each pool process, leaving the terminal's interrupt to the main process which stops the pool
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def runTournament(path, arena, matchCount, firstSeed=0, maxTicks=MAX_TICKS, radius=SEARCH_RADIUS, workers=None, progress=True):
+
+    # Plays matches with consecutive seeds across a pool of processes, writing each result to the file as soon as it comes in.
+    # Returns how many matches finished and how long they took, which is fewer than asked for if interrupted
+
+    workers = workers or os.cpu_count() or 1
+    jobs = ((arena, seed, maxTicks, radius) for seed in range(firstSeed, firstSeed + matchCount))
+
+    survivalRecord = struct.Struct(f"!{arena.maxPlayers}I")
+
+    finished = 0
+    start = time.perf_counter()
+    nextProgress = start + PROGRESS_INTERVAL
+
+    with open(path, "wb") as file, mp.Pool(workers, ignoreInterrupts) as pool:
+        file.write(RESULTS_HEADER.pack(MAGIC, RESULTS_VERSION, arena.width, arena.height, arena.tileSize, arena.maxPlayers, firstSeed, maxTicks))
+
+        try:
+            for seed, length, winner, survival in pool.imap_unordered(playMatch, jobs): # Matches take seconds each, so handing them out one at a time costs nothing
+                file.write(MATCH_RECORD.pack(seed, length, winner) + survivalRecord.pack(*survival))
+                finished += 1
+
+                now = time.perf_counter()
+                if progress and now >= nextProgress:
+                    print(f"{finished}/{matchCount} matches, {finished / (now - start):.1f} matches per second")
+                    nextProgress = now + PROGRESS_INTERVAL
+
+        except KeyboardInterrupt: # The pool is terminated on the way out, every result written so far is kept
+            pass
+
+    return finished, time.perf_counter() - start
+
+def readResults(path):
+
+    # Returns the arena, first seed and tick limit of a results file, along with every (seed, length, winner, survival) it holds
+
+    with open(path, "rb") as file:
+        data = file.read()
+
+    magic, version, width, height, tileSize, maxPlayers, firstSeed, maxTicks = RESULTS_HEADER.unpack_from(data)
+
+    if magic != MAGIC:
+        raise ValueError("Not a results file")
+    if version != RESULTS_VERSION:
+        raise ValueError(f"Unsupported results version {version}")
+
+    arena = Arena(width, height, tileSize, maxPlayers)
+    survivalRecord = struct.Struct(f"!{maxPlayers}I")
+    recordSize = MATCH_RECORD.size + survivalRecord.size
+
+    results = []
+    for offset in range(RESULTS_HEADER.size, len(data) - recordSize + 1, recordSize): # A file cut off mid record loses just that match
+        seed, length, winner = MATCH_RECORD.unpack_from(data, offset)
+        results.append((seed, length, winner, list(survivalRecord.unpack_from(data, offset + MATCH_RECORD.size))))
+
+    return arena, firstSeed, maxTicks, results
+
+def printSummary(arena, results):
+
+    # Prints how often each player slot won and how long it survived on average, which shows up any imbalance between spawn points
+
+    if not results:
+        print("No matches played")
+        return
+
+    matchCount = len(results)
+    lengths = sorted(length for seed, length, winner, survival in results)
+    draws = sum(1 for seed, length, winner, survival in results if winner == NO_WINNER)
+
+    print(f"{matchCount} matches of {arena.maxPlayers} players on {arena.gridWidth}x{arena.gridHeight} tiles")
+    print(f"Length: mean {sum(lengths) / matchCount:.0f} ticks, median {lengths[matchCount // 2]}, longest {lengths[-1]}. {draws} with no winner")
+    print(f"{'Player':>7} {'Wins':>6} {'Win rate':>9} {'Mean survival':>14}")
+
+    for playerNo in range(arena.maxPlayers):
+        wins = sum(1 for seed, length, winner, survival in results if winner == playerNo)
+        meanSurvival = sum(survival[playerNo] for seed, length, winner, survival in results) / matchCount
+
+        print(f"{playerNo + 1:>7} {wins:>6} {wins / matchCount:>9.1%} {meanSurvival:>14.0f}")
+
+
+'''MAIN'''
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Plays matches of bots headless across every core and records the results, for tuning bots and balance")
+    parser.add_argument("matches", type=int, nargs="?", default=1000)
+    parser.add_argument("--results", default="tournament.results", metavar="PATH", help="file the results are written to")
+    parser.add_argument("--summary", metavar="PATH", help="summarise an existing results file rather than playing")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first match, each match after it uses the next")
+    parser.add_argument("--workers", type=int, help="how many processes play matches, one per core by default")
+    parser.add_argument("--arena", default=str(ARENA_SIZE), metavar="WIDTH[xHEIGHT]", help="size of the arena in pixels")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE)
+    parser.add_argument("--players", type=int, default=MAX_PLAYERS)
+    parser.add_argument("--max-ticks", type=int, default=MAX_TICKS, help="ticks after which a match is stopped")
+    parser.add_argument("--radius", type=int, default=SEARCH_RADIUS, help="how many tiles around them bots search")
+    args = parser.parse_args()
+
+    if args.summary:
+        arena, firstSeed, maxTicks, results = readResults(args.summary)
+        printSummary(arena, results)
+        return 0
+
+    try:
+        arena = Arena(*parseArenaSize(args.arena), args.tile_size, args.players)
+    except ValueError as e:
+        parser.error(str(e))
+
+    workers = args.workers or os.cpu_count() or 1
+
+    print(f"Playing {args.matches} matches from seed {args.seed} on {workers} workers")
+
+    finished, elapsed = runTournament(args.results, arena, args.matches, args.seed, args.max_ticks, args.radius, workers)
+
+    print(f"Played {finished} matches in {elapsed:.1f}s, {finished / elapsed:.1f} matches per second. Results in {args.results}")
+
+    arena, firstSeed, maxTicks, results = readResults(args.results)
+    printSummary(arena, results)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
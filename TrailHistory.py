@@ -0,0 +1,69 @@
+from collections import deque
+
+from Protocol import encodeTrailDelta, mergeTrailDeltas, encodeKeyframe
+
+
+'''CONSTANTS'''
+
+TRAIL_HISTORY_TICKS = 120 # How many ticks of trail changes are kept for catching up, older than this and a keyframe is sent instead
+
+
+'''CLASSES'''
+
+class TrailHistory():
+
+    # The trail changes of a match's recent snapshots, kept with no gaps along with the tick the board is up to date with,
+    # so anyone who missed some snapshots can be caught up with one merged delta. Used by the server and by spectator relays
+
+    def __init__(self, snapshotInterval=1, historyTicks=TRAIL_HISTORY_TICKS):
+        self.snapshotInterval = snapshotInterval # Ticks from one snapshot to the next
+        self.entries = deque(maxlen=max(1, historyTicks // snapshotInterval)) # (tick, addedTiles, clearedPlayers) for each recent snapshot
+        self.lastTick = None # The tick of the newest changes, None until there are any
+
+        self.keyframeCache = None # (tick, keyframe), as many clients joining at once all ask for the same one
+
+    def add(self, tick, addedTiles, clearedPlayers):
+
+        # Records the changes of a new snapshot. If any snapshots were missed the older changes can't bridge the gap, so they are dropped
+
+        if self.lastTick is None or tick != self.lastTick + self.snapshotInterval:
+            self.entries.clear()
+
+        self.entries.append((tick, addedTiles, clearedPlayers))
+        self.lastTick = tick
+
+    def reset(self, tick):
+
+        # Forgets every change, for when the board has jumped to a tick without them, such as loading a keyframe
+
+        self.entries.clear()
+        self.lastTick = tick
+
+    def since(self, tick):
+
+        # Returns the changes after a tick up to the last one as an encoded trail delta, or None if the history doesn't go back that far
+
+        if self.lastTick is None:
+            return None
+
+        if tick >= self.lastTick:
+            return encodeTrailDelta(tick, tick, [], [])
+
+        if self.entries and self.entries[0][0] <= tick + self.snapshotInterval: # The oldest entry holds the changes since the snapshot before it
+            deltas = [(addedTiles, clearedPlayers) for historyTick, addedTiles, clearedPlayers in self.entries if historyTick > tick]
+            return encodeTrailDelta(tick, self.lastTick, *mergeTrailDeltas(deltas))
+
+        return None
+
+    def keyframe(self, width, height, cells):
+
+        # Returns a board's cells as a keyframe labelled with the last tick, encoded at most once a tick. Cells is called for
+        # the board's bytes only when a new keyframe is needed. A board that has moved on since the last tick is still
+        # a correct keyframe for it, as re-applying the later changes on top of it leaves the same board
+
+        tick = self.lastTick if self.lastTick is not None else 0
+
+        if self.keyframeCache is None or self.keyframeCache[0] != tick:
+            self.keyframeCache = (tick, encodeKeyframe(tick, width, height, cells()))
+
+        return self.keyframeCache[1]
@@ -0,0 +1,336 @@
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from Protocol import encodeRequest, decodeText, encodeHello, snapshotTick, messageKind, readMessage, SNAPSHOT_VERSION
+from LoadTest import percentile
+
+
+'''CONSTANTS'''
+
+HELLO_INTERVAL = 0.5 # Seconds between a UDP subscriber's hellos, as some are lost on the way
+FAST_RETRANSMIT_PACKETS = 3 # Later packets that must arrive before TCP resends a lost one
+
+
+'''CLASSES'''
+
+class ImpairedLink():
+
+    # Stands between the test's clients and the server on localhost, delaying traffic and losing some of it as a poor
+    # connection would. Datagrams are lost or delayed one by one, so they can also arrive out of order. TCP can't lose
+    # anything, so a lost chunk instead arrives once it would have been resent, and, as TCP delivers everything in order,
+    # every chunk behind it waits for it: the head-of-line blocking that UDP snapshots avoid
+
+    def __init__(self, serverAddress, latency, jitter, tickRate, seed=0):
+        self.serverAddress = serverAddress
+        self.latency = latency # One way, in seconds
+        self.jitter = jitter # Most extra delay on top of latency, in seconds
+        self.loss = 0 # Chance of each packet being lost
+        self.random = random.Random(seed)
+
+        # Fast retransmit: the receiver's duplicate acknowledgements of the next few packets reach the sender a latency later,
+        # and the resent packet takes another latency. Snapshots go out once a tick, so that is how often packets follow
+        self.retransmitDelay = FAST_RETRANSMIT_PACKETS / tickRate + 2 * latency
+
+        self.upstreams = {} # Maps a client's UDP address to the endpoint relaying its datagrams to and from the server
+
+    async def start(self, host, port):
+
+        # Starts relaying TCP connections and UDP datagrams made to an address
+
+        loop = asyncio.get_running_loop()
+
+        self.server = await asyncio.start_server(self.relayConnection, host, port)
+        self.listening, protocol = await loop.create_datagram_endpoint(lambda: LinkDatagrams(self), local_addr=(host, port))
+
+    def close(self):
+        self.server.close()
+        self.listening.close()
+
+    def delay(self):
+        return self.latency + self.random.uniform(0, self.jitter)
+
+    def lost(self):
+        return self.random.random() < self.loss
+
+    async def relayConnection(self, reader, writer):
+
+        # Relays one TCP connection to the server, impairing both directions
+
+        try:
+            upReader, upWriter = await asyncio.open_connection(*self.serverAddress)
+        except OSError:
+            writer.close()
+            return
+
+        await asyncio.gather(self.pump(reader, upWriter), self.pump(upReader, writer))
+
+    async def pump(self, reader, writer):
+
+        # Copies one direction of a TCP connection, each chunk arriving after a delay and never before the chunk ahead of it
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        lastDelivery = 0
+
+        async def deliver():
+            while True:
+                deliverAt, data = await queue.get()
+                await asyncio.sleep(max(0, deliverAt - loop.time()))
+
+                if data is None:
+                    break
+
+                writer.write(data)
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    break
+
+            writer.close()
+
+        delivery = asyncio.create_task(deliver())
+
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+
+                deliverAt = loop.time() + self.delay()
+                if self.lost():
+                    deliverAt += self.retransmitDelay
+
+                lastDelivery = max(deliverAt, lastDelivery)
+                queue.put_nowait((lastDelivery, data))
+
+        except ConnectionError:
+            pass
+
+        queue.put_nowait((lastDelivery, None))
+        await delivery
+
+    def datagramReceived(self, endpoint, data, address):
+
+        # Relays a datagram, from a client to the server through that client's own upstream endpoint, or back again
+
+        if endpoint.clientAddress is None:
+            asyncio.ensure_future(self.relayUp(data, address))
+        elif not self.lost():
+            asyncio.get_running_loop().call_later(self.delay(), self.listening.sendto, data, endpoint.clientAddress)
+
+    async def relayUp(self, data, address):
+
+        # Sends a client's datagram on to the server from an endpoint kept for that client, so the server's replies can be told apart
+
+        if address not in self.upstreams:
+            loop = asyncio.get_running_loop()
+            self.upstreams[address] = asyncio.ensure_future(loop.create_datagram_endpoint(lambda: LinkDatagrams(self, address), remote_addr=self.serverAddress))
+
+        transport, protocol = await self.upstreams[address]
+
+        if not self.lost():
+            asyncio.get_running_loop().call_later(self.delay(), transport.sendto, data)
+
+class LinkDatagrams(asyncio.DatagramProtocol):
+
+    # One of the link's UDP endpoints, the one clients send to if it has no client address, otherwise one relaying a client to the server
+
+    def __init__(self, link, clientAddress=None):
+        self.link = link
+        self.clientAddress = clientAddress
+
+    def datagram_received(self, data, address):
+        self.link.datagramReceived(self, data, address)
+
+    def error_received(self, e):
+        pass
+
+class Subscriber():
+
+    # One client subscribed to the first match's snapshots through the link, over TCP or UDP, recording when each arrived.
+    # Like MultiplayerTestClient, a snapshot older than one already received is dropped
+
+    def __init__(self, transport, address):
+        self.transport = transport
+        self.address = address
+
+        self.arrivals = [] # (receive time, tick) of every snapshot kept
+        self.stale = 0 # Snapshots dropped for arriving after a newer one
+        self.newestTick = None
+
+    def receive(self, snapshot):
+        if messageKind(snapshot) != SNAPSHOT_VERSION:
+            return
+
+        tick = snapshotTick(snapshot)
+
+        if self.newestTick is not None and tick <= self.newestTick:
+            self.stale += 1
+            return
+
+        self.newestTick = tick
+        self.arrivals.append((time.perf_counter(), tick))
+
+    async def run(self, endTime):
+
+        # Subscribes and records snapshots until endTime
+
+        reader, writer = await asyncio.open_connection(*self.address)
+
+        try:
+            await readMessage(reader) # "Connected"
+            writer.write(encodeRequest("Subscribe UDP" if self.transport == "UDP" else "Subscribe"))
+            reply = decodeText(await readMessage(reader))
+
+            if reply.startswith("Subscribed UDP "):
+                await self.receiveDatagrams(int(reply.split(" ")[2]), endTime)
+            elif self.transport == "UDP":
+                raise ConnectionError("Server would not send snapshots over UDP")
+            else:
+                await self.receiveStream(reader, endTime)
+
+        finally:
+            writer.close()
+
+    async def receiveStream(self, reader, endTime):
+        while time.perf_counter() < endTime:
+            try:
+                self.receive(await asyncio.wait_for(readMessage(reader), max(0.01, endTime - time.perf_counter())))
+            except asyncio.TimeoutError:
+                break
+
+    async def receiveDatagrams(self, token, endTime):
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.create_datagram_endpoint(lambda: SubscriberDatagrams(self), remote_addr=self.address)
+
+        try:
+            while time.perf_counter() < endTime:
+                transport.sendto(encodeHello(token))
+                await asyncio.sleep(min(HELLO_INTERVAL, max(0, endTime - time.perf_counter())))
+        finally:
+            transport.close()
+
+class SubscriberDatagrams(asyncio.DatagramProtocol):
+
+    # A UDP subscriber's endpoint, handing every datagram to it
+
+    def __init__(self, subscriber):
+        self.subscriber = subscriber
+
+    def datagram_received(self, data, address):
+        self.subscriber.receive(data)
+
+    def error_received(self, e):
+        pass
+
+
+'''SUBROUTINES'''
+
+def frameAges(arrivals, firstSeen, start, end, tickRate):
+
+    # Returns how old the newest snapshot a client held was at each frame between start and end, in seconds.
+    # A snapshot's age is the time since it was first delivered to either client
+
+    ages = []
+    index = 0
+    newestTick = None
+    frame = start
+
+    while frame < end:
+        while index < len(arrivals) and arrivals[index][0] <= frame:
+            newestTick = arrivals[index][1]
+            index += 1
+
+        if newestTick is not None:
+            ages.append(frame - firstSeen[newestTick])
+
+        frame += 1 / tickRate
+
+    return sorted(ages)
+
+async def compareTransports(link, address, loss, duration):
+
+    # Runs a TCP and a UDP subscriber side by side through the link at one loss rate, returns both
+
+    link.loss = loss
+    endTime = time.perf_counter() + duration
+
+    subscribers = [Subscriber("TCP", address), Subscriber("UDP", address)]
+    await asyncio.gather(*[subscriber.run(endTime) for subscriber in subscribers])
+
+    await asyncio.sleep(link.retransmitDelay + 2 * link.latency) # Lets the link's connections wind down before the next run
+
+    return subscribers
+
+def report(loss, subscribers, duration, tickRate):
+
+    # Prints one line per transport. Both clients go through the same link at the same time, so whichever got a tick first
+    # shows when it could have arrived. Measuring from that rather than from the tick's number leaves out the server's own timing
+
+    firstSeen = {}
+    for subscriber in subscribers:
+        for receiveTime, tick in subscriber.arrivals:
+            firstSeen[tick] = min(receiveTime, firstSeen.get(tick, receiveTime))
+
+    if not firstSeen:
+        print(f"{loss:>6.1%}  no snapshots arrived")
+        return
+    start = max(subscriber.arrivals[0][0] for subscriber in subscribers if subscriber.arrivals) # From when both have something to draw
+    end = min(subscriber.arrivals[-1][0] for subscriber in subscribers if subscriber.arrivals)
+
+    for subscriber in subscribers:
+        ticks = [tick for receiveTime, tick in subscriber.arrivals]
+        missing = ticks[-1] - ticks[0] + 1 - len(ticks) if ticks else 0
+        ages = frameAges(subscriber.arrivals, firstSeen, start, end, tickRate)
+
+        print(f"{loss:>6.1%} {subscriber.transport:>9} {len(ticks) / duration:>7.1f} {missing:>8} {subscriber.stale:>6} "
+              + " ".join(f"{percentile(ages, fraction) * 1000:>8.1f}" for fraction in (0.5, 0.9, 0.99))
+              + f" {ages[-1] * 1000 if ages else float('nan'):>8.1f}")
+
+async def runTests(args):
+
+    # Starts the link, then compares the transports at every loss rate
+
+    link = ImpairedLink((args.host, args.port), args.latency / 1000, args.jitter / 1000, args.tick_rate, args.seed)
+    await link.start(args.host, args.link_port)
+
+    address = (args.host, args.link_port)
+
+    print(f"{args.latency}ms latency each way, up to {args.jitter}ms jitter, TCP resends lost packets after {link.retransmitDelay * 1000:.0f}ms")
+    print(f"{'Loss':>6} {'Transport':>9} {'Snaps/s':>7} {'Missing':>8} {'Stale':>6} {'Age p50':>8} {'p90':>8} {'p99':>8} {'Max (ms)':>8}")
+
+    try:
+        for loss in args.loss:
+            subscribers = await compareTransports(link, address, loss, args.duration)
+            report(loss, subscribers, args.duration, args.tick_rate)
+    finally:
+        link.close()
+
+
+'''MAIN'''
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Compares how stale snapshots get over TCP and UDP through a simulated lossy, slow link to a local server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555, help="the server's port")
+    parser.add_argument("--link-port", type=int, default=5556, help="port the simulated link listens on")
+    parser.add_argument("--loss", type=float, nargs="+", default=[0, 0.01, 0.05], help="chances of each packet being lost, one run each")
+    parser.add_argument("--latency", type=float, default=50, help="one way delay in milliseconds")
+    parser.add_argument("--jitter", type=float, default=5, help="most random extra delay in milliseconds")
+    parser.add_argument("--duration", type=float, default=10, help="seconds each loss rate runs for")
+    parser.add_argument("--tick-rate", type=float, default=60, help="the server's tick rate")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"Comparing TCP and UDP snapshots from {args.host}:{args.port} through a link on port {args.link_port}")
+
+    asyncio.run(runTests(args))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())